@@ -0,0 +1,9 @@
+from roses import images
+from .models import Profile
+
+
+# profile photos are shown as avatars; only their square crops are made,
+# the upload is kept as it is, transparency included
+images.register(
+    Profile, "photo", widths=(), squares=images.AVATAR_SIZES, derivatives_only=True
+)
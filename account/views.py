@@ -13,17 +13,27 @@ from actions.utils import create_action
 from actions.models import Action
 from .models import Profile, Terms, Contact
 from .forms import LoginForm, UserEditForm, ProfileEditForm, UserRegistrationForm
-from roses.models import Rose, RosePhoto
+from django.db.models import F, Sum
+from roses.models import Rose, RosePhoto, RoseYoutubeVideo, SimilarRose
+from roses.images import attach_manifests
+from roses.pagination import paginate
 from library.models import Article
 
 
+# keyset ordering of the user pages, the last field is unique
+LATEST_FIRST = ("-created", "-id")
+BY_USERNAME = ("username", "id")
+BY_NAME = ("translated_name", "id")
 
-# Log out user
-@login_required
-def dashboard(request):
-    user = request.user
-    language = request.LANGUAGE_CODE
-    
+# objects per page of the user's roses, photos, videos and articles
+USER_ITEMS_PER_PAGE = 20
+
+# recommendations shown with the liked roses
+RECOMMENDED_ROSES = 6
+
+
+def get_user_actions(user):
+    """Latest actions of the users followed by user, or of everyone else"""
     # Display all actions by default
     actions = Action.objects.exclude(user=user)
 
@@ -34,7 +44,23 @@ def dashboard(request):
 
     actions = actions.select_related("user", "user__profile").prefetch_related(
         "target"
-    )[:10]
+    )
+    actions = list(actions[:10])
+    # avatars and target thumbnails read their responsive copies
+    attach_manifests(
+        [getattr(action.user, "profile", None) for action in actions]
+        + [action.target for action in actions]
+    )
+    return actions
+
+
+# Log out user
+@login_required
+def dashboard(request):
+    user = request.user
+    language = request.LANGUAGE_CODE
+    
+    actions = get_user_actions(user)
 
     # obtain total number of added Rose descriptions, Pictures added
     rose_added = Rose.objects.filter(post_author=user).count()
@@ -143,3 +169,101 @@ def edit(request):
     context = {"user_form": user_form, "profile_form": profile_form}
     return render(request, "account/edit.html", context)
 
+
+
+# List of all users
+@login_required
+def user_list(request):
+    users = paginate(request, User.objects.filter(is_active=True), 12, BY_USERNAME)
+    context = {
+        "section": "people",
+        "users": users,
+        "actions": get_user_actions(request.user),
+    }
+    return render(request, "account/user/list.html", context)
+
+
+# Roses liked by the user
+@login_required
+def liked_roses(request):
+    language = request.LANGUAGE_CODE
+    liked = (
+        request.user.roses_liked.as_cards(language)
+        .filter(translations__language_code=language)
+        .annotate(translated_name=F("translations__name"))
+    )
+    roses = paginate(request, liked, USER_ITEMS_PER_PAGE, BY_NAME)
+    # roses often liked together with the user's favourites
+    recommended = (
+        Rose.objects.as_cards(request.LANGUAGE_CODE)
+        .filter(
+            publish=True,
+            similar_to__kind=SimilarRose.CO_LIKES,
+            similar_to__rose__users_like=request.user,
+        )
+        .exclude(users_like=request.user)
+        .annotate(relevance=Sum("similar_to__score"))
+        .order_by("-relevance", "-id")[:RECOMMENDED_ROSES]
+    )
+    context = {
+        "section": "roses_liked",
+        "page": request.GET.get("page"),
+        "roses": roses,
+        "recommended_roses": recommended,
+        "actions": get_user_actions(request.user),
+    }
+    return render(request, "account/user/roses_liked.html", context)
+
+
+# Rose pictures posted by the user
+@login_required
+def user_rose_pictures(request):
+    photos = paginate(
+        request,
+        RosePhoto.objects.filter(picture_author=request.user),
+        USER_ITEMS_PER_PAGE,
+        LATEST_FIRST,
+    )
+    context = {
+        "section": "photos",
+        "page": request.GET.get("page"),
+        "photos": photos,
+        "actions": get_user_actions(request.user),
+    }
+    return render(request, "account/user/photos_posted.html", context)
+
+
+# Videos added by the user
+@login_required
+def user_videos(request):
+    videos = paginate(
+        request,
+        RoseYoutubeVideo.objects.filter(video_author=request.user),
+        USER_ITEMS_PER_PAGE,
+        LATEST_FIRST,
+    )
+    context = {
+        "section": "videos",
+        "page": request.GET.get("page"),
+        "videos": videos,
+        "actions": get_user_actions(request.user),
+    }
+    return render(request, "account/user/user_videos.html", context)
+
+
+# Articles written by the user
+@login_required
+def user_articles(request):
+    articles = paginate(
+        request,
+        Article.objects.filter(author=request.user),
+        USER_ITEMS_PER_PAGE,
+        LATEST_FIRST,
+    )
+    context = {
+        "section": "articles",
+        "page": request.GET.get("page"),
+        "articles": articles,
+        "actions": get_user_actions(request.user),
+    }
+    return render(request, "account/user/articles_posted.html", context)
@@ -76,6 +76,15 @@ class Article(TranslatableModel):
     publish = models.BooleanField(default=False)
     created = models.DateTimeField(default=timezone.now)
     updated = models.DateTimeField(auto_now=True)
+    # kept by the ArticlePhotos signal handlers, see Article.refresh_main_photo()
+    main_photo = models.ForeignKey(
+        "ArticlePhotos",
+        models.SET_NULL,
+        blank=True,
+        null=True,
+        editable=False,
+        related_name="+",
+    )
 
     def __str__(self):
         return self.title
@@ -96,9 +105,17 @@ class Article(TranslatableModel):
         return reverse("library:article-page", args=[self.slug])
 
     def get_main_photo(self):
-        main_pic = ArticlePhotos.objects.filter(
-            article=self.id, section_number=0
-        ).first()
-        return main_pic if main_pic else None
+        return self.main_photo
+
+    @classmethod
+    def refresh_main_photo(cls, article_id):
+        """Point main_photo of an article at its first section 0 photo"""
+        main_photo = (
+            ArticlePhotos.objects.filter(article=article_id, section_number=0)
+            .order_by("id")
+            .values_list("id", flat=True)
+            .first()
+        )
+        cls.objects.filter(id=article_id).update(main_photo=main_photo)
     
     
\ No newline at end of file
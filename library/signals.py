@@ -0,0 +1,41 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from roses import images
+from roses.pagination import clear_cached_counts
+from .models import Article, ArticlePhotos
+
+
+# the library list caches its total, which changes when articles are
+# published, unpublished or deleted
+@receiver(post_save, sender=Article)
+def article_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "publish" in update_fields:
+        clear_cached_counts("articles")
+
+
+@receiver(post_delete, sender=Article)
+def article_deleted(sender, instance, **kwargs):
+    clear_cached_counts("articles")
+
+
+# keep Article.main_photo pointing at the first section 0 photo
+@receiver(post_save, sender=ArticlePhotos)
+def article_photo_saved(sender, instance, **kwargs):
+    Article.refresh_main_photo(instance.article_id)
+    # the photo may have been moved away from another article
+    for article_id in Article.objects.filter(main_photo=instance).exclude(
+        id=instance.article_id
+    ).values_list("id", flat=True):
+        Article.refresh_main_photo(article_id)
+
+
+@receiver(post_delete, sender=ArticlePhotos)
+def article_photo_deleted(sender, instance, **kwargs):
+    Article.refresh_main_photo(instance.article_id)
+
+
+# uploads are resized by the image workers, the main photo of an article
+# (section 0) isn't watermarked
+images.register(
+    ArticlePhotos, "photo", watermark=lambda photo: photo.section_number != 0
+)
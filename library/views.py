@@ -3,28 +3,24 @@ from django.http import HttpResponse, HttpResponseRedirect
 from django.urls import reverse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.utils.translation import gettext_lazy as _
 from .models import ArticleCategory, Article, ArticlePhotos, Issue
 from .forms import ContactForm
+from roses.pagination import count_cache_key, paginate
 
 
 def library(request):
     language = request.LANGUAGE_CODE
     article_object = (
-        Article.objects.language(language).filter(publish=True).order_by("-created")
+        Article.objects.language(language)
+        .filter(publish=True)
+        .select_related("main_photo")
     )
 
-    paginator = Paginator(article_object, 10)
+    # ?cursor= switches to keyset pages, which stay fast however deep they go
     page = request.GET.get("page")
-    try:
-        articles = paginator.page(page)
-    except PageNotAnInteger:
-        # If page is not an integer deliver only the first page
-        articles = paginator.page(1)
-    except EmptyPage:
-        # if page is out of reange deliver the last page
-        articles = paginator.page(paginator.num_pages)
+    count_key = count_cache_key("articles", language)
+    articles = paginate(request, article_object, 10, ("-created", "-id"), count_key)
 
     context = {"articles": articles, "page": page}
     return render(request, "library/library.html", context)
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class RosesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'roses'
+
+    def ready(self):
+        # import signal handlers
+        import roses.signals
+        from .search import install
+
+        # full-text index tables are backend specific and live outside models
+        post_migrate.connect(install, sender=self)
@@ -0,0 +1,221 @@
+"""
+In-memory prefix trie behind the rose name autocomplete endpoint.
+
+One trie per language holds every Rose translation name and every
+RoseAlternativeName of published roses. Each node keeps the best suggestions
+of its subtree ranked by total_user_likes, so answering a prefix only walks
+the typed characters and never touches the database. The trie is loaded once
+per process and then kept current by the signal handlers in roses.signals;
+changes saved by other processes are noticed through roses.sync and reload
+it, as does its age, so the likes ranking follows too.
+"""
+import heapq
+import threading
+from itertools import chain
+from django.conf import settings
+from .models import Rose, RoseAlternativeName
+from .sync import CatalogueWatch
+
+
+# number of suggestions kept in every trie node
+SUGGESTIONS_LIMIT = 10
+
+# seconds after which the tries are rebuilt anyway
+RELOAD_SECONDS = 600
+
+
+def completion_keys(name):
+    """Keys a name is found by: the name itself and the rest of it from each word"""
+    words = name.casefold().split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+class TrieNode:
+    __slots__ = ("children", "entries", "top")
+
+    def __init__(self):
+        self.children = {}
+        # suggestions whose key ends at this node
+        self.entries = set()
+        # best suggestions of the whole subtree, sorted
+        self.top = []
+
+
+class NameTrie:
+    """
+    Prefix trie of suggestions. A suggestion is a tuple
+    (-likes, name, rose_id, slug), so sorting the tuples ranks the most liked
+    roses first and ties alphabetically.
+    """
+
+    def __init__(self, limit=SUGGESTIONS_LIMIT):
+        self.root = TrieNode()
+        self.limit = limit
+
+    def insert(self, key, suggestion):
+        node = self.root
+        path = [node]
+        for char in key:
+            node = node.children.setdefault(char, TrieNode())
+            path.append(node)
+        node.entries.add(suggestion)
+        for node in path:
+            if suggestion in node.top:
+                continue
+            if len(node.top) < self.limit or suggestion < node.top[-1]:
+                node.top.append(suggestion)
+                node.top.sort()
+                del node.top[self.limit :]
+
+    def remove(self, key, suggestion):
+        node = self.root
+        path = [(None, node)]
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return
+            path.append((char, node))
+        node.entries.discard(suggestion)
+        # rebuild the rankings bottom-up and drop nodes left empty
+        for depth in range(len(path) - 1, -1, -1):
+            char, node = path[depth]
+            if suggestion in node.top:
+                candidates = set(
+                    chain(node.entries, *(child.top for child in node.children.values()))
+                )
+                node.top = heapq.nsmallest(self.limit, candidates)
+            if depth and not node.entries and not node.children:
+                del path[depth - 1][1].children[char]
+
+    def complete(self, prefix):
+        node = self.root
+        for char in prefix.casefold():
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.top
+
+
+class RoseAutocomplete:
+    """
+    Per-language tries of rose names.
+
+    The tries are built from the database on the first lookup of a process;
+    afterwards they are changed by update_rose() and remove_rose(), and
+    rebuilt once the catalogue changed elsewhere or RELOAD_SECONDS passed.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._watch = CatalogueWatch(max_age=RELOAD_SECONDS)
+        self._tries = None
+        # rose_id -> [(language_code, key, suggestion), ...]
+        self._keys = {}
+
+    def _name_rows(self, rose_ids=None):
+        """(rose_id, language_code, name, slug, likes) of published roses"""
+        rose_names = Rose._parler_meta.root_model.objects.filter(
+            master__publish=True
+        ).values_list(
+            "master_id",
+            "language_code",
+            "name",
+            "master__slug",
+            "master__total_user_likes",
+        )
+        alternative_names = RoseAlternativeName._parler_meta.root_model.objects.filter(
+            master__rose_code__publish=True
+        ).values_list(
+            "master__rose_code_id",
+            "language_code",
+            "name",
+            "master__rose_code__slug",
+            "master__rose_code__total_user_likes",
+        )
+        if rose_ids is not None:
+            rose_names = rose_names.filter(master_id__in=rose_ids)
+            alternative_names = alternative_names.filter(
+                master__rose_code_id__in=rose_ids
+            )
+        return chain(rose_names.iterator(), alternative_names.iterator())
+
+    def _add(self, rose_id, language_code, name, slug, likes):
+        trie = self._tries.setdefault(language_code, NameTrie())
+        suggestion = (-likes, name, rose_id, slug)
+        for key in completion_keys(name):
+            trie.insert(key, suggestion)
+            self._keys.setdefault(rose_id, []).append((language_code, key, suggestion))
+
+    def _discard(self, rose_id):
+        for language_code, key, suggestion in self._keys.pop(rose_id, []):
+            self._tries[language_code].remove(key, suggestion)
+
+    def load(self):
+        with self._lock:
+            self._watch.loading()
+            self._tries = {}
+            self._keys = {}
+            for row in self._name_rows():
+                self._add(*row)
+
+    def update_rose(self, rose_id):
+        """Replace the names of one rose, e.g. after it was renamed or liked"""
+        self.update_roses([rose_id])
+
+    def update_roses(self, rose_ids):
+        """Replace the names of several roses with one query, e.g. after an import"""
+        with self._lock:
+            if self._tries is None:
+                # nothing loaded yet, the first lookup will read fresh data
+                return
+            rows = list(self._name_rows(rose_ids))
+            for rose_id in rose_ids:
+                self._discard(rose_id)
+            for row in rows:
+                self._add(*row)
+
+    def remove_rose(self, rose_id):
+        with self._lock:
+            if self._tries is not None:
+                self._discard(rose_id)
+
+    def complete(self, prefix, language, limit=SUGGESTIONS_LIMIT):
+        """
+        Suggest rose names starting with a prefix.
+
+        Args:
+            prefix (str): The characters typed so far.
+            language (str): Language code; names of the parler fallback
+                language are suggested too.
+            limit (int): Maximum number of suggestions.
+
+        Returns:
+            list: Dictionaries with the name, slug, rose id and likes.
+        """
+        prefix = " ".join(prefix.split())
+        if not prefix:
+            return []
+        languages = [language, settings.PARLER_LANGUAGES["default"]["fallback"]]
+        with self._lock:
+            if self._tries is None or self._watch.outdated():
+                self.load()
+            found = [
+                list(self._tries[code].complete(prefix))
+                for code in dict.fromkeys(languages)
+                if code in self._tries
+            ]
+        suggestions = []
+        seen = set()
+        for rank, name, rose_id, slug in heapq.merge(*found):
+            if (rose_id, name) in seen:
+                continue
+            seen.add((rose_id, name))
+            suggestions.append(
+                {"id": rose_id, "name": name, "slug": slug, "likes": -rank}
+            )
+            if len(suggestions) == limit:
+                break
+        return suggestions
+
+
+rose_autocomplete = RoseAutocomplete()
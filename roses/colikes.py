@@ -0,0 +1,133 @@
+"""
+"Users who liked this also liked" recommendations.
+
+The Rose.users_like through table is a sparse user x rose matrix. For every
+user the pairs of roses they liked are generated with NumPy, encoded as
+single integers and counted with np.unique, which gives the sparse
+co-occurrence counts without ever building the dense rose x rose matrix.
+Counts are turned into cosine similarities, count(a, b) / sqrt(likes(a) *
+likes(b)), and the best NEIGHBOURS roses of every rose are stored in
+SimilarRose rows of kind CO_LIKES by the build_co_liked_roses command.
+"""
+import numpy as np
+from django.db import transaction
+from .models import Rose, SimilarRose
+
+
+# co-liked roses stored per rose
+NEIGHBOURS = 8
+
+# pairs liked together by fewer users are noise
+MIN_CO_LIKES = 2
+
+# likes of a single user taken into account, bounds the pairs per user
+MAX_USER_LIKES = 200
+
+# users whose pairs are generated at once
+USER_BATCH = 5000
+
+
+def like_matrix():
+    """
+    Likes of published roses as index arrays.
+
+    Returns:
+        tuple: (rose_ids, users, items) where users and items are parallel
+        arrays of user ids and rose positions in rose_ids, sorted by user.
+    """
+    likes = np.array(
+        list(
+            Rose.users_like.through.objects.filter(rose__publish=True)
+            .order_by("user_id", "rose_id")
+            .values_list("user_id", "rose_id")
+            .iterator(chunk_size=10000)
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    rose_ids, items = np.unique(likes[:, 1], return_inverse=True)
+    return rose_ids, likes[:, 0], items.astype(np.int64)
+
+
+def co_occurrences(users, items, item_count):
+    """
+    Count how many users liked each pair of roses.
+
+    Returns:
+        tuple: (pairs, counts), pairs encoded as first * item_count + second
+        for every ordered pair of different roses.
+    """
+    boundaries = np.flatnonzero(np.diff(users)) + 1
+    groups = np.split(items, boundaries)
+    batch_pairs = []
+    batch_counts = []
+    for start in range(0, len(groups), USER_BATCH):
+        batch = []
+        for group in groups[start : start + USER_BATCH]:
+            group = group[:MAX_USER_LIKES]
+            if len(group) < 2:
+                continue
+            first, second = np.meshgrid(group, group, indexing="ij")
+            keep = first != second
+            batch.append(first[keep] * item_count + second[keep])
+        if batch:
+            pairs, counts = np.unique(np.concatenate(batch), return_counts=True)
+            batch_pairs.append(pairs)
+            batch_counts.append(counts)
+    if not batch_pairs:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    # merge the counts of the batches
+    pairs, inverse = np.unique(np.concatenate(batch_pairs), return_inverse=True)
+    counts = np.zeros(len(pairs), dtype=np.int64)
+    np.add.at(counts, inverse, np.concatenate(batch_counts))
+    return pairs, counts
+
+
+def top_neighbours(pairs, counts, item_likes, k=NEIGHBOURS, min_co_likes=MIN_CO_LIKES):
+    """
+    Best co-liked roses of every rose.
+
+    Returns:
+        list: (first, second, rank, score) tuples of rose positions.
+    """
+    keep = counts >= min_co_likes
+    pairs, counts = pairs[keep], counts[keep]
+    item_count = len(item_likes)
+    first, second = pairs // item_count, pairs % item_count
+    scores = counts / np.sqrt(item_likes[first] * item_likes[second])
+    # group by the first rose, best scores first
+    order = np.lexsort((second, -scores, first))
+    first, second, scores = first[order], second[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, np.diff(first) != 0])
+    ranks = np.arange(len(first)) - np.repeat(starts, np.diff(np.r_[starts, len(first)]))
+    top = ranks < k
+    return list(
+        zip(
+            first[top].tolist(),
+            second[top].tolist(),
+            ranks[top].tolist(),
+            scores[top].tolist(),
+        )
+    )
+
+
+def rebuild_co_liked_roses(min_co_likes=MIN_CO_LIKES):
+    """Recompute the co-liked roses of every rose, returns the number of rows"""
+    rose_ids, users, items = like_matrix()
+    pairs, counts = co_occurrences(users, items, len(rose_ids))
+    item_likes = np.bincount(items, minlength=len(rose_ids))
+    neighbours = top_neighbours(pairs, counts, item_likes, min_co_likes=min_co_likes)
+    rows = (
+        SimilarRose(
+            kind=SimilarRose.CO_LIKES,
+            rose_id=int(rose_ids[first]),
+            similar_id=int(rose_ids[second]),
+            rank=rank,
+            score=score,
+        )
+        for first, second, rank, score in neighbours
+    )
+    with transaction.atomic():
+        SimilarRose.objects.filter(kind=SimilarRose.CO_LIKES).delete()
+        SimilarRose.objects.bulk_create(rows, batch_size=1000)
+    return len(neighbours)
@@ -0,0 +1,122 @@
+"""
+Write-behind counters.
+
+Page views are counted in process and written to the database in batches,
+so reading a rose page doesn't turn into a row write. Increments are
+flushed by a timer thread some seconds after the first one arrives, and
+once more when the worker exits. A failed flush puts the increments back
+to be retried, so every view is written at least once.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F
+from .models import Rose
+
+
+logger = logging.getLogger(__name__)
+
+# seconds between the first buffered increment and the flush
+FLUSH_INTERVAL = 10
+
+
+class ViewCounter:
+    """
+    Buffer increments of an integer field and flush them in batched UPDATEs.
+
+    Args:
+        model (Model): Model holding the counter.
+        field (str): Name of the counter field.
+        interval (int): Seconds to buffer increments for; defaults to
+            settings.VIEW_COUNTER_FLUSH_INTERVAL. 0 writes every increment
+            straight away.
+    """
+
+    def __init__(self, model, field, interval=None):
+        self.model = model
+        self.field = field
+        self.interval = interval
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def get_interval(self):
+        if self.interval is not None:
+            return self.interval
+        return getattr(settings, "VIEW_COUNTER_FLUSH_INTERVAL", FLUSH_INTERVAL)
+
+    def increment(self, object_id, amount=1):
+        interval = self.get_interval()
+        with self._lock:
+            self._pending[object_id] += amount
+            if interval and self._timer is None:
+                self._timer = threading.Timer(interval, self._flush_in_thread)
+                self._timer.daemon = True
+                self._timer.start()
+        if not interval:
+            self.flush()
+
+    def pending(self, object_id):
+        """Increments of an object not written yet"""
+        with self._lock:
+            return self._pending[object_id]
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        except DatabaseError:
+            logger.exception("Flushing %s.%s failed", self.model.__name__, self.field)
+        finally:
+            # the timer thread owns its database connections
+            connections.close_all()
+
+    def flush(self):
+        """
+        Write the buffered increments.
+
+        Objects with the same increment share one UPDATE statement, several
+        statements are written in one transaction.
+
+        Returns:
+            int: Number of objects updated.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        by_amount = defaultdict(list)
+        for object_id, amount in pending.items():
+            by_amount[amount].append(object_id)
+        # a single UPDATE is atomic on its own
+        atomic = transaction.atomic() if len(by_amount) > 1 else nullcontext()
+        try:
+            with atomic:
+                for amount, object_ids in by_amount.items():
+                    self.model.objects.filter(id__in=object_ids).update(
+                        **{self.field: F(self.field) + amount}
+                    )
+        except DatabaseError:
+            # keep the increments for the next flush
+            with self._lock:
+                self._pending.update(pending)
+            raise
+        return len(pending)
+
+    def stop(self):
+        """Cancel the timer without flushing"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+rose_views = ViewCounter(Rose, "post_views")
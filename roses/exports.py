@@ -0,0 +1,152 @@
+"""
+Streaming exports of the catalogue.
+
+Every export reads the translations of one language joined with their
+master rows through QuerySet.iterator(), which uses a server-side cursor
+on PostgreSQL, and yields the file line by line. Tags are read as a second
+stream in the same id order and merged in, so memory use doesn't grow
+with the size of the catalogue. The lines are served by
+StreamingHttpResponse or written to a file by the export_catalogue command.
+"""
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.contrib.contenttypes.models import ContentType
+from taggit.models import TaggedItem
+from library.models import Article
+from .models import Rose, RoseAlternativeName
+
+
+# rows fetched per round trip
+CHUNK_SIZE = 2000
+
+NDJSON = "ndjson"
+CSV = "csv"
+FORMATS = {NDJSON: "application/x-ndjson", CSV: "text/csv"}
+
+
+class Export:
+    """
+    Rows of a translated model in one language.
+
+    Attributes:
+        model (TranslatableModel): The exported model.
+        exclude (tuple): Master fields left out of the export.
+        tags (bool): Add a "tags" column.
+    """
+
+    def __init__(self, model, exclude=(), tags=False):
+        self.model = model
+        self.translation_model = model._parler_meta.root_model
+        self.master_fields = [
+            field.attname
+            for field in model._meta.concrete_fields
+            if field.name not in exclude
+        ]
+        self.translated_fields = list(model._parler_meta.get_all_fields())
+        self.tags = tags
+
+    @property
+    def columns(self):
+        columns = [*self.master_fields, *self.translated_fields]
+        if self.tags:
+            columns.append("tags")
+        return columns
+
+    def rows(self, language, chunk_size=CHUNK_SIZE):
+        """
+        Yield the exported objects as dicts, ordered by id.
+
+        Args:
+            language (str): Language code of the translated fields. Objects
+                without a translation in it are left out.
+            chunk_size (int): Rows fetched per round trip.
+        """
+        translations = (
+            self.translation_model.objects.filter(language_code=language)
+            .values(
+                *[f"master__{name}" for name in self.master_fields],
+                *self.translated_fields,
+            )
+            .order_by("master_id")
+        )
+        rows = (
+            {
+                **{name: row[f"master__{name}"] for name in self.master_fields},
+                **{name: row[name] for name in self.translated_fields},
+            }
+            for row in translations.iterator(chunk_size=chunk_size)
+        )
+        if self.tags:
+            rows = self.with_tags(rows, chunk_size)
+        return rows
+
+    def with_tags(self, rows, chunk_size):
+        """Merge the tag names into rows ordered by id"""
+        tagged = (
+            TaggedItem.objects.filter(
+                content_type=ContentType.objects.get_for_model(self.model)
+            )
+            .values_list("object_id", "tag__name")
+            .order_by("object_id", "tag__name")
+            .iterator(chunk_size=chunk_size)
+        )
+        pending = next(tagged, None)
+        for row in rows:
+            # skip the tags of objects without a translation in the language
+            while pending is not None and pending[0] < row["id"]:
+                pending = next(tagged, None)
+            row["tags"] = []
+            while pending is not None and pending[0] == row["id"]:
+                row["tags"].append(pending[1])
+                pending = next(tagged, None)
+            yield row
+
+
+EXPORTS = {
+    "roses": Export(Rose, exclude=("main_photo",), tags=True),
+    "alternative-names": Export(RoseAlternativeName),
+    "articles": Export(Article, exclude=("main_photo",), tags=True),
+}
+
+
+class Echo:
+    """File-like object whose write() returns the line, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(export, rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def csv_lines(export, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(export.columns)
+    for row in rows:
+        if export.tags:
+            row["tags"] = ", ".join(row["tags"])
+        yield writer.writerow([row[column] for column in export.columns])
+
+
+def export_lines(name, language, file_format=NDJSON, chunk_size=CHUNK_SIZE):
+    """
+    Lines of an export file.
+
+    Args:
+        name (str): Key of EXPORTS, e.g. "roses".
+        language (str): Language code of the translated fields.
+        file_format (str): NDJSON or CSV.
+        chunk_size (int): Rows fetched per round trip.
+
+    Returns:
+        generator: Lines ending with a newline.
+
+    Raises:
+        KeyError: Unknown export or format.
+    """
+    export = EXPORTS[name]
+    write = {NDJSON: ndjson_lines, CSV: csv_lines}[file_format]
+    return write(export, export.rows(language, chunk_size))
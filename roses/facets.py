@@ -0,0 +1,182 @@
+"""
+In-memory columnar filter engine for the rose catalogue.
+
+The filterable ratings and landscape booleans of every published rose are
+kept in compact NumPy arrays, one array per attribute. A combination of
+filters is answered with a few vectorized comparisons, and the facet counts
+for every attribute come out of the same masks, so the catalogue page can
+show live counts without one COUNT query per facet. The arrays are loaded
+once per process and updated row by row from the Rose signals; changes
+saved by other processes are noticed through roses.sync and reload them.
+"""
+import threading
+import numpy as np
+from .models import Rose, RATING_FIELDS, LANDSCAPE_FIELDS
+from .sync import CatalogueWatch
+
+
+FACET_FIELDS = RATING_FIELDS + LANDSCAPE_FIELDS
+
+# seconds after which the arrays are reloaded anyway
+RELOAD_SECONDS = 600
+
+TRUE_VALUES = ("1", "true", "on", "yes")
+
+
+def parse_filters(query_dict):
+    """
+    Read filters from request.GET.
+
+    Ratings may be given several times (?aroma_strength=4&aroma_strength=5)
+    and match any of the values; landscape fields only filter when true.
+
+    Returns:
+        dict: field name -> list of accepted values.
+    """
+    filters = {}
+    for field in RATING_FIELDS:
+        values = [value for value in query_dict.getlist(field) if value.isdigit()]
+        if values:
+            filters[field] = [int(value) for value in values]
+    for field in LANDSCAPE_FIELDS:
+        if query_dict.get(field, "").lower() in TRUE_VALUES:
+            filters[field] = [True]
+    return filters
+
+
+class RoseFacetIndex:
+    """
+    Column arrays of the facet attributes.
+
+    Row positions never move: a deleted or unpublished rose is only switched
+    off in the live mask, and new roses are appended to the arrays, which
+    grow by doubling. The arrays are reloaded once the catalogue changed
+    elsewhere or RELOAD_SECONDS passed.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._watch = CatalogueWatch(max_age=RELOAD_SECONDS)
+        self._size = None
+        self._positions = {}
+
+    def _allocate(self, capacity):
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._created = np.zeros(capacity, dtype=np.int64)
+        self._live = np.zeros(capacity, dtype=bool)
+        self._columns = {field: np.zeros(capacity, dtype=np.int16) for field in RATING_FIELDS}
+        self._columns.update(
+            {field: np.zeros(capacity, dtype=bool) for field in LANDSCAPE_FIELDS}
+        )
+
+    def _grow(self):
+        capacity = max(len(self._ids) * 2, 64)
+        arrays = [self._ids, self._created, self._live, *self._columns.values()]
+        resized = []
+        for array in arrays:
+            new_array = np.zeros(capacity, dtype=array.dtype)
+            new_array[: len(array)] = array
+            resized.append(new_array)
+        self._ids, self._created, self._live, *columns = resized
+        self._columns = dict(zip(self._columns, columns))
+
+    def _set_row(self, position, rose_id, created, publish, values):
+        self._ids[position] = rose_id
+        self._created[position] = int(created.timestamp())
+        self._live[position] = publish
+        for field, value in zip(FACET_FIELDS, values):
+            self._columns[field][position] = value or 0
+
+    def load(self):
+        self._watch.loading()
+        rows = list(
+            Rose.objects.values_list("id", "created", "publish", *FACET_FIELDS)
+        )
+        with self._lock:
+            self._allocate(max(len(rows) * 2, 64))
+            self._positions = {}
+            for position, (rose_id, created, publish, *values) in enumerate(rows):
+                self._set_row(position, rose_id, created, publish, values)
+                self._positions[rose_id] = position
+            self._size = len(rows)
+
+    def update_rose(self, rose):
+        """Copy the facet attributes of a saved Rose into its row"""
+        with self._lock:
+            if self._size is None:
+                return
+            position = self._positions.get(rose.id)
+            if position is None:
+                if self._size == len(self._ids):
+                    self._grow()
+                position = self._size
+                self._positions[rose.id] = position
+                self._size += 1
+            values = [getattr(rose, field) for field in FACET_FIELDS]
+            self._set_row(position, rose.id, rose.created, rose.publish, values)
+
+    def remove_rose(self, rose_id):
+        with self._lock:
+            if self._size is None:
+                return
+            position = self._positions.get(rose_id)
+            if position is not None:
+                self._live[position] = False
+
+    def _mask(self, field, values, size):
+        column = self._columns[field][:size]
+        if len(values) == 1:
+            return column == values[0]
+        return np.isin(column, values)
+
+    def query(self, filters):
+        """
+        Apply filters and count facet values.
+
+        Args:
+            filters (dict): field name -> list of accepted values, as returned
+                by parse_filters().
+
+        Returns:
+            tuple: (ids, counts) where ids is a NumPy array of the matching
+            rose ids, newest first, and counts maps every rating field to
+            {value: count} and every landscape field to the number of roses
+            suitable for it. The counts of a filtered field ignore its own
+            filter, so they show what selecting another value would give.
+        """
+        with self._lock:
+            if self._size is None or self._watch.outdated():
+                self.load()
+            size = self._size
+            live = self._live[:size]
+            masks = {
+                field: self._mask(field, values, size)
+                for field, values in filters.items()
+            }
+            matched = live.copy()
+            for mask in masks.values():
+                matched &= mask
+
+            counts = {}
+            for field in FACET_FIELDS:
+                if field in masks:
+                    # every filter except the field's own
+                    selection = live.copy()
+                    for other, mask in masks.items():
+                        if other != field:
+                            selection &= mask
+                else:
+                    selection = matched
+                column = self._columns[field][:size][selection]
+                if field in LANDSCAPE_FIELDS:
+                    counts[field] = int(np.count_nonzero(column))
+                else:
+                    values, value_counts = np.unique(column, return_counts=True)
+                    counts[field] = dict(zip(values.tolist(), value_counts.tolist()))
+
+            order = np.argsort(-self._created[:size][matched], kind="stable")
+            ids = self._ids[:size][matched][order]
+        return ids, counts
+
+
+rose_facets = RoseFacetIndex()
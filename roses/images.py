@@ -0,0 +1,605 @@
+"""
+Asynchronous processing of uploaded photos.
+
+Photo models register the image field to process. Saving a photo with a
+new upload queues a PhotoProcessing job, so the upload request only stores
+the raw file. The process_photos command claims the queued jobs and hands
+them to a pool of worker processes, which decode, rotate, resize,
+watermark and re-encode the image away from the web workers; the
+processed file then replaces the raw one with a conditional UPDATE, so a
+newer upload of the same photo is never overwritten. Models registered
+with derivatives_only keep their stored file and only get the copies.
+
+The same job makes the responsive copies declared below, every width and
+square crop in every format Pillow can write, and records them in the
+job's manifest. Views read the manifests of the photos they show with
+attach_manifests() and templates use them through the responsive_images
+tags, so pages serve phones small WebP/AVIF files and no thumbnail is
+made while rendering.
+
+With settings.IMAGE_PROCESSING_WORKERS = 0 jobs run in the saving process
+once its transaction commits, e.g. in development. The process_pending
+command processes the queued and failed jobs once and exits.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from io import BytesIO
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal
+from django.utils import timezone
+from .models import PhotoProcessing
+from .utils import apply_watermark
+
+try:
+    # writes AVIF with Pillow versions lacking it
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+
+logger = logging.getLogger(__name__)
+
+# processed photos are scaled down to this width
+MAX_WIDTH = 1200
+JPEG_QUALITY = 75
+
+# widths of the responsive copies of photos; the processed file is the
+# widest JPEG
+PHOTO_WIDTHS = (320, 640, 960)
+
+# square crops for avatars and thumbnails, 1x and 2x of the 40px images
+AVATAR_SIZES = (40, 80)
+
+# encodings of the copies, best first; formats Pillow can't write are skipped
+ENCODINGS = {
+    "avif": ("AVIF", {"quality": 50}),
+    "webp": ("WEBP", {"quality": JPEG_QUALITY, "method": 4}),
+    "jpeg": ("JPEG", {"quality": JPEG_QUALITY, "optimize": True, "progressive": True}),
+}
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+EXTENSIONS = {"avif": "avif", "webp": "webp", "jpeg": "jpg"}
+
+# jobs are retried by process_pending this many times
+MAX_ATTEMPTS = 3
+
+# a job processing for longer was lost with its worker
+STALE_MINUTES = 10
+
+# seconds process_photos waits before looking for new jobs again
+POLL_SECONDS = 2
+
+# sent with the photo once its processed file is in place
+photo_processed = Signal()
+
+
+@dataclass(frozen=True)
+class ImageSpec:
+    """
+    How the photos of a model are processed.
+
+    Attributes:
+        field (str): Name of the image field.
+        watermark (callable): Takes a photo, True to watermark it.
+        widths (tuple): Widths of the responsive copies.
+        squares (tuple): Sizes of the square crops.
+        derivatives_only (bool): Keep the stored file as it is and only
+            make the copies, e.g. while save() still resizes uploads.
+    """
+
+    field: str
+    watermark: object = None
+    widths: tuple = PHOTO_WIDTHS
+    squares: tuple = ()
+    derivatives_only: bool = False
+
+    def needs_watermark(self, photo):
+        return bool(self.watermark and self.watermark(photo))
+
+
+_specs = {}
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def available_formats():
+    """Keys of ENCODINGS Pillow can write here"""
+    Image.init()
+    return tuple(
+        name for name, (pil_format, options) in ENCODINGS.items()
+        if pil_format in Image.SAVE
+    )
+
+
+def prepare(data, watermark):
+    """Decode, rotate and scale down an upload, watermarked if asked"""
+    img = Image.open(BytesIO(data))
+    img = ImageOps.exif_transpose(img)
+    img = img.convert("RGB")
+    (w, h) = img.size
+    if w > MAX_WIDTH:
+        scale = w / MAX_WIDTH
+        img = img.resize((int(w // scale), int(h // scale)), Image.Resampling.LANCZOS)
+    if watermark:
+        img = apply_watermark(img)
+    return img
+
+
+def encode(img, image_format):
+    pil_format, options = ENCODINGS[image_format]
+    im_io = BytesIO()
+    img.save(im_io, pil_format, **options)
+    return im_io.getvalue()
+
+
+def process_image(data, watermark):
+    """
+    Turn an uploaded image into the stored JPEG.
+
+    Args:
+        data (bytes): The uploaded file.
+        watermark (bool): Apply the site watermark.
+
+    Returns:
+        bytes: JPEG at most MAX_WIDTH pixels wide.
+    """
+    return encode(prepare(data, watermark), "jpeg")
+
+
+def process_photo(data, watermark, widths, squares, formats, main=True):
+    """
+    Make the stored JPEG of an upload and its copies. Runs in a worker process.
+
+    Args:
+        data (bytes): The uploaded or already processed file.
+        watermark (bool): Apply the site watermark.
+        widths (tuple): Widths of the copies, those not below the width of
+            the processed image are skipped. Without widths no full width
+            copies are made either.
+        squares (tuple): Sizes of the square crops.
+        formats (tuple): Keys of ENCODINGS to write every copy in.
+        main (bool): Encode the processed image itself.
+
+    Returns:
+        tuple: (JPEG bytes or None, width, height, copies) where copies are
+        (kind, size, format, bytes) tuples, kind "src" for the widths and
+        "sq" for the square crops.
+    """
+    img = prepare(data, watermark)
+    copies = []
+    for width in widths:
+        if width < img.width:
+            height = round(img.height * width / img.width)
+            copy = img.resize((width, height), Image.Resampling.LANCZOS)
+            for image_format in formats:
+                copies.append(("src", width, image_format, encode(copy, image_format)))
+    for image_format in formats:
+        # the processed file is the full width JPEG
+        if widths and image_format != "jpeg":
+            copies.append(("src", img.width, image_format, encode(img, image_format)))
+    for size in squares:
+        square = ImageOps.fit(img, (size, size), Image.Resampling.LANCZOS)
+        for image_format in formats:
+            copies.append(("sq", size, image_format, encode(square, image_format)))
+    return (encode(img, "jpeg") if main else None), img.width, img.height, copies
+
+
+def register(
+    model,
+    field,
+    watermark=None,
+    widths=PHOTO_WIDTHS,
+    squares=(),
+    derivatives_only=False,
+):
+    """
+    Process the uploads of a photo model in the background.
+
+    Args:
+        model (Model): The photo model.
+        field (str): Name of its image field.
+        watermark (callable): Takes a photo, True to watermark it.
+        widths (tuple): Widths of the responsive copies.
+        squares (tuple): Sizes of the square crops, e.g. AVATAR_SIZES.
+        derivatives_only (bool): Don't resize, watermark or re-encode the
+            stored file, only make its copies.
+    """
+    _specs[model] = ImageSpec(
+        field, watermark, tuple(widths), tuple(squares), derivatives_only
+    )
+    label = model._meta.label_lower
+    post_save.connect(photo_saved, sender=model, dispatch_uid=f"process_{label}")
+    post_delete.connect(photo_deleted, sender=model, dispatch_uid=f"copies_{label}")
+
+
+def manifest_files(manifest):
+    return [
+        name
+        for kind in ("src", "sq")
+        for copies in manifest.get(kind, {}).values()
+        for size, name in copies
+    ]
+
+
+def delete_copies(storage, manifest):
+    for name in manifest_files(manifest):
+        storage.delete(name)
+
+
+def photo_saved(sender, instance, **kwargs):
+    spec = _specs[sender]
+    field_file = getattr(instance, spec.field)
+    name = field_file.name
+    if not name:
+        return
+    content_type = ContentType.objects.get_for_model(sender)
+    job = PhotoProcessing.objects.filter(
+        content_type=content_type, object_id=instance.pk
+    ).first()
+    if job is not None and name in (job.source, job.result):
+        # saved without a new upload
+        return
+    old_manifest = job.manifest if job is not None else {}
+    job, created = PhotoProcessing.objects.update_or_create(
+        content_type=content_type,
+        object_id=instance.pk,
+        defaults={
+            "status": PhotoProcessing.PENDING,
+            "source": name,
+            "result": "",
+            "attempts": 0,
+            "error": "",
+            "derivatives_only": False,
+            "manifest": {},
+        },
+    )
+
+    def process():
+        delete_copies(field_file.storage, old_manifest)
+        if not get_workers():
+            run(job.id)
+
+    # with workers the job waits for the process_photos command
+    transaction.on_commit(process)
+
+
+def photo_deleted(sender, instance, **kwargs):
+    storage = getattr(instance, _specs[sender].field).storage
+    jobs = PhotoProcessing.objects.filter(
+        content_type=ContentType.objects.get_for_model(sender), object_id=instance.pk
+    )
+    manifests = list(jobs.values_list("manifest", flat=True))
+    jobs.delete()
+    transaction.on_commit(
+        lambda: [delete_copies(storage, manifest) for manifest in manifests]
+    )
+
+
+def queue_derivatives(model):
+    """
+    Queue the copies of photos processed before they were made.
+
+    Returns:
+        int: Number of queued photos.
+    """
+    spec = _specs[model]
+    content_type = ContentType.objects.get_for_model(model)
+    processed = PhotoProcessing.objects.filter(content_type=content_type)
+    photos = (
+        model.objects.exclude(**{spec.field: ""})
+        .exclude(pk__in=processed.values("object_id"))
+        .values_list("pk", spec.field)
+    )
+    jobs = [
+        PhotoProcessing(
+            content_type=content_type,
+            object_id=pk,
+            source=name,
+            derivatives_only=True,
+        )
+        for pk, name in photos.iterator()
+    ]
+    PhotoProcessing.objects.bulk_create(jobs, batch_size=1000, ignore_conflicts=True)
+    return len(jobs)
+
+
+def queue_all_derivatives():
+    return sum(queue_derivatives(model) for model in _specs)
+
+
+def get_workers():
+    return getattr(settings, "IMAGE_PROCESSING_WORKERS", 0)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=get_workers())
+            atexit.register(_executor.shutdown)
+        return _executor
+
+
+def start(job_id):
+    """
+    Claim a job and read its raw file.
+
+    Returns:
+        tuple: (job, photo, spec, data), or None if the job is taken, done
+        or its photo is gone.
+    """
+    claimed = (
+        PhotoProcessing.objects.filter(id=job_id)
+        .exclude(status__in=[PhotoProcessing.PROCESSING, PhotoProcessing.DONE])
+        .update(
+            status=PhotoProcessing.PROCESSING,
+            attempts=F("attempts") + 1,
+            # update() skips auto_now, pending_jobs() judges lost jobs by it
+            updated=timezone.now(),
+        )
+    )
+    if not claimed:
+        return None
+    job = PhotoProcessing.objects.select_related("content_type").get(id=job_id)
+    model = job.content_type.model_class()
+    photo = model.objects.filter(pk=job.object_id).first()
+    spec = _specs.get(model)
+    if photo is None or spec is None:
+        job.delete()
+        return None
+    field_file = getattr(photo, spec.field)
+    if field_file.name != job.source:
+        # replaced by a newer upload with a job of its own
+        return None
+    with field_file.storage.open(job.source, "rb") as file:
+        data = file.read()
+    return job, photo, spec, data
+
+
+def store_copies(storage, root, copies):
+    """Save the copies of a photo, returns their manifest entries"""
+    entries = {"src": {}, "sq": {}}
+    for kind, size, image_format, data in copies:
+        suffix = "w" if kind == "src" else "sq"
+        name = storage.save(
+            f"{root}_{size}{suffix}.{EXTENSIONS[image_format]}", ContentFile(data)
+        )
+        entries[kind].setdefault(image_format, []).append([size, name])
+    return entries
+
+
+def finish(job, photo, spec, processed):
+    """
+    Store the processed file and its copies. The processed file is swapped
+    in only if the raw one is still current.
+    """
+    main, width, height, copies = processed
+    storage = getattr(photo, spec.field).storage
+    if main is None:
+        name = job.source
+    else:
+        name = storage.save(os.path.splitext(job.source)[0] + ".jpg", ContentFile(main))
+        swapped = type(photo).objects.filter(
+            pk=photo.pk, **{spec.field: job.source}
+        ).update(**{spec.field: name})
+        if not swapped:
+            storage.delete(name)
+            return
+        storage.delete(job.source)
+    manifest = {"w": width, "h": height}
+    manifest.update(store_copies(storage, os.path.splitext(name)[0], copies))
+    stored = PhotoProcessing.objects.filter(id=job.id, source=job.source).update(
+        status=PhotoProcessing.DONE,
+        result=name,
+        error="",
+        manifest=manifest,
+        updated=timezone.now(),
+    )
+    if not stored:
+        # a newer upload replaced the photo meanwhile
+        delete_copies(storage, manifest)
+        return
+    setattr(photo, spec.field, name)
+    photo._image_manifest = manifest
+    photo_processed.send(sender=type(photo), instance=photo)
+
+
+def fail(job, error):
+    logger.error("Processing %s failed", job.source, exc_info=error)
+    PhotoProcessing.objects.filter(id=job.id, source=job.source).update(
+        status=PhotoProcessing.FAILED, error=str(error), updated=timezone.now()
+    )
+
+
+def run(job_id):
+    """Process a job in the current process"""
+    started = start(job_id)
+    if started is None:
+        return
+    job, photo, spec, data = started
+    try:
+        finish(job, photo, spec, process_photo(*job_arguments(job, photo, spec, data)))
+    except Exception as error:
+        fail(job, error)
+
+
+def job_arguments(job, photo, spec, data):
+    """Arguments of process_photo() for a job"""
+    derivatives_only = job.derivatives_only or spec.derivatives_only
+    return (
+        data,
+        spec.needs_watermark(photo) and not derivatives_only,
+        spec.widths,
+        spec.squares,
+        available_formats(),
+        not derivatives_only,
+    )
+
+
+def submit(job_id):
+    """
+    Hand a job to the worker pool, or run it here without workers. Only
+    the process_photos and process_pending commands own a pool.
+
+    Returns:
+        Future: Done once the processed file is stored, None if the job
+        was not started.
+    """
+    if not get_workers():
+        run(job_id)
+        return None
+    started = start(job_id)
+    if started is None:
+        return None
+    job, photo, spec, data = started
+    completed = Future()
+
+    def done(future):
+        # runs in a thread of the executor
+        try:
+            error = future.exception()
+            if error is None:
+                finish(job, photo, spec, future.result())
+            else:
+                fail(job, error)
+        except Exception as error:
+            fail(job, error)
+        finally:
+            connections.close_all()
+            completed.set_result(job.id)
+
+    future = get_executor().submit(
+        process_photo, *job_arguments(job, photo, spec, data)
+    )
+    future.add_done_callback(done)
+    return completed
+
+
+def pending_jobs():
+    """Jobs never started, failed jobs with retries left and lost jobs"""
+    stale = timezone.now() - timedelta(minutes=STALE_MINUTES)
+    return PhotoProcessing.objects.filter(
+        Q(status=PhotoProcessing.PENDING)
+        | Q(status=PhotoProcessing.FAILED, attempts__lt=MAX_ATTEMPTS)
+        | Q(status=PhotoProcessing.PROCESSING, updated__lt=stale)
+    ).order_by("id")
+
+
+def process_pending():
+    """Process the pending jobs through the pool and wait for them"""
+    jobs = list(pending_jobs().values_list("id", flat=True))
+    # lost jobs look taken to start()
+    PhotoProcessing.objects.filter(
+        id__in=jobs, status=PhotoProcessing.PROCESSING
+    ).update(status=PhotoProcessing.FAILED, updated=timezone.now())
+    futures = [submit(job_id) for job_id in jobs]
+    for future in futures:
+        if future is not None:
+            future.result()
+    return len(jobs)
+
+
+def work(poll_seconds=POLL_SECONDS):
+    """Process jobs as they are queued, until the process is stopped"""
+    while True:
+        if not process_pending():
+            # no job was waiting, and idle connections may be dropped
+            connections.close_all()
+            time.sleep(poll_seconds)
+
+
+def attach_manifests(photos):
+    """
+    Read the manifests of several photos with one query, for the
+    responsive_images template tags.
+
+    Args:
+        photos (iterable): Photos of registered models, None items are skipped.
+    """
+    photos = [
+        photo for photo in photos if photo is not None and type(photo) in _specs
+    ]
+    if not photos:
+        return
+    content_types = ContentType.objects.get_for_models(
+        *{type(photo) for photo in photos}
+    )
+    condition = Q()
+    for model, content_type in content_types.items():
+        object_ids = [photo.pk for photo in photos if type(photo) is model]
+        condition |= Q(content_type=content_type, object_id__in=object_ids)
+    manifests = {
+        (content_type_id, object_id): manifest
+        for content_type_id, object_id, manifest in PhotoProcessing.objects.filter(
+            condition, status=PhotoProcessing.DONE
+        ).values_list("content_type_id", "object_id", "manifest")
+    }
+    for photo in photos:
+        key = (content_types[type(photo)].id, photo.pk)
+        photo._image_manifest = manifests.get(key, {})
+
+
+def manifest_of(photo):
+    """
+    Manifest of a photo read by attach_manifests(), {} while it is processed,
+    not registered or not attached. Never queries, so a template looping
+    over photos the view did not attach falls back to the plain file
+    instead of running one query per photo.
+    """
+    if photo is None:
+        return {}
+    return getattr(photo, "_image_manifest", {})
+
+
+def image_srcset(image, image_format="jpeg"):
+    """
+    srcset of the copies of an image in one format.
+
+    Args:
+        image (FieldFile): Image field of a registered photo.
+        image_format (str): Key of ENCODINGS.
+
+    Returns:
+        str: e.g. "/media/a_320w.webp 320w, /media/a_640w.webp 640w", or ""
+        if the image has no copies in the format.
+    """
+    manifest = manifest_of(getattr(image, "instance", None))
+    candidates = [
+        (size, image.storage.url(name))
+        for size, name in manifest.get("src", {}).get(image_format, [])
+    ]
+    if image_format == "jpeg" and manifest:
+        candidates.append((manifest["w"], image.url))
+    return ", ".join(f"{url} {size}w" for size, url in sorted(candidates))
+
+
+def square_srcset(image, size, image_format="jpeg"):
+    """
+    Density srcset of the square crops of an image shown size pixels wide.
+
+    Returns:
+        tuple: (url of the 1x crop or None, srcset)
+    """
+    manifest = manifest_of(getattr(image, "instance", None))
+    crops = manifest.get("sq", {}).get(image_format, [])
+    candidates = [
+        (crop_size // size, image.storage.url(name))
+        for crop_size, name in crops
+        if crop_size % size == 0
+    ]
+    if not candidates:
+        return None, ""
+    candidates.sort()
+    srcset = ", ".join(f"{url} {density}x" for density, url in candidates)
+    return candidates[0][1], srcset
@@ -0,0 +1,308 @@
+"""
+Bulk import of the rose catalogue.
+
+Records are read as a stream from CSV or JSON-lines files and written in
+chunks: every chunk costs a handful of bulk INSERTs (roses, translations,
+alternative names and their translations, tags and tag links) whatever
+its size, instead of several round trips and signal handlers per rose.
+Slugs are computed up front the way Rose.save() does.
+
+A record maps Rose fields to values. Translated fields are given in the
+import language ("name") or suffixed with another language ("name:uk");
+JSON records may also carry {"translations": {"uk": {"name": ...}}}.
+"tags" and "alternative_names" are lists, or strings separated by commas
+and semicolons respectively in CSV files.
+
+bulk_create() doesn't send signals, so the search index, the landscape
+ideas, the sync changes and the cached counts of the imported roses are
+updated here once per chunk.
+"""
+import csv
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+from uuid import uuid4
+from unidecode import unidecode
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import transaction
+from django.template.defaultfilters import slugify
+from taggit.models import Tag, TaggedItem
+from . import search, sync
+from .autocomplete import rose_autocomplete
+from .facets import rose_facets
+from .models import (
+    CatalogueChange,
+    Rose,
+    RoseAlternativeName,
+    RoseLandscapeIdea,
+    LANDSCAPE_FIELDS,
+)
+from .pagination import clear_cached_counts
+
+
+# records written per transaction
+CHUNK_SIZE = 1000
+
+# Rose fields which are not set from import records
+EXCLUDED_FIELDS = {"id", "post_author", "main_photo", "total_user_likes", "users_like"}
+
+
+@dataclass
+class ImportResult:
+    """
+    Outcome of an import.
+
+    Attributes:
+        imported (int): Roses created.
+        rose_ids (list): Ids of the created roses.
+        errors (list): (record number, message) of the skipped records.
+    """
+
+    imported: int = 0
+    rose_ids: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+
+
+def read_csv(file):
+    """Records of a CSV file with a header row"""
+    return csv.DictReader(file)
+
+
+def read_json_lines(file):
+    """Records of a file holding one JSON object per line"""
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_records(file, name):
+    """Records of a file, read as CSV or JSON lines depending on its name"""
+    if name.endswith(".csv"):
+        return read_csv(file)
+    return read_json_lines(file)
+
+
+def split_values(value, separator):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(separator)
+    return [item.strip() for item in value if item and item.strip()]
+
+
+def unique_slug(name):
+    # same form as the slugs set by Rose.save()
+    return slugify(unidecode(name)) + "-" + str(uuid4()).split("-")[4]
+
+
+class RoseImporter:
+    """
+    Write records to the catalogue in chunks.
+
+    Example:
+        with open("roses.csv", newline="") as file:
+            result = RoseImporter(author=user).run(read_csv(file))
+    """
+
+    def __init__(
+        self,
+        language=None,
+        author=None,
+        chunk_size=CHUNK_SIZE,
+        index=True,
+        progress=None,
+    ):
+        """
+        Args:
+            language (str): Language of unsuffixed translated fields, the
+                parler default language if not given.
+            author (User): post_author of the imported roses.
+            chunk_size (int): Records written per transaction.
+            index (bool): Update the search index of the imported roses. The
+                rebuild_search_index command can do it afterwards instead.
+            progress (callable): Called with the ImportResult after each chunk.
+        """
+        self.language = language or settings.PARLER_DEFAULT_LANGUAGE_CODE
+        self.author = author
+        self.chunk_size = chunk_size
+        self.index = index
+        self.progress = progress
+        self.translated_fields = set(Rose._parler_meta.get_all_fields())
+        self.rose_fields = {
+            rose_field.name: rose_field
+            for rose_field in Rose._meta.concrete_fields
+            if rose_field.name not in EXCLUDED_FIELDS
+        }
+        self.languages = {code for code, name in settings.LANGUAGES}
+
+    def run(self, records):
+        """
+        Import records.
+
+        Args:
+            records (iterable): Record dicts, read lazily.
+
+        Returns:
+            ImportResult: Counts and skipped records.
+        """
+        result = ImportResult()
+        records = enumerate(records, start=1)
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk, result)
+            if self.progress is not None:
+                self.progress(result)
+        if result.rose_ids:
+            clear_cached_counts("roses")
+            rose_autocomplete.update_roses(result.rose_ids)
+        return result
+
+    def parse(self, record):
+        """
+        Split a record into a Rose, its translations, alternative names and tags.
+
+        Raises:
+            ValidationError: A value doesn't fit its field.
+        """
+        record = dict(record)
+        translations = {
+            language: dict(values)
+            for language, values in (record.pop("translations", None) or {}).items()
+        }
+        tags = split_values(record.pop("tags", None), ",")
+        alternative_names = split_values(record.pop("alternative_names", None), ";")
+
+        values = {}
+        for key, value in record.items():
+            if value is None or value == "":
+                continue
+            name, _, language = key.partition(":")
+            if name in self.translated_fields:
+                if language and language not in self.languages:
+                    raise ValidationError(f"Unknown language in column {key}")
+                translations.setdefault(language or self.language, {})[name] = value
+            elif name in self.rose_fields:
+                values[name] = self.rose_fields[name].to_python(value)
+            else:
+                raise FieldDoesNotExist(f"Rose has no field {key}")
+
+        if self.language not in translations:
+            raise ValidationError("The name is missing")
+        for language, fields in translations.items():
+            if not fields.get("name"):
+                raise ValidationError(f"The name in {language} is missing")
+        rose = Rose(post_author=self.author, **values)
+        rose.clean_fields(
+            exclude=["slug", "registration_slug", *self.translated_fields]
+        )
+        # what Rose.save() would do
+        name = translations[self.language]["name"]
+        if rose.status == "published":
+            rose.publish = True
+        if not rose.slug:
+            rose.slug = unique_slug(name)
+        if not rose.registration_slug:
+            rose.registration_slug = unique_slug(name)
+        return rose, translations, alternative_names, tags
+
+    def import_chunk(self, chunk, result):
+        parsed = []
+        for number, record in chunk:
+            try:
+                parsed.append(self.parse(record))
+            except (ValidationError, FieldDoesNotExist, ValueError) as error:
+                messages = getattr(error, "messages", [str(error)])
+                result.errors.append((number, "; ".join(messages)))
+        if not parsed:
+            return
+
+        with transaction.atomic():
+            roses = Rose.objects.bulk_create([rose for rose, *rest in parsed])
+            self.create_translations(parsed)
+            alternative_names = self.create_alternative_names(parsed)
+            self.create_tags(parsed)
+            RoseLandscapeIdea.objects.bulk_create(
+                RoseLandscapeIdea(idea=idea, rose_id=rose.id, created=rose.created)
+                for rose in roses
+                if rose.publish
+                for idea in LANDSCAPE_FIELDS
+                if getattr(rose, idea)
+            )
+            sync.record_changes(CatalogueChange.ROSE, [rose.id for rose in roses])
+            sync.record_changes(
+                CatalogueChange.ALTERNATIVE_NAME,
+                [name.id for name, documents in alternative_names],
+            )
+            if self.index:
+                for rose, translations, *rest in parsed:
+                    search.index_rose(rose.id, translations)
+                for alternative_name, documents in alternative_names:
+                    search.index_alternative_name(
+                        alternative_name.id, documents, alternative_name.rose_code_id
+                    )
+        RoseLandscapeIdea.clear_counts()
+        search.clear_letter_counts()
+        for rose in roses:
+            rose_facets.update_rose(rose)
+        result.imported += len(roses)
+        result.rose_ids += [rose.id for rose in roses]
+
+    def create_translations(self, parsed):
+        Translation = Rose._parler_meta.root_model
+        Translation.objects.bulk_create(
+            Translation(master_id=rose.id, language_code=language, **values)
+            for rose, translations, *rest in parsed
+            for language, values in translations.items()
+        )
+
+    def create_alternative_names(self, parsed):
+        """Create the alternative names, returns (RoseAlternativeName, documents)"""
+        names = [
+            (RoseAlternativeName(rose_code_id=rose.id), name)
+            for rose, translations, alternative_names, tags in parsed
+            for name in alternative_names
+        ]
+        if not names:
+            return []
+        RoseAlternativeName.objects.bulk_create(
+            [alternative_name for alternative_name, name in names]
+        )
+        Translation = RoseAlternativeName._parler_meta.root_model
+        Translation.objects.bulk_create(
+            Translation(
+                master_id=alternative_name.id, language_code=self.language, name=name
+            )
+            for alternative_name, name in names
+        )
+        return [
+            (alternative_name, {self.language: {"name": name}})
+            for alternative_name, name in names
+        ]
+
+    def create_tags(self, parsed):
+        names = {name for rose, *rest, tags in parsed for name in tags}
+        if not names:
+            return
+        tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+        missing = names - tags.keys()
+        Tag.objects.bulk_create(
+            [Tag(name=name, slug=Tag().slugify(name)) for name in missing],
+            ignore_conflicts=True,
+        )
+        tags.update({tag.name: tag for tag in Tag.objects.filter(name__in=missing)})
+        for name in names - tags.keys():
+            # the slug was taken by another name, let taggit pick a free one
+            tags[name] = Tag.objects.create(name=name)
+        content_type = ContentType.objects.get_for_model(Rose)
+        TaggedItem.objects.bulk_create(
+            (
+                TaggedItem(content_type=content_type, object_id=rose.id, tag=tags[name])
+                for rose, *rest, rose_tags in parsed
+                for name in set(rose_tags)
+            ),
+            ignore_conflicts=True,
+        )
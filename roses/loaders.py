@@ -0,0 +1,136 @@
+"""
+Loaders assembling everything a page shows in a fixed number of queries.
+"""
+from dataclasses import dataclass
+from .models import (
+    Rose,
+    RoseAlternativeName,
+    RoseCommentPath,
+    RoseYoutubeVideo,
+    SimilarRose,
+)
+from .pagination import KeysetPaginator
+
+
+# top-level comments per page of a thread
+COMMENTS_PER_PAGE = 20
+
+
+def rose_neighbours(rose, kind, language):
+    """Precomputed neighbours of a rose as cards, closest first"""
+    return (
+        Rose.objects.as_cards(language)
+        .filter(similar_to__rose=rose, similar_to__kind=kind, publish=True)
+        .order_by("similar_to__rank")
+    )
+
+
+def load_comment_threads(rose, cursor=None, per_page=COMMENTS_PER_PAGE):
+    """
+    A page of top-level comments with all their replies.
+
+    The top-level comments are paged by keyset on their path; the replies
+    of the whole page then sit in one path range, read by a single ordered
+    query however deep the threads go.
+
+    Args:
+        rose (Rose): The commented rose.
+        cursor (str): Cursor of the page, None for the first one.
+        per_page (int): Top-level comments per page.
+
+    Returns:
+        tuple: (KeysetPage of top-level RoseCommentPath rows, list of the
+        comments of the page ordered depth-first).
+    """
+    paths = RoseCommentPath.objects.filter(rose=rose, comment__active=True)
+    page = KeysetPaginator(paths.filter(depth=0), per_page, ("path",)).page(cursor)
+    if not page.object_list:
+        return page, []
+    threads = (
+        paths.filter(path__gte=page[0].path, path__lt=page[-1].path + "~")
+        .select_related("comment", "comment__comment_author")
+        .order_by("path")
+    )
+    comments = []
+    for thread_path in threads:
+        comment = thread_path.comment
+        comment.depth = thread_path.depth
+        comment.reply_count = thread_path.reply_count
+        comments.append(comment)
+    return page, comments
+
+
+def comment_tree(comments):
+    """
+    Attach the replies of each comment as a tuple in comment.replies_list.
+
+    Args:
+        comments (list): Comments of some threads, parents before replies.
+
+    Returns:
+        tuple: The top-level comments.
+    """
+    replies = {}
+    for comment in comments:
+        replies.setdefault(comment.parent_id, []).append(comment)
+    for comment in comments:
+        comment.replies_list = tuple(replies.get(comment.id, ()))
+    return tuple(replies.get(None, ()))
+
+
+@dataclass(frozen=True)
+class RoseDetail:
+    """Everything the rose detail page shows, loaded up front"""
+
+    rose: Rose
+    alternative_names: tuple
+    pictures: tuple
+    videos: tuple
+    tags: tuple
+    comments: tuple
+    comments_page: object
+    similar_roses: tuple
+    also_liked_roses: tuple
+
+
+def load_rose_detail(slug, language, comments_cursor=None):
+    """
+    Load a rose and all its related objects with bounded prefetches.
+
+    The number of queries doesn't depend on how many pictures, videos,
+    names or comments the rose has.
+
+    Args:
+        slug (str): Slug of the rose.
+        language (str): Language code of the translated fields.
+        comments_cursor (str): Cursor of the page of comment threads.
+
+    Returns:
+        RoseDetail: The bundle of the page.
+
+    Raises:
+        Rose.DoesNotExist: No rose has the slug.
+    """
+    rose = (
+        Rose.objects.language(language)
+        .select_related("main_photo")
+        .prefetch_related("translations", "tags")
+        .get(slug=slug)
+    )
+    alternative_names = (
+        RoseAlternativeName.objects.language(language)
+        .filter(rose_code=rose)
+        .prefetch_related("translations")
+    )
+    comments_page, comments = load_comment_threads(rose, comments_cursor)
+    return RoseDetail(
+        rose=rose,
+        alternative_names=tuple(alternative_names),
+        pictures=tuple(rose.get_pictures()),
+        videos=tuple(RoseYoutubeVideo.objects.filter(rose_id=rose, active=True)),
+        tags=tuple(rose.tags.all()),
+        comments=comment_tree(comments),
+        comments_page=comments_page,
+        similar_roses=tuple(rose_neighbours(rose, SimilarRose.ATTRIBUTES, language)),
+        also_liked_roses=tuple(rose_neighbours(rose, SimilarRose.CO_LIKES, language)),
+    )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from roses.models import Rose, RosePhoto
+from library.models import Article, ArticlePhotos
+
+
+class Command(BaseCommand):
+    help = "Set the main_photo pointer of every rose and article"
+
+    def first_photos(self, photos, owner_field):
+        """owner id -> id of the first photo of the owner"""
+        first = {}
+        for owner_id, photo_id in photos.order_by("-id").values_list(owner_field, "id"):
+            first[owner_id] = photo_id
+        return first
+
+    def backfill(self, model, first):
+        objects = list(model.objects.only("id", "main_photo"))
+        for obj in objects:
+            obj.main_photo_id = first.get(obj.id)
+        model.objects.bulk_update(objects, ["main_photo"], batch_size=500)
+        return len(objects)
+
+    def handle(self, *args, **options):
+        roses = self.backfill(
+            Rose,
+            self.first_photos(RosePhoto.objects.filter(main_picture=True), "rose_data"),
+        )
+        articles = self.backfill(
+            Article,
+            self.first_photos(ArticlePhotos.objects.filter(section_number=0), "article"),
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Main photos set for {roses} roses and {articles} articles")
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from roses.colikes import rebuild_co_liked_roses, MIN_CO_LIKES
+
+
+class Command(BaseCommand):
+    help = "Recompute the roses liked by the same users as each rose"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-co-likes",
+            type=int,
+            default=MIN_CO_LIKES,
+            help="Users who must have liked both roses",
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_co_liked_roses(options["min_co_likes"])
+        self.stdout.write(self.style.SUCCESS(f"{total} co-liked roses stored"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from roses.similarity import rebuild_similar_roses
+
+
+class Command(BaseCommand):
+    help = "Recompute the attribute nearest neighbours of every published rose"
+
+    def handle(self, *args, **options):
+        total = rebuild_similar_roses()
+        self.stdout.write(self.style.SUCCESS(f"Similar roses built for {total} roses"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from roses.sync import backfill_changes, prune_tombstones, TOMBSTONE_DAYS
+
+
+class Command(BaseCommand):
+    help = "Backfill the delta-sync changes or prune old tombstones"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backfill",
+            action="store_true",
+            help="Record every existing rose, alternative name and photo",
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help=f"Delete tombstones older than {TOMBSTONE_DAYS} days",
+        )
+
+    def handle(self, *args, **options):
+        if options["backfill"]:
+            total = backfill_changes()
+            self.stdout.write(self.style.SUCCESS(f"{total} objects recorded"))
+        if options["prune"]:
+            total = prune_tombstones()
+            self.stdout.write(self.style.SUCCESS(f"{total} tombstones pruned"))
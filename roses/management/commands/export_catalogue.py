@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from roses.exports import EXPORTS, FORMATS, NDJSON, CHUNK_SIZE, export_lines
+
+
+class Command(BaseCommand):
+    help = "Write roses, alternative names or articles of one language to a file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", choices=list(EXPORTS))
+        parser.add_argument(
+            "--language",
+            default=settings.PARLER_DEFAULT_LANGUAGE_CODE,
+            choices=[code for code, name in settings.LANGUAGES],
+        )
+        parser.add_argument("--format", default=NDJSON, choices=list(FORMATS))
+        parser.add_argument(
+            "--output", help="File to write, standard output if missing"
+        )
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        lines = export_lines(
+            options["name"],
+            options["language"],
+            options["format"],
+            options["chunk_size"],
+        )
+        if options["output"] is None:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        with open(options["output"], "w", newline="", encoding="utf-8") as file:
+            file.writelines(lines)
+        self.stdout.write(self.style.SUCCESS(f"Export written to {options['output']}"))
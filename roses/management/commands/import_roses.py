@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from roses.importer import RoseImporter, read_records, CHUNK_SIZE
+from roses.similarity import rebuild_similar_roses
+
+
+class Command(BaseCommand):
+    help = "Import roses in bulk from a CSV or JSON-lines file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="A .csv file or a file of JSON lines")
+        parser.add_argument(
+            "--language", help="Language of the unsuffixed translated columns"
+        )
+        parser.add_argument("--author", help="Username set as post author")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Roses written per transaction",
+        )
+        parser.add_argument(
+            "--no-index",
+            action="store_true",
+            help="Skip the search index, run rebuild_search_index afterwards",
+        )
+
+    def handle(self, *args, **options):
+        author = None
+        if options["author"]:
+            try:
+                author = get_user_model().objects.get(username=options["author"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Unknown user {options['author']}")
+
+        def progress(result):
+            self.stdout.write(
+                f"{result.imported} roses imported, {len(result.errors)} skipped"
+            )
+
+        importer = RoseImporter(
+            language=options["language"],
+            author=author,
+            chunk_size=options["chunk_size"],
+            index=not options["no_index"],
+            progress=progress,
+        )
+        path = options["path"]
+        with open(path, newline="", encoding="utf-8") as file:
+            result = importer.run(read_records(file, path))
+
+        for number, message in result.errors:
+            self.stderr.write(f"Record {number}: {message}")
+        if result.imported:
+            rebuild_similar_roses()
+        self.stdout.write(self.style.SUCCESS(f"{result.imported} roses imported"))
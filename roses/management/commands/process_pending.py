@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from roses.images import process_pending, queue_all_derivatives
+
+
+class Command(BaseCommand):
+    help = "Process uploaded photos whose processing never ran, failed or was lost"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--derivatives",
+            action="store_true",
+            help="Also make the responsive copies of photos processed before them",
+        )
+
+    def handle(self, *args, **options):
+        if options["derivatives"]:
+            queued = queue_all_derivatives()
+            self.stdout.write(f"{queued} photos queued for their copies")
+        total = process_pending()
+        self.stdout.write(self.style.SUCCESS(f"{total} photos processed"))
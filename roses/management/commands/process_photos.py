@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from roses.images import POLL_SECONDS, get_workers, work
+
+
+class Command(BaseCommand):
+    help = "Process uploaded photos as they are queued, in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll",
+            type=float,
+            default=POLL_SECONDS,
+            help="Seconds to wait for new photos when none is queued",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Processing photos with {get_workers() or 1} workers")
+        work(options["poll"])
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from roses.models import RoseCommentPath
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized thread paths of every rose comment"
+
+    def handle(self, *args, **options):
+        total = RoseCommentPath.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Thread paths rebuilt for {total} comments"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from roses.models import RoseLandscapeIdea
+
+
+class Command(BaseCommand):
+    help = "Rebuild the landscape idea membership of published roses"
+
+    def handle(self, *args, **options):
+        RoseLandscapeIdea.rebuild()
+        self.stdout.write(self.style.SUCCESS("Landscape ideas rebuilt"))
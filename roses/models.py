@@ -1,21 +1,54 @@
 import os
+from collections import Counter
 from uuid import uuid4
 from unidecode import unidecode
-from random import choice
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Window
+from django.db.models.functions import Random, RowNumber
 from django.conf import settings
+from django.core.cache import cache
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from django.urls import reverse
 from django.template.defaultfilters import slugify
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.db.models.signals import post_delete, pre_save
 from django.dispatch.dispatcher import receiver
 from taggit.managers import TaggableManager
+from parler.managers import TranslatableManager, TranslatableQuerySet
 from parler.models import TranslatableModel, TranslatedFields
 from embed_video.fields import EmbedVideoField
 from .utils import resize_photo
+from .pagination import get_count_timeout
+
+
+# number of "liked by" users shown with a rose
+LIKERS_SAMPLE_SIZE = 2
+
+
+class RoseQuerySet(TranslatableQuerySet):
+    def as_cards(self, language):
+        """
+        Roses with everything a rose card shows loaded in bulk.
+
+        The main picture is joined in and translations and tags are fetched
+        with one prefetch query each, so a page of cards costs the same few
+        queries however many roses it holds.
+
+        Args:
+            language (str): Language code of the translated names.
+
+        Returns:
+            QuerySet: Roses whose get_main_picture() needs no query.
+        """
+        return (
+            self.language(language)
+            .select_related("main_photo")
+            .prefetch_related("translations", "tags")
+        )
 
 
 class Rose(TranslatableModel):
@@ -64,6 +97,18 @@ class Rose(TranslatableModel):
     )
     total_user_likes = models.PositiveIntegerField(db_index=True, default=0)
 
+    # kept by the RosePhoto signal handlers, see Rose.refresh_main_photo()
+    main_photo = models.ForeignKey(
+        "RosePhoto",
+        models.SET_NULL,
+        blank=True,
+        null=True,
+        editable=False,
+        related_name="+",
+    )
+
+    objects = TranslatableManager.from_queryset(RoseQuerySet)()
+
     
     # Rose pictures
     class Meta:
@@ -100,33 +145,480 @@ class Rose(TranslatableModel):
         return self.comments.filter(parent=None).filter(active=True)
 
     def get_main_picture(self):
-        rose_pic = RosePhoto.objects.filter(
-            rose_data=self.id, main_picture=True
-        ).first()
-        return rose_pic if rose_pic else None
+        # joined in by Rose.objects.as_cards()
+        return self.main_photo
+
+    @classmethod
+    def refresh_main_photo(cls, rose_id):
+        """Point main_photo of a rose at its first main picture"""
+        main_photo = (
+            RosePhoto.objects.filter(rose_data=rose_id, main_picture=True)
+            .order_by("id")
+            .values_list("id", flat=True)
+            .first()
+        )
+        cls.objects.filter(id=rose_id).update(main_photo=main_photo)
 
     def get_pictures(self):
         return self.rose_pics.filter(active=False)  # change later to = True
 
     def get_followed_users_likes(self):
-        random_users_like = []
-        user_ids = self.users_like.values_list("id", flat=True)
-        # Get
-        if len(user_ids) > 2:
-            while len(random_users_like) < 2:
-                random_id = choice(user_ids)
-                random_user = self.users_like.get(id=random_id)
-                if random_user not in random_users_like:
-                    random_users_like.append(random_user)
-        # if the current Rose post was liked by fewer than 2 users
-        else:
-            for u in user_ids:
-                if u not in random_users_like:
-                    user_liked = self.users_like.get(id=u)
-                    random_users_like.append(user_liked)
-        return random_users_like
+        # sampled for a whole page by Rose.attach_likers()
+        if hasattr(self, "sampled_likers"):
+            return self.sampled_likers
+        return Rose.sample_likers([self.id]).get(self.id, [])
+
+    @classmethod
+    def sample_likers(cls, rose_ids, size=LIKERS_SAMPLE_SIZE):
+        """
+        Pick random users who liked each of the given roses.
+
+        One windowed query numbers the likes of every rose in random order
+        and keeps the first ones, so popular roses cost as much as the rest.
+
+        Args:
+            rose_ids (list): Ids of the roses.
+            size (int): Maximum number of users per rose.
+
+        Returns:
+            dict: rose id -> list of User objects.
+        """
+        likes = (
+            cls.users_like.through.objects.filter(rose_id__in=rose_ids)
+            .annotate(
+                position=Window(
+                    RowNumber(), partition_by=F("rose_id"), order_by=Random()
+                )
+            )
+            .filter(position__lte=size)
+            .select_related("user")
+        )
+        likers = {}
+        for like in likes:
+            likers.setdefault(like.rose_id, []).append(like.user)
+        return likers
+
+    @classmethod
+    def attach_likers(cls, roses, size=LIKERS_SAMPLE_SIZE):
+        """Sample the likers of a page of roses, read by get_followed_users_likes()"""
+        roses = list(roses)
+        likers = cls.sample_likers([rose.id for rose in roses], size)
+        for rose in roses:
+            rose.sampled_likers = likers.get(rose.id, [])
 
     # return the list of users, who liked this particular rose.id
     def get_users_like(self):
         return self.users_like.all()
 
+
+# numeric ratings of a Rose offered as catalogue filters
+RATING_FIELDS = (
+    "aroma_strength",
+    "health_rating",
+    "sun_exposure",
+    "cold_hardy",
+    "blackspots",
+    "mildew",
+    "rust",
+)
+
+# landscape ideas a Rose is suitable for, offered as catalogue filters
+LANDSCAPE_FIELDS = (
+    "mixed_border",
+    "shade",
+    "cutting",
+    "containers",
+    "border",
+    "hedges",
+    "pergola",
+    "attracting_bees",
+    "landscaping",
+    "rock_gardens",
+    "large_structures",
+)
+
+
+
+class RoseNameIndex(models.Model):
+    """
+    Normalized, transliterated search keys of Rose and RoseAlternativeName
+    translations.
+
+    Every name is stored once per word it contains (the key starting at that
+    word), so a prefix typed in Latin or Cyrillic script finds the name with
+    one indexed lookup. The row of the whole name also carries its letter
+    bucket and sort key for the alphabetical listing. Rows are maintained by
+    roses.search.
+
+    Attributes:
+        rose (Rose): The rose the name belongs to.
+        alternative_name (RoseAlternativeName): Set when the name is an
+            alternative name of the rose.
+        language_code (str): Language of the translation the name comes from.
+        name (str): The name as written.
+        search_key (str): The transliterated, normalized key.
+        first_letter (str): Alphabet letter the name is listed under, blank
+            on the rows of the following words.
+        sort_key (str): Digits-only key that sorts Latin and Ukrainian names
+            in alphabet order under any database collation.
+    """
+
+    rose = models.ForeignKey(Rose, models.CASCADE, related_name="name_keys")
+    alternative_name = models.ForeignKey(
+        "RoseAlternativeName",
+        models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="name_keys",
+    )
+    language_code = models.CharField(max_length=15)
+    name = models.CharField(max_length=150)
+    search_key = models.CharField(max_length=255, db_index=True)
+    first_letter = models.CharField(max_length=1, blank=True)
+    sort_key = models.CharField(max_length=300, blank=True)
+
+    class Meta:
+        verbose_name = "rose name key"
+        verbose_name_plural = "rose name keys"
+        indexes = [models.Index(fields=["language_code", "first_letter", "sort_key"])]
+
+    def __str__(self):
+        return self.search_key
+
+
+class RoseLandscapeIdea(models.Model):
+    """
+    Membership of published roses in the landscape ideas pages.
+
+    Each landscape boolean of a published Rose gets one row, ordered like the
+    catalogue (newest first), so an idea page reads one index range and the
+    category selector reads cached counts instead of counting every request.
+
+    Attributes:
+        idea (str): Name of the landscape field, e.g. "hedges".
+        rose (Rose): The rose suitable for the idea.
+        created (DateTime): Copy of Rose.created used for ordering.
+    """
+
+    COUNTS_CACHE_KEY = "rose_landscape_idea_counts"
+
+    idea = models.CharField(
+        max_length=30, choices=[(field, field) for field in LANDSCAPE_FIELDS]
+    )
+    rose = models.ForeignKey(Rose, models.CASCADE, related_name="landscape_ideas")
+    created = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["idea", "rose"], name="unique_rose_idea")
+        ]
+        indexes = [models.Index(fields=["idea", "-created", "-rose"])]
+
+    def __str__(self):
+        return f"{self.rose_id} in {self.idea}"
+
+    @classmethod
+    def sync_rose(cls, rose):
+        """Bring the rows of one rose in line with its fields"""
+        ideas = set()
+        if rose.publish:
+            ideas = {field for field in LANDSCAPE_FIELDS if getattr(rose, field)}
+        current = set(cls.objects.filter(rose=rose).values_list("idea", flat=True))
+        if ideas - current:
+            cls.objects.bulk_create(
+                [cls(idea=idea, rose=rose, created=rose.created) for idea in ideas - current]
+            )
+        if current - ideas:
+            cls.objects.filter(rose=rose, idea__in=current - ideas).delete()
+        cls.objects.filter(rose=rose).exclude(created=rose.created).update(
+            created=rose.created
+        )
+        if ideas != current:
+            cls.clear_counts()
+
+    @classmethod
+    def rebuild(cls):
+        cls.objects.all().delete()
+        roses = Rose.objects.filter(publish=True).values("id", "created", *LANDSCAPE_FIELDS)
+        rows = (
+            cls(idea=field, rose_id=rose["id"], created=rose["created"])
+            for rose in roses.iterator()
+            for field in LANDSCAPE_FIELDS
+            if rose[field]
+        )
+        cls.objects.bulk_create(rows, batch_size=1000)
+        cls.clear_counts()
+
+    @classmethod
+    def idea_counts(cls):
+        """
+        Number of published roses per idea for the category selector, cached
+        until a membership changes or for at most PAGINATION_COUNT_TIMEOUT
+        seconds, as other workers do not see clear_counts() on a local cache.
+        """
+        return cache.get_or_set(
+            cls.COUNTS_CACHE_KEY,
+            lambda: dict(
+                cls.objects.values_list("idea").annotate(total=Count("id")).order_by()
+            ),
+            timeout=get_count_timeout(),
+        )
+
+    @classmethod
+    def clear_counts(cls):
+        cache.delete(cls.COUNTS_CACHE_KEY)
+
+
+class SimilarRose(models.Model):
+    """
+    Precomputed neighbours of a published rose.
+
+    Attributes:
+        kind (str): How the neighbours were found: by rose attributes (see
+            roses.similarity) or by users who liked both (see roses.colikes).
+        rose (Rose): The rose the neighbours are listed for.
+        similar (Rose): One of its nearest neighbours.
+        rank (int): Position of the neighbour, 0 is the most similar.
+        score (float): Cosine similarity of the two roses.
+    """
+
+    ATTRIBUTES = "attributes"
+    CO_LIKES = "co_likes"
+    KIND_CHOICES = [(ATTRIBUTES, _("Similar roses")), (CO_LIKES, _("Also liked"))]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=ATTRIBUTES)
+    rose = models.ForeignKey(Rose, models.CASCADE, related_name="similar_roses")
+    similar = models.ForeignKey(Rose, models.CASCADE, related_name="similar_to")
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "rose", "similar"], name="unique_similar_rose"
+            )
+        ]
+        indexes = [models.Index(fields=["rose", "kind", "rank"])]
+
+    def __str__(self):
+        return f"{self.similar_id} similar to {self.rose_id}"
+
+
+class RoseCommentPath(models.Model):
+    """
+    Materialized path of a RoseComment in its thread.
+
+    The path joins the zero-padded ids of the comment's ancestors and its
+    own, so ordering the comments of a rose by path lists every thread
+    depth-first, parents before replies, and the replies of a comment are
+    the rows whose path starts with its path.
+
+    Attributes:
+        comment (RoseComment): The comment.
+        rose (Rose): Copy of comment.rose_post for the (rose, path) index.
+        path (str): e.g. "0000000012/0000000031/" for a reply to comment 12.
+        depth (int): 0 for top-level comments.
+        reply_count (int): Number of direct replies.
+    """
+
+    SEGMENT_WIDTH = 10
+
+    comment = models.OneToOneField(
+        "RoseComment", models.CASCADE, primary_key=True, related_name="thread_path"
+    )
+    rose = models.ForeignKey(Rose, models.CASCADE, related_name="comment_paths")
+    path = models.CharField(max_length=255)
+    depth = models.PositiveSmallIntegerField(default=0)
+    reply_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["rose", "path"], name="unique_comment_path")
+        ]
+        indexes = [models.Index(fields=["rose", "depth", "path"])]
+
+    def __str__(self):
+        return self.path
+
+    @classmethod
+    def segment(cls, comment_id):
+        return f"{comment_id:0{cls.SEGMENT_WIDTH}d}/"
+
+    @classmethod
+    def for_comment(cls, comment):
+        """Path row of a comment, created with its ancestors' rows if missing"""
+        try:
+            return cls.objects.get(comment_id=comment.id)
+        except cls.DoesNotExist:
+            pass
+        if comment.parent_id is None:
+            path, depth = cls.segment(comment.id), 0
+        else:
+            parent = cls.for_comment(comment.parent)
+            path, depth = parent.path + cls.segment(comment.id), parent.depth + 1
+        thread_path, created = cls.objects.get_or_create(
+            comment_id=comment.id,
+            defaults={"rose_id": comment.rose_post_id, "path": path, "depth": depth},
+        )
+        if created and comment.parent_id is not None:
+            cls.objects.filter(comment_id=comment.parent_id).update(
+                reply_count=F("reply_count") + 1
+            )
+        return thread_path
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute the paths and reply counts of every comment"""
+        # the relation resolves the lazy "RoseComment" reference
+        comment_model = cls._meta.get_field("comment").related_model
+        comments = {
+            comment_id: (parent_id, rose_id)
+            for comment_id, parent_id, rose_id in comment_model.objects.values_list(
+                "id", "parent_id", "rose_post_id"
+            ).iterator()
+        }
+        paths = {}
+
+        def path_of(comment_id):
+            # iterative walk up to the top-level comment
+            chain = []
+            while comment_id is not None and comment_id not in paths:
+                chain.append(comment_id)
+                comment_id = comments[comment_id][0]
+            prefix = paths[comment_id] if comment_id is not None else ""
+            for ancestor in reversed(chain):
+                prefix += cls.segment(ancestor)
+                paths[ancestor] = prefix
+            return paths[chain[0]] if chain else prefix
+
+        reply_counts = Counter(parent_id for parent_id, _ in comments.values())
+        rows = []
+        for comment_id, (parent_id, rose_id) in comments.items():
+            path = path_of(comment_id)
+            rows.append(
+                cls(
+                    comment_id=comment_id,
+                    rose_id=rose_id,
+                    path=path,
+                    depth=path.count("/") - 1,
+                    reply_count=reply_counts[comment_id],
+                )
+            )
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+        return len(comments)
+
+
+class CatalogueChange(models.Model):
+    """
+    Latest change of a synced catalogue object, read by the delta-sync API.
+
+    Every rose, alternative name and photo has at most one row, moved to
+    the end of the (updated, id) order whenever the object changes, so a
+    client asking for the changes after its watermark gets each changed
+    object once. Rows of deleted objects stay as tombstones until they are
+    pruned. Rows are written by roses.sync.
+
+    Attributes:
+        kind (str): ROSE, ALTERNATIVE_NAME or PHOTO.
+        object_id (int): Id of the changed object.
+        updated (datetime): Time of the change.
+        deleted (bool): The object was deleted.
+    """
+
+    ROSE = "rose"
+    ALTERNATIVE_NAME = "alternative_name"
+    PHOTO = "photo"
+    KIND_CHOICES = [
+        (ROSE, "rose"),
+        (ALTERNATIVE_NAME, "alternative name"),
+        (PHOTO, "photo"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    updated = models.DateTimeField(default=timezone.now)
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "object_id"], name="unique_catalogue_change"
+            )
+        ]
+        indexes = [models.Index(fields=["updated", "id"])]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
+
+
+class PhotoProcessing(models.Model):
+    """
+    Processing job of an uploaded photo, see roses.images.
+
+    Uploads are stored as sent and a job resizes, watermarks and re-encodes
+    them in a worker process; the processed file then replaces the raw one
+    and its responsive copies are listed in the manifest.
+
+    Attributes:
+        photo: The RosePhoto, ArticlePhotos or other registered photo.
+        status (str): PENDING, PROCESSING, DONE or FAILED.
+        source (str): Name of the raw file being processed.
+        result (str): Name of the processed file.
+        attempts (int): Number of times processing was started.
+        error (str): Last processing error.
+        derivatives_only (bool): The source is already processed, only its
+            copies are made, e.g. for photos uploaded before the copies.
+        manifest (dict): Size of the processed file and names of its copies,
+            {"w": 1200, "h": 800, "src": {"webp": [[320, name], ...], ...},
+            "sq": {"webp": [[40, name], ...], ...}}, see roses.images.
+    """
+
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, _("Pending")),
+        (PROCESSING, _("Processing")),
+        (DONE, _("Done")),
+        (FAILED, _("Failed")),
+    ]
+
+    content_type = models.ForeignKey(ContentType, models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    photo = GenericForeignKey("content_type", "object_id")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    source = models.CharField(max_length=255)
+    result = models.CharField(max_length=255, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    derivatives_only = models.BooleanField(default=False)
+    manifest = models.JSONField(default=dict, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["content_type", "object_id"], name="unique_photo_processing"
+            )
+        ]
+        indexes = [models.Index(fields=["status", "updated"])]
+
+    def __str__(self):
+        return f"{self.source} ({self.status})"
+
+    @classmethod
+    def status_of(cls, photo):
+        """Processing status of a photo, DONE if it never needed processing"""
+        status = (
+            cls.objects.filter(
+                content_type=ContentType.objects.get_for_model(photo),
+                object_id=photo.pk,
+            )
+            .values_list("status", flat=True)
+            .first()
+        )
+        return status or cls.DONE
@@ -0,0 +1,386 @@
+import base64
+import datetime
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator, EmptyPage, PageNotAnInteger
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+
+# sources of the total shown by a CountedPaginator
+COUNT_CACHED = "cached"
+COUNT_ESTIMATE = "estimate"
+COUNT_NONE = "none"
+
+# below this many estimated rows an exact (cached) count is cheap enough
+ESTIMATE_MIN_ROWS = 10000
+
+# seconds a cached count is kept; clear_cached_counts() only reaches the
+# cache of its own process unless a shared cache backend is configured
+COUNT_TIMEOUT = 60
+
+
+class KnownCountPaginator(Paginator):
+    """
+    Paginator for object lists whose length is already known, e.g. from a
+    cached count, so no COUNT query is run.
+    """
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._known_count = count
+
+    @property
+    def count(self):
+        return self._known_count
+
+
+def count_cache_key(prefix, *signature):
+    """
+    Cache key of a list count.
+
+    Args:
+        prefix (str): Name of the counted list, e.g. "roses".
+        signature: Language and filter values the list depends on.
+
+    Returns:
+        str: Key that changes whenever clear_cached_counts(prefix) is called.
+    """
+    version = cache.get_or_set(
+        f"{prefix}_count_version", time.time_ns, timeout=get_count_timeout()
+    )
+    digest = hashlib.md5(repr(signature).encode()).hexdigest()
+    return f"{prefix}_count_{version}_{digest}"
+
+
+def clear_cached_counts(prefix):
+    """Invalidate every cached count of a list, e.g. when an object is published"""
+    cache.set(f"{prefix}_count_version", time.time_ns(), timeout=get_count_timeout())
+
+
+def get_count_timeout():
+    """Seconds cached counts are kept, settings.PAGINATION_COUNT_TIMEOUT"""
+    return getattr(settings, "PAGINATION_COUNT_TIMEOUT", COUNT_TIMEOUT)
+
+
+def estimated_count(queryset):
+    """
+    Row estimate of the PostgreSQL planner for a queryset.
+
+    Returns:
+        int: Estimated number of rows, or None on other database backends.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class UncountedPage(Page):
+    """Page of a paginator without a total, which knows only if more follow"""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    # Page validates neighbours through the paginator and checks its count,
+    # which would run the COUNT(*) this page avoids
+    def next_page_number(self):
+        if not self._has_next:
+            raise EmptyPage(_("That page contains no results"))
+        return self.number + 1
+
+    def previous_page_number(self):
+        if self.number <= 1:
+            raise EmptyPage(_("That page number is less than 1"))
+        return self.number - 1
+
+    def start_index(self):
+        if not self.object_list:
+            return 0
+        return self.paginator.per_page * (self.number - 1) + 1
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1
+
+
+class CountedPaginator(Paginator):
+    """
+    Paginator which avoids an exact COUNT(*) on every page.
+
+    The total comes from count_source:
+        "cached": an exact count kept in the cache under count_key.
+        "estimate": the planner estimate on PostgreSQL for large tables,
+            otherwise the cached count.
+        "none": no total; pages fetch one extra row to know if another page
+            follows. Only an out of range page falls back to counting.
+    """
+
+    def __init__(
+        self, object_list, per_page, count_source=COUNT_CACHED, count_key=None, **kwargs
+    ):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_source = count_source
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        if self.count_source == COUNT_ESTIMATE:
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= ESTIMATE_MIN_ROWS:
+                return estimate
+        if self.count_key is None:
+            return super().count
+        count = cache.get(self.count_key)
+        if count is None:
+            count = super().count
+            cache.set(self.count_key, count, timeout=get_count_timeout())
+        return count
+
+    def page(self, number):
+        if self.count_source != COUNT_NONE:
+            return super().page(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_("That page number is not an integer"))
+        if number < 1:
+            raise EmptyPage(_("That page number is less than 1"))
+        bottom = (number - 1) * self.per_page
+        objects = list(self.object_list[bottom : bottom + self.per_page + 1])
+        if not objects and number > 1:
+            raise EmptyPage(_("That page contains no results"))
+        has_next = len(objects) > self.per_page
+        return UncountedPage(objects[: self.per_page], number, self, has_next)
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Keeps the microseconds DjangoJSONEncoder cuts from datetimes, so a
+    cursor matches its row exactly and ties are broken by the next field.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage:
+    """
+    A page of a KeysetPaginator. Templates link to the neighbouring pages
+    with ?cursor={{ page.next_cursor }} and ?cursor={{ page.previous_cursor }}.
+    """
+
+    keyset = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<Keyset page of {len(self.object_list)} objects>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by the values of its ordering fields instead of
+    OFFSET, so every page costs one index range scan and no COUNT(*).
+
+    The ordering must end with a unique field, e.g. ("-created", "-id") or
+    ("username", "id"); annotations may be ordered by too. Pages are addressed with opaque cursor tokens holding
+    the key of the first or last object of the neighbouring page.
+
+    Example:
+        paginator = KeysetPaginator(Rose.objects.all(), 12, ("-created", "-id"))
+        page = paginator.page(request.GET.get("cursor"))
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [field.lstrip("-") for field in self.ordering]
+
+    def _reversed_ordering(self):
+        return [
+            field[1:] if field.startswith("-") else f"-{field}"
+            for field in self.ordering
+        ]
+
+    def encode_cursor(self, obj, direction):
+        values = [getattr(obj, field) for field in self.fields]
+        data = json.dumps([direction, values], cls=CursorEncoder)
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    def _field(self, name):
+        """Model field or annotation ordered by"""
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.queryset.model._meta.get_field(name)
+
+    def decode_cursor(self, cursor):
+        try:
+            padding = "=" * (-len(cursor) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+            if direction not in ("next", "previous") or len(values) != len(self.fields):
+                raise ValueError(cursor)
+            values = [
+                self._field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, ValidationError) as error:
+            raise InvalidCursor(cursor) from error
+        return direction, values
+
+    def _after(self, values, forward):
+        """Q matching the objects placed after (or before) the given key"""
+        condition = Q()
+        for position, field in enumerate(self.ordering):
+            descending = field.startswith("-")
+            lookup = "lt" if descending == forward else "gt"
+            name = self.fields[position]
+            term = Q(**{f"{name}__{lookup}": values[position]})
+            for previous in range(position):
+                term &= Q(**{self.fields[previous]: values[previous]})
+            condition |= term
+        return condition
+
+    def _page(self, objects, has_next, has_previous):
+        next_cursor = None
+        previous_cursor = None
+        if objects and has_next:
+            next_cursor = self.encode_cursor(objects[-1], "next")
+        if objects and has_previous:
+            previous_cursor = self.encode_cursor(objects[0], "previous")
+        return KeysetPage(objects, next_cursor, previous_cursor)
+
+    def first_page(self):
+        objects = list(self.queryset.order_by(*self.ordering)[: self.per_page + 1])
+        has_next = len(objects) > self.per_page
+        return self._page(objects[: self.per_page], has_next, False)
+
+    def last_page(self):
+        objects = list(
+            self.queryset.order_by(*self._reversed_ordering())[: self.per_page + 1]
+        )
+        has_previous = len(objects) > self.per_page
+        objects = objects[: self.per_page][::-1]
+        return self._page(objects, False, has_previous)
+
+    def page(self, cursor=None):
+        """
+        Return the page a cursor points to. A missing or malformed cursor
+        gives the first page; a cursor past the end gives the last page.
+        """
+        if not cursor:
+            return self.first_page()
+        try:
+            direction, values = self.decode_cursor(cursor)
+        except InvalidCursor:
+            return self.first_page()
+
+        if direction == "next":
+            objects = list(
+                self.queryset.filter(self._after(values, True)).order_by(
+                    *self.ordering
+                )[: self.per_page + 1]
+            )
+            if not objects:
+                # out of range, deliver the last page
+                return self.last_page()
+            has_next = len(objects) > self.per_page
+            return self._page(objects[: self.per_page], has_next, True)
+
+        objects = list(
+            self.queryset.filter(self._after(values, False)).order_by(
+                *self._reversed_ordering()
+            )[: self.per_page + 1]
+        )
+        if not objects:
+            return self.first_page()
+        has_previous = len(objects) > self.per_page
+        return self._page(objects[: self.per_page][::-1], True, has_previous)
+
+
+def paginate(request, object_list, per_page, ordering=None, count_key=None):
+    """
+    Paginate a list view.
+
+    Requests carrying a ?cursor= parameter (even empty) get a KeysetPage;
+    otherwise the usual numbered ?page= pagination is used. With a count_key
+    the numbered pages take their total from the source set in
+    settings.PAGINATION_COUNT_SOURCE (cached by default) instead of COUNT(*).
+
+    Args:
+        request (HttpRequest): The current request.
+        object_list (QuerySet): Objects to paginate.
+        per_page (int): Objects per page.
+        ordering (tuple): Keyset ordering, ending with a unique field. Without
+            it only numbered pages are offered.
+        count_key (str): Cache key of the total, see count_cache_key().
+
+    Returns:
+        Page or KeysetPage: Out of range pages deliver the last page,
+        malformed page numbers or cursors the first one.
+    """
+    if ordering and "cursor" in request.GET:
+        paginator = KeysetPaginator(object_list, per_page, ordering)
+        return paginator.page(request.GET.get("cursor"))
+
+    if ordering:
+        object_list = object_list.order_by(*ordering)
+    if count_key is not None:
+        count_source = getattr(settings, "PAGINATION_COUNT_SOURCE", COUNT_CACHED)
+        paginator = CountedPaginator(object_list, per_page, count_source, count_key)
+    else:
+        paginator = Paginator(object_list, per_page)
+    page = request.GET.get("page")
+    try:
+        return paginator.page(page)
+    except PageNotAnInteger:
+        # If page is not an integer deliver only the first page
+        return paginator.page(1)
+    except EmptyPage:
+        # if page is out of reange deliver the last page
+        return paginator.page(paginator.num_pages)
@@ -0,0 +1,166 @@
+"""
+Popularity ranking of roses.
+
+The home page shows the most viewed roses. Their order is kept in a ranking
+backend which is updated on every rose view, so the top list is read
+without sorting the Rose table. The backend is set by
+settings.ROSE_RANKING_BACKEND:
+
+    "roses.ranking.RedisRanking": a Redis sorted set shared by all workers,
+        needs the redis package.
+    "roses.ranking.LocalRanking": per-process scores seeded from
+        Rose.post_views, for single worker setups and tests.
+"""
+import heapq
+import threading
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from .models import Rose
+
+
+RANKING_KEY = "rose_ranking"
+
+# number of roses kept sorted by LocalRanking
+TOP_SIZE = 50
+
+
+class RankingBackend:
+    """Interface of the ranking backends"""
+
+    def incr(self, rose_id, amount=1):
+        """Add to the score of a rose"""
+        raise NotImplementedError
+
+    def remove(self, rose_id):
+        """Drop a deleted or unpublished rose"""
+        raise NotImplementedError
+
+    def top(self, count):
+        """Ids of the best ranked roses, best first"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+def redis_client():
+    """Client of the Redis server in the REDIS_* settings"""
+    try:
+        import redis
+    except ImportError as error:
+        raise ImproperlyConfigured(
+            "The Redis ranking and trending backends need the redis package, "
+            "install it or use the Local backends"
+        ) from error
+
+    return redis.Redis(
+        host=getattr(settings, "REDIS_HOST", "localhost"),
+        port=getattr(settings, "REDIS_PORT", 6379),
+        db=getattr(settings, "REDIS_DB", 0),
+    )
+
+
+class RedisRanking(RankingBackend):
+    def __init__(self, key=RANKING_KEY):
+        self.key = key
+        self.redis = redis_client()
+
+    def incr(self, rose_id, amount=1):
+        self.redis.zincrby(self.key, amount, rose_id)
+
+    def remove(self, rose_id):
+        self.redis.zrem(self.key, rose_id)
+
+    def top(self, count):
+        ranked = self.redis.zrange(self.key, 0, count - 1, desc=True)
+        return [int(rose_id) for rose_id in ranked]
+
+    def clear(self):
+        self.redis.delete(self.key)
+
+
+class LocalRanking(RankingBackend):
+    """
+    Scores held in the process.
+
+    The best TOP_SIZE roses are kept sorted and updated incrementally: an
+    increment only re-sorts the short top list, and the full scores are
+    scanned again only when a rose drops out of it.
+    """
+
+    def __init__(self, size=TOP_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._scores = None
+        # [(-score, rose_id), ...] sorted
+        self._top = []
+
+    def _load(self):
+        self._scores = dict(
+            Rose.objects.filter(publish=True).values_list("id", "post_views")
+        )
+        self._rebuild()
+
+    def _rebuild(self):
+        self._top = heapq.nsmallest(
+            self.size, ((-score, rose_id) for rose_id, score in self._scores.items())
+        )
+
+    def incr(self, rose_id, amount=1):
+        with self._lock:
+            if self._scores is None:
+                self._load()
+            score = self._scores.get(rose_id, 0) + amount
+            self._scores[rose_id] = score
+            in_top = any(entry[1] == rose_id for entry in self._top)
+            if in_top and amount < 0:
+                # a rose from outside may overtake it
+                self._rebuild()
+                return
+            if in_top:
+                self._top = [entry for entry in self._top if entry[1] != rose_id]
+            if len(self._top) < self.size or (-score, rose_id) < self._top[-1]:
+                self._top.append((-score, rose_id))
+                self._top.sort()
+                del self._top[self.size :]
+
+    def remove(self, rose_id):
+        with self._lock:
+            if self._scores is None or self._scores.pop(rose_id, None) is None:
+                return
+            if any(entry[1] == rose_id for entry in self._top):
+                self._rebuild()
+
+    def top(self, count):
+        with self._lock:
+            if self._scores is None:
+                self._load()
+            if count > self.size:
+                ranked = heapq.nsmallest(
+                    count, ((-score, rose_id) for rose_id, score in self._scores.items())
+                )
+            else:
+                ranked = self._top[:count]
+        return [rose_id for _, rose_id in ranked]
+
+    def clear(self):
+        self.reset({})
+
+    def reset(self, scores):
+        """Replace all scores, e.g. with scores rebuilt elsewhere"""
+        with self._lock:
+            self._scores = dict(scores)
+            self._rebuild()
+
+
+_ranking = None
+
+
+def get_ranking():
+    """The ranking backend set in settings.ROSE_RANKING_BACKEND"""
+    global _ranking
+    if _ranking is None:
+        backend = getattr(settings, "ROSE_RANKING_BACKEND", "roses.ranking.LocalRanking")
+        _ranking = import_string(backend)()
+    return _ranking
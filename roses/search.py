@@ -0,0 +1,589 @@
+"""
+Full-text search index for the rose catalogue.
+
+Every Rose translation (name, colour, description) and every
+RoseAlternativeName translation is stored as one document per language in a
+backend-specific index: an FTS5 virtual table on SQLite and a tsvector column
+with a GIN index on PostgreSQL. The index is kept up to date by the signal
+handlers in roses.signals and queried by the roses_search_results view.
+
+Names are also indexed by trigrams (pg_trgm on PostgreSQL, a trigram side
+table on SQLite), so misspelled variety names still find a match, and by
+transliterated keys (RoseNameIndex), so Cyrillic and Latin spellings of the
+same name find each other.
+"""
+import re
+from unidecode import unidecode
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import Count
+from .models import Rose, RoseAlternativeName, RoseNameIndex
+from .pagination import get_count_timeout
+
+
+# document kinds stored in the index
+ROSE = "rose"
+ALTERNATIVE_NAME = "alternative"
+
+# maximum number of ranked hits returned by a single search
+SEARCH_RESULTS_LIMIT = 500
+
+# lowest trigram similarity accepted as a fuzzy match, as in pg_trgm
+SIMILARITY_THRESHOLD = 0.3
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# spellings folded together so both scripts end up with the same key
+LATIN_FOLDING = (("'", ""), ("kh", "h"), ("ph", "f"), ("y", "i"), ("w", "v"))
+
+NOT_KEY_RE = re.compile(r"[^a-z0-9]+")
+DOUBLE_LETTER_RE = re.compile(r"([a-z])\1+")
+
+# letters of the alphabetical listing
+LATIN_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+UKRAINIAN_ALPHABET = "АБВГҐДЕЄЖЗИІЇЙКЛМНОПРСТУФХЦЧШЩЬЮЯ"
+# bucket of names starting with a digit or a foreign letter
+OTHER_LETTER = "#"
+# Cyrillic letters missing from the Ukrainian alphabet
+CYRILLIC_FOLDING = {"Ё": "Е", "Ы": "И", "Э": "Е", "Ъ": ""}
+
+# collation order of the sort key: digits, Latin, then Ukrainian letters
+COLLATION = {
+    char: f"{position:02d}"
+    for position, char in enumerate(
+        "0123456789" + LATIN_ALPHABET + UKRAINIAN_ALPHABET, start=1
+    )
+}
+
+
+def tokenize(query):
+    """Split a search query into lowercase word tokens"""
+    return WORD_RE.findall(query.lower())
+
+
+def trigrams(text):
+    """
+    Return the set of trigrams of a text the way pg_trgm builds them: every
+    word is lowercased and padded with two spaces in front and one behind.
+
+    Example:
+        trigrams("Rosa") == {"  r", " ro", "ros", "osa", "sa "}
+    """
+    grams = set()
+    for word in tokenize(text):
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def transliterate(text):
+    """
+    Build the script-independent search key of a name.
+
+    The text is transliterated to Latin and lowercased. Apostrophes are
+    dropped, other punctuation becomes spaces, a few spellings that differ
+    between transliterations are folded and doubled letters are collapsed,
+    since Cyrillic spellings rarely keep them.
+
+    Example:
+        transliterate("Мейланд") == transliterate("Meilland") == "meiland"
+    """
+    key = unidecode(text).lower()
+    for source, target in LATIN_FOLDING:
+        key = key.replace(source, target)
+    key = NOT_KEY_RE.sub(" ", key).strip()
+    return DOUBLE_LETTER_RE.sub(r"\1", key)
+
+
+def first_letter(name):
+    """
+    Letter a name is listed under: its first letter or digit in the Ukrainian
+    or Latin alphabet, with diacritics removed, e.g. "Éclair" -> "E".
+    """
+    for char in name.upper():
+        char = CYRILLIC_FOLDING.get(char, char)
+        if not char.isalnum():
+            continue
+        if char in UKRAINIAN_ALPHABET:
+            return char
+        latin = unidecode(char).upper()[:1]
+        return latin if latin in LATIN_ALPHABET else OTHER_LETTER
+    return OTHER_LETTER
+
+
+def sort_key(name):
+    """
+    Alphabet order of a name as a string of two-digit letter codes, so the
+    database orders it correctly whatever its collation. Words are separated
+    by "00", punctuation is ignored.
+    """
+    codes = []
+    for char in name.upper():
+        char = CYRILLIC_FOLDING.get(char, char)
+        if char.isspace():
+            if codes and codes[-1] != "00":
+                codes.append("00")
+        elif char in COLLATION:
+            codes.append(COLLATION[char])
+        elif char.isalpha():
+            codes.extend(
+                COLLATION[latin] for latin in unidecode(char).upper() if latin in COLLATION
+            )
+    if codes and codes[-1] == "00":
+        codes.pop()
+    return "".join(codes)[:300]
+
+
+def name_keys(name):
+    """Keys of a name starting at each of its words"""
+    words = transliterate(name).split()
+    return [" ".join(words[i:])[:255] for i in range(len(words))]
+
+
+def language_codes():
+    return [code for code, name in settings.LANGUAGES]
+
+
+class SQLiteFullTextIndex:
+    """
+    FTS5 index. The rowid encodes the indexed object, its kind and language,
+    so a document can be replaced without scanning the table.
+    """
+
+    table = "roses_search_fts"
+    trigram_table = "roses_search_trigram"
+
+    def install(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+            "language_code UNINDEXED, name, colour, description, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.trigram_table} ("
+            "trigram TEXT NOT NULL, "
+            "language_code TEXT NOT NULL, "
+            "document INTEGER NOT NULL, "
+            "trigram_count INTEGER NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.trigram_table}_lookup "
+            f"ON {self.trigram_table} (trigram, language_code)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.trigram_table}_document "
+            f"ON {self.trigram_table} (document)"
+        )
+
+    def _rowid(self, kind, object_id, language_code):
+        kind_bit = 0 if kind == ROSE else 1
+        position = language_codes().index(language_code)
+        return (object_id * 16 + position) * 2 + kind_bit
+
+    def _object(self, rowid):
+        kind = ROSE if rowid % 2 == 0 else ALTERNATIVE_NAME
+        return kind, rowid // 32
+
+    def remove(self, cursor, kind, object_id):
+        rowids = [self._rowid(kind, object_id, code) for code in language_codes()]
+        placeholders = ", ".join(["%s"] * len(rowids))
+        cursor.execute(
+            f"DELETE FROM {self.table} WHERE rowid IN ({placeholders})", rowids
+        )
+        cursor.execute(
+            f"DELETE FROM {self.trigram_table} WHERE document IN ({placeholders})",
+            rowids,
+        )
+
+    def update(self, cursor, kind, object_id, documents):
+        self.remove(cursor, kind, object_id)
+        for language_code, fields in documents.items():
+            rowid = self._rowid(kind, object_id, language_code)
+            cursor.execute(
+                f"INSERT INTO {self.table} "
+                "(rowid, language_code, name, colour, description) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                [
+                    rowid,
+                    language_code,
+                    fields.get("name", ""),
+                    fields.get("colour", ""),
+                    fields.get("description", ""),
+                ],
+            )
+            grams = trigrams(fields.get("name", ""))
+            cursor.executemany(
+                f"INSERT INTO {self.trigram_table} "
+                "(trigram, language_code, document, trigram_count) "
+                "VALUES (%s, %s, %s, %s)",
+                [(gram, language_code, rowid, len(grams)) for gram in grams],
+            )
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {self.table}")
+        cursor.execute(f"DELETE FROM {self.trigram_table}")
+
+    def search(self, cursor, tokens, languages, limit):
+        # every token must be present, the last ones may be typed partially
+        match = " ".join(f'"{token}"*' for token in tokens)
+        placeholders = ", ".join(["%s"] * len(languages))
+        # bm25 weights: language_code, name, colour, description
+        cursor.execute(
+            f"SELECT rowid FROM {self.table} "
+            f"WHERE {self.table} MATCH %s AND language_code IN ({placeholders}) "
+            f"ORDER BY bm25({self.table}, 0.0, 10.0, 2.0, 1.0) LIMIT %s",
+            [match, *languages, limit],
+        )
+        return [self._object(rowid) for (rowid,) in cursor.fetchall()]
+
+    def similar(self, cursor, query, languages, limit):
+        grams = sorted(trigrams(query))
+        if not grams:
+            return []
+        gram_placeholders = ", ".join(["%s"] * len(grams))
+        language_placeholders = ", ".join(["%s"] * len(languages))
+        # similarity = shared trigrams / trigrams in either of the two names
+        score = (
+            f"CAST(COUNT(*) AS REAL) / ({len(grams)} + MAX(trigram_count) - COUNT(*))"
+        )
+        cursor.execute(
+            f"SELECT document, {score} AS score FROM {self.trigram_table} "
+            f"WHERE trigram IN ({gram_placeholders}) "
+            f"AND language_code IN ({language_placeholders}) "
+            f"GROUP BY document HAVING {score} >= %s "
+            "ORDER BY score DESC LIMIT %s",
+            [*grams, *languages, SIMILARITY_THRESHOLD, limit],
+        )
+        return [self._object(rowid) for rowid, score in cursor.fetchall()]
+
+
+class PostgresFullTextIndex:
+    """
+    tsvector index with a GIN index. The 'simple' configuration is used
+    because PostgreSQL ships no Ukrainian dictionary.
+    """
+
+    table = "roses_search_document"
+
+    def _name_tables(self):
+        return [
+            (ROSE, Rose._parler_meta.root_model._meta.db_table),
+            (ALTERNATIVE_NAME, RoseAlternativeName._parler_meta.root_model._meta.db_table),
+        ]
+
+    def install(self, cursor):
+        # fuzzy matching uses trigram indexes on the translated names
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for kind, name_table in self._name_tables():
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {name_table}_name_trgm "
+                f"ON {name_table} USING gin (name gin_trgm_ops)"
+            )
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "kind varchar(16) NOT NULL, "
+            "object_id bigint NOT NULL, "
+            "language_code varchar(15) NOT NULL, "
+            "document tsvector NOT NULL, "
+            "PRIMARY KEY (kind, object_id, language_code))"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_gin "
+            f"ON {self.table} USING gin (document)"
+        )
+
+    def remove(self, cursor, kind, object_id):
+        cursor.execute(
+            f"DELETE FROM {self.table} WHERE kind = %s AND object_id = %s",
+            [kind, object_id],
+        )
+
+    def update(self, cursor, kind, object_id, documents):
+        self.remove(cursor, kind, object_id)
+        for language_code, fields in documents.items():
+            cursor.execute(
+                f"INSERT INTO {self.table} "
+                "(kind, object_id, language_code, document) VALUES (%s, %s, %s, "
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s), 'C'))",
+                [
+                    kind,
+                    object_id,
+                    language_code,
+                    fields.get("name", ""),
+                    fields.get("colour", ""),
+                    fields.get("description", ""),
+                ],
+            )
+
+    def clear(self, cursor):
+        cursor.execute(f"TRUNCATE {self.table}")
+
+    def search(self, cursor, tokens, languages, limit):
+        # tokens only contain word characters, so they are safe in a tsquery
+        tsquery = " & ".join(f"{token}:*" for token in tokens)
+        placeholders = ", ".join(["%s"] * len(languages))
+        cursor.execute(
+            f"SELECT kind, object_id FROM {self.table}, "
+            "to_tsquery('simple', %s) query "
+            f"WHERE document @@ query AND language_code IN ({placeholders}) "
+            "ORDER BY ts_rank_cd(document, query) DESC LIMIT %s",
+            [tsquery, *languages, limit],
+        )
+        return cursor.fetchall()
+
+    def similar(self, cursor, query, languages, limit):
+        placeholders = ", ".join(["%s"] * len(languages))
+        selects, params = [], []
+        for kind, name_table in self._name_tables():
+            # "%%" is the pg_trgm similarity operator, indexed by the GIN index
+            selects.append(
+                f"SELECT %s AS kind, master_id, similarity(name, %s) AS score "
+                f"FROM {name_table} WHERE name %% %s "
+                f"AND language_code IN ({placeholders})"
+            )
+            params += [kind, query, query, *languages]
+        cursor.execute("SET pg_trgm.similarity_threshold = %s", [SIMILARITY_THRESHOLD])
+        cursor.execute(
+            " UNION ALL ".join(selects) + " ORDER BY score DESC LIMIT %s",
+            [*params, limit],
+        )
+        return [(kind, object_id) for kind, object_id, score in cursor.fetchall()]
+
+
+def get_index(using=DEFAULT_DB_ALIAS):
+    if connections[using].vendor == "postgresql":
+        return PostgresFullTextIndex()
+    return SQLiteFullTextIndex()
+
+
+def install(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Create the index tables, connected to post_migrate"""
+    with connections[using].cursor() as cursor:
+        get_index(using).install(cursor)
+
+
+def rose_documents(rose_id):
+    translations = Rose._parler_meta.root_model.objects.filter(master_id=rose_id)
+    return {
+        t.language_code: {
+            "name": t.name,
+            "colour": t.colour,
+            "description": t.description,
+        }
+        for t in translations
+    }
+
+
+def alternative_name_documents(alternative_name_id):
+    translations = RoseAlternativeName._parler_meta.root_model.objects.filter(
+        master_id=alternative_name_id
+    )
+    return {t.language_code: {"name": t.name} for t in translations}
+
+
+def update_name_keys(rose_id, alternative_name_id, documents):
+    """Replace the transliterated keys of a rose or an alternative name"""
+    RoseNameIndex.objects.filter(
+        rose_id=rose_id, alternative_name_id=alternative_name_id
+    ).delete()
+    rows = []
+    for language_code, fields in documents.items():
+        name = fields["name"]
+        for position, key in enumerate(name_keys(name)):
+            rows.append(
+                RoseNameIndex(
+                    rose_id=rose_id,
+                    alternative_name_id=alternative_name_id,
+                    language_code=language_code,
+                    name=name,
+                    search_key=key,
+                    # only the whole name is listed alphabetically
+                    first_letter=first_letter(name) if position == 0 else "",
+                    sort_key=sort_key(name) if position == 0 else "",
+                )
+            )
+    RoseNameIndex.objects.bulk_create(rows)
+    clear_letter_counts()
+
+
+def letter_counts(language):
+    """
+    Number of published names per letter, cached until a name changes or for
+    at most PAGINATION_COUNT_TIMEOUT seconds, as clear_letter_counts() does
+    not reach the cache of other workers unless the cache is shared.
+    """
+    return cache.get_or_set(
+        f"rose_letter_counts_{language}",
+        lambda: dict(
+            RoseNameIndex.objects.filter(language_code=language, rose__publish=True)
+            .exclude(first_letter="")
+            .values_list("first_letter")
+            .annotate(total=Count("id"))
+            .order_by()
+        ),
+        timeout=get_count_timeout(),
+    )
+
+
+def clear_letter_counts():
+    cache.delete_many([f"rose_letter_counts_{code}" for code in language_codes()])
+
+
+def index_rose(rose_id, documents=None):
+    if documents is None:
+        documents = rose_documents(rose_id)
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        get_index().update(cursor, ROSE, rose_id, documents)
+    update_name_keys(rose_id, None, documents)
+
+
+def index_alternative_name(alternative_name_id, documents=None, rose_id=None):
+    if documents is None:
+        documents = alternative_name_documents(alternative_name_id)
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        get_index().update(cursor, ALTERNATIVE_NAME, alternative_name_id, documents)
+    if rose_id is None:
+        rose_id = (
+            RoseAlternativeName.objects.filter(id=alternative_name_id)
+            .values_list("rose_code_id", flat=True)
+            .first()
+        )
+    if rose_id:
+        update_name_keys(rose_id, alternative_name_id, documents)
+
+
+# RoseNameIndex rows are removed by the database cascade
+def remove_rose(rose_id):
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        get_index().remove(cursor, ROSE, rose_id)
+    clear_letter_counts()
+
+
+def remove_alternative_name(alternative_name_id):
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        get_index().remove(cursor, ALTERNATIVE_NAME, alternative_name_id)
+    clear_letter_counts()
+
+
+def rebuild_index():
+    """Drop every indexed document and index the whole catalogue again"""
+    index = get_index()
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        index.install(cursor)
+        index.clear(cursor)
+    RoseNameIndex.objects.all().delete()
+    for rose_id in Rose.objects.values_list("id", flat=True).iterator():
+        index_rose(rose_id)
+    alternative_ids = RoseAlternativeName.objects.values_list("id", flat=True)
+    for alternative_name_id in alternative_ids.iterator():
+        index_alternative_name(alternative_name_id)
+
+
+def search_languages(language):
+    """The requested language followed by the parler fallback language"""
+    languages = [language]
+    fallback = settings.PARLER_LANGUAGES["default"]["fallback"]
+    if fallback != language:
+        languages.append(fallback)
+    return languages
+
+
+def search(query, language, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Search the index.
+
+    Args:
+        query (str): The text typed by the user.
+        language (str): Language code of the current request; the parler
+            fallback language is searched as well.
+        limit (int): Maximum number of hits.
+
+    Returns:
+        list: (kind, object_id) tuples ordered by relevance, best first.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        hits = get_index().search(cursor, tokens, search_languages(language), limit)
+    # the same object may be found in the fallback language too
+    return list(dict.fromkeys((kind, object_id) for kind, object_id in hits))
+
+
+def similar(query, language, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Find names similar to a possibly misspelled query.
+
+    Returns:
+        list: (kind, object_id) tuples ordered by trigram similarity.
+    """
+    if not tokenize(query):
+        return []
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        hits = get_index().similar(cursor, query, search_languages(language), limit)
+    return list(dict.fromkeys((kind, object_id) for kind, object_id in hits))
+
+
+def transliterated(query, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Find names in any script whose transliterated key starts with the
+    transliterated query, e.g. "Мейл" finds "Meilland".
+
+    Returns:
+        list: (kind, object_id) tuples.
+    """
+    key = transliterate(query)
+    if not key:
+        return []
+    # a plain range instead of LIKE, which SQLite and non-C collations on
+    # PostgreSQL can't answer from the search_key index
+    rows = (
+        RoseNameIndex.objects.filter(search_key__gte=key, search_key__lt=key + "\uffff")
+        .values_list("rose_id", "alternative_name_id")
+        .order_by("search_key")[:limit]
+    )
+    hits = [
+        (ALTERNATIVE_NAME, alternative_name_id)
+        if alternative_name_id
+        else (ROSE, rose_id)
+        for rose_id, alternative_name_id in rows
+    ]
+    return list(dict.fromkeys(hits))
+
+
+def load_hits(hits, language):
+    """Turn (kind, object_id) hits into published objects, keeping the order"""
+    rose_ids = [object_id for kind, object_id in hits if kind == ROSE]
+    alternative_ids = [object_id for kind, object_id in hits if kind != ROSE]
+    objects = {
+        ROSE: Rose.objects.language(language).filter(publish=True).in_bulk(rose_ids),
+        ALTERNATIVE_NAME: RoseAlternativeName.objects.language(language)
+        .filter(rose_code__publish=True)
+        .in_bulk(alternative_ids),
+    }
+    return [
+        objects[kind][object_id]
+        for kind, object_id in hits
+        if object_id in objects[kind]
+    ]
+
+
+def search_catalogue(query, language, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Return published Rose and RoseAlternativeName objects matching the query,
+    ordered by relevance. Names written in the other script follow the
+    full-text hits.
+    """
+    hits = search(query, language, limit) + transliterated(query, limit)
+    return load_hits(list(dict.fromkeys(hits))[:limit], language)
+
+
+def similar_catalogue(query, language, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Return published Rose and RoseAlternativeName objects whose names are
+    similar to the query, best match first.
+    """
+    return load_hits(similar(query, language, limit), language)
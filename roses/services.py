@@ -0,0 +1,71 @@
+"""
+Write paths for rose likes.
+
+A like is one row of the Rose.users_like through table plus the
+denormalized Rose.total_user_likes counter. Both are changed with single
+statements: an idempotent insert or delete of the through row and an
+F() increment of the counter. The Rose row is never saved as a whole, so
+concurrent likes don't rewrite every column or bump Rose.updated.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Rose
+from .autocomplete import rose_autocomplete
+from .trending import get_trending
+
+
+RoseLike = Rose.users_like.through
+
+
+def like_rose(user, rose):
+    """
+    Add the like of a user to a rose.
+
+    Returns:
+        bool: True if the like is new, False if the user already liked it.
+    """
+    with transaction.atomic():
+        _, created = RoseLike.objects.get_or_create(rose_id=rose.id, user_id=user.id)
+        if created:
+            Rose.objects.filter(id=rose.id).update(
+                total_user_likes=F("total_user_likes") + 1
+            )
+    if created:
+        # suggestions are ranked by likes
+        transaction.on_commit(lambda: rose_autocomplete.update_rose(rose.id))
+        transaction.on_commit(lambda: get_trending().record_like(rose.id))
+    return created
+
+
+def unlike_rose(user, rose):
+    """
+    Remove the like of a user from a rose.
+
+    Returns:
+        bool: True if a like was removed, False if there was none.
+    """
+    with transaction.atomic():
+        deleted, _ = RoseLike.objects.filter(rose_id=rose.id, user_id=user.id).delete()
+        if deleted:
+            Rose.objects.filter(id=rose.id, total_user_likes__gt=0).update(
+                total_user_likes=F("total_user_likes") - 1
+            )
+    if deleted:
+        transaction.on_commit(lambda: rose_autocomplete.update_rose(rose.id))
+    return bool(deleted)
+
+
+def refresh_like_counts(rose_ids):
+    """Recount total_user_likes of roses whose likes changed in bulk"""
+    likes = (
+        RoseLike.objects.filter(rose_id=OuterRef("pk"))
+        .values("rose_id")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    Rose.objects.filter(id__in=rose_ids).update(
+        total_user_likes=Coalesce(Subquery(likes), Value(0))
+    )
+    for rose_id in rose_ids:
+        rose_autocomplete.update_rose(rose_id)
@@ -1,9 +1,165 @@
-from django.db.models.signals import m2m_changed
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import Rose
+from django.db.models import F
+from .models import (
+    CatalogueChange,
+    Rose,
+    RoseAlternativeName,
+    RoseComment,
+    RoseCommentPath,
+    RoseLandscapeIdea,
+    RosePhoto,
+)
+from . import images, search, services, similarity, sync
+from .autocomplete import rose_autocomplete
+from .facets import rose_facets
+from .pagination import clear_cached_counts
+from .ranking import get_ranking
+from .trending import get_trending
 
 
+# likes added through rose.users_like or user.roses_liked instead of
+# roses.services; the counter is recounted without saving the whole Rose
 @receiver(m2m_changed, sender=Rose.users_like.through)
-def users_like_changed(sender, instance, **kwargs):
-    instance.total_user_likes = instance.users_like.count()
-    instance.save()
+def users_like_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action == "pre_clear":
+            # the cleared roses are unknown after the fact
+            instance._cleared_rose_ids = list(
+                instance.roses_liked.values_list("id", flat=True)
+            )
+            return
+        if action == "post_clear":
+            pk_set = instance.__dict__.pop("_cleared_rose_ids", [])
+        if action.startswith("post_"):
+            services.refresh_like_counts(list(pk_set))
+    elif action.startswith("post_"):
+        services.refresh_like_counts([instance.id])
+
+
+# tagging or untagging a rose changes the totals of the tag pages
+@receiver(m2m_changed, sender=Rose.tags.through)
+def tags_changed(sender, instance, action, **kwargs):
+    if isinstance(instance, Rose) and action.startswith("post_"):
+        clear_cached_counts("roses")
+
+
+# keep the full-text search index up to date. Parler saves translations
+# after the master row, so the index listens to the translation models.
+@receiver(post_save, sender=Rose._parler_meta.root_model)
+def rose_translation_saved(sender, instance, **kwargs):
+    search.index_rose(instance.master_id)
+    rose_autocomplete.update_rose(instance.master_id)
+    similarity.schedule_refresh(instance.master_id)
+    sync.record_changes(CatalogueChange.ROSE, [instance.master_id])
+
+
+# publishing a rose changes its autocomplete suggestions and facets
+@receiver(post_save, sender=Rose)
+def rose_saved(sender, instance, update_fields=None, **kwargs):
+    rose_autocomplete.update_rose(instance.id)
+    rose_facets.update_rose(instance)
+    RoseLandscapeIdea.sync_rose(instance)
+    sync.record_changes(CatalogueChange.ROSE, [instance.id])
+    if update_fields is None:
+        similarity.schedule_refresh(instance.id)
+    if update_fields is None or "publish" in update_fields:
+        # letter counts and list totals only include published roses
+        search.clear_letter_counts()
+        clear_cached_counts("roses")
+        sync.record_rose_dependants(instance.id)
+        if not instance.publish:
+            get_ranking().remove(instance.id)
+            get_trending().remove(instance.id)
+
+
+# the neighbour rows listing a rose are deleted with it, so the roses
+# listing it are collected before
+@receiver(pre_delete, sender=Rose)
+def rose_deleting(sender, instance, **kwargs):
+    similarity.schedule_refresh(instance.id, similarity.listed_by(instance.id))
+
+
+@receiver(post_delete, sender=Rose)
+def rose_deleted(sender, instance, **kwargs):
+    search.remove_rose(instance.id)
+    rose_autocomplete.remove_rose(instance.id)
+    rose_facets.remove_rose(instance.id)
+    # landscape idea rows are removed by the database cascade
+    RoseLandscapeIdea.clear_counts()
+    clear_cached_counts("roses")
+    get_ranking().remove(instance.id)
+    get_trending().remove(instance.id)
+    sync.record_changes(CatalogueChange.ROSE, [instance.id], deleted=True)
+
+
+@receiver(post_save, sender=RoseAlternativeName._parler_meta.root_model)
+def alternative_name_translation_saved(sender, instance, **kwargs):
+    search.index_alternative_name(instance.master_id)
+    rose_autocomplete.update_rose(instance.master.rose_code_id)
+    sync.record_changes(CatalogueChange.ALTERNATIVE_NAME, [instance.master_id])
+
+
+@receiver(post_save, sender=RoseAlternativeName)
+def alternative_name_saved(sender, instance, **kwargs):
+    sync.record_changes(CatalogueChange.ALTERNATIVE_NAME, [instance.id])
+
+
+@receiver(post_delete, sender=RoseAlternativeName)
+def alternative_name_deleted(sender, instance, **kwargs):
+    search.remove_alternative_name(instance.id)
+    rose_autocomplete.update_rose(instance.rose_code_id)
+    sync.record_changes(
+        CatalogueChange.ALTERNATIVE_NAME, [instance.id], deleted=True
+    )
+
+
+# keep Rose.main_photo pointing at the first main picture of the rose
+@receiver(post_save, sender=RosePhoto)
+def rose_photo_saved(sender, instance, **kwargs):
+    Rose.refresh_main_photo(instance.rose_data_id)
+    # the photo may have been moved away from another rose
+    moved_from = list(
+        Rose.objects.filter(main_photo=instance)
+        .exclude(id=instance.rose_data_id)
+        .values_list("id", flat=True)
+    )
+    for rose_id in moved_from:
+        Rose.refresh_main_photo(rose_id)
+    sync.record_changes(CatalogueChange.PHOTO, [instance.id])
+    # main_photo_id of the roses may have changed
+    sync.record_changes(CatalogueChange.ROSE, [instance.rose_data_id, *moved_from])
+
+
+# uploads are resized and watermarked by the image workers; the square
+# crops are the thumbnails of photos in the activity stream
+images.register(
+    RosePhoto, "picture", watermark=lambda photo: True, squares=images.AVATAR_SIZES
+)
+
+
+@receiver(images.photo_processed, sender=RosePhoto)
+def rose_photo_processed(sender, instance, **kwargs):
+    sync.write_changes(CatalogueChange.PHOTO, [instance.id])
+
+
+@receiver(post_delete, sender=RosePhoto)
+def rose_photo_deleted(sender, instance, **kwargs):
+    Rose.refresh_main_photo(instance.rose_data_id)
+    sync.record_changes(CatalogueChange.PHOTO, [instance.id], deleted=True)
+    sync.record_changes(CatalogueChange.ROSE, [instance.rose_data_id])
+
+
+# keep the materialized comment paths and reply counts
+@receiver(post_save, sender=RoseComment)
+def rose_comment_saved(sender, instance, created, **kwargs):
+    if created:
+        RoseCommentPath.for_comment(instance)
+
+
+@receiver(post_delete, sender=RoseComment)
+def rose_comment_deleted(sender, instance, **kwargs):
+    if instance.parent_id is not None:
+        RoseCommentPath.objects.filter(
+            comment_id=instance.parent_id, reply_count__gt=0
+        ).update(reply_count=F("reply_count") - 1)
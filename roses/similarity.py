@@ -0,0 +1,272 @@
+"""
+Attribute similarity of roses.
+
+Every published rose is turned into a feature vector: one-hot columns for
+its class, subclass, colour category, flower form and flower size, its
+aroma and health ratings scaled to [0, 1] and its landscape booleans. The
+vectors are L2-normalized, so a block of dot products gives cosine
+similarities, and the k nearest neighbours of each rose are stored in
+SimilarRose. The rose detail page only reads those rows.
+
+Roses saved in a transaction refresh the rows they affect together once
+it commits. The attributes of the catalogue are kept in the cache with
+the updated time of each rose, so a refresh reads from the database only
+the roses changed since, also those saved by other workers. Rating scales
+follow the whole catalogue, so the build_similar_roses command should
+still run now and then to recompute everything.
+"""
+import threading
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import Rose, SimilarRose, LANDSCAPE_FIELDS
+
+
+# neighbours stored per rose
+NEIGHBOURS = 8
+
+# roses compared at once by the batch job
+BLOCK_SIZE = 512
+
+# feature groups and their weights
+CATEGORY_FIELDS = {
+    "rose_class": 2.0,
+    "rose_subclass": 1.5,
+    "color_category": 1.5,
+    "flower_form": 1.0,
+    "flower_size": 1.0,
+}
+RATING_FIELDS = {
+    "aroma_strength": 1.0,
+    "health_rating": 1.0,
+    "blackspots": 0.5,
+    "mildew": 0.5,
+    "rust": 0.5,
+}
+LANDSCAPE_WEIGHT = 0.5
+
+# attribute rows of the published roses by id, with their updated time
+FEATURES_CACHE_KEY = "similar_roses_attributes"
+FEATURES_TIMEOUT = 60 * 60 * 24
+
+# roses waiting for the current transaction of each thread to commit
+_scheduled = threading.local()
+
+
+def rose_attributes(rose_ids=None):
+    """(rose ids, attribute dicts) of the published roses, or of some of them"""
+    roses = (
+        Rose.objects.language(settings.PARLER_DEFAULT_LANGUAGE_CODE)
+        .filter(publish=True)
+        .prefetch_related("translations")
+        .order_by("id")
+    )
+    if rose_ids is not None:
+        roses = roses.filter(id__in=rose_ids)
+    ids = []
+    rows = []
+    fields = ["updated", *CATEGORY_FIELDS, *RATING_FIELDS, *LANDSCAPE_FIELDS]
+    for rose in roses.iterator(chunk_size=1000):
+        ids.append(rose.id)
+        rows.append({field: getattr(rose, field, None) for field in fields})
+    return np.array(ids, dtype=np.int64), rows
+
+
+def catalogue_attributes(changed=()):
+    """
+    Attribute rows of every published rose, read from the cache.
+
+    One query lists the published ids with their updated time; only the
+    changed roses, those updated since they were cached (e.g. by another
+    worker) and those missing from the cache are loaded, and the rows are
+    cached again.
+
+    Args:
+        changed (set): Ids of roses whose cached rows are outdated.
+
+    Returns:
+        tuple: (rose ids, attribute dicts) ordered by id.
+    """
+    published = dict(Rose.objects.filter(publish=True).values_list("id", "updated"))
+    cached = cache.get(FEATURES_CACHE_KEY) or {}
+    features = {
+        rose_id: row
+        for rose_id, row in cached.items()
+        if published.get(rose_id) == row["updated"] and rose_id not in changed
+    }
+    missing = published - features.keys()
+    if missing:
+        # an empty cache is filled without a list of every id
+        ids, rows = rose_attributes(missing if features else None)
+        features.update(zip(ids.tolist(), rows))
+    cache.set(FEATURES_CACHE_KEY, features, FEATURES_TIMEOUT)
+    ids = sorted(features)
+    return np.array(ids, dtype=np.int64), [features[rose_id] for rose_id in ids]
+
+
+def feature_matrix(rows):
+    """L2-normalized feature vectors, one row per rose"""
+    columns = []
+    for field, weight in CATEGORY_FIELDS.items():
+        values = [str(row[field] or "").strip().casefold() for row in rows]
+        vocabulary = {value: i for i, value in enumerate(sorted(set(values) - {""}))}
+        one_hot = np.zeros((len(rows), len(vocabulary)), dtype=np.float32)
+        for position, value in enumerate(values):
+            if value:
+                one_hot[position, vocabulary[value]] = weight
+        columns.append(one_hot)
+    for field, weight in RATING_FIELDS.items():
+        values = np.array([row[field] or 0 for row in rows], dtype=np.float32)
+        spread = values.max() - values.min() if len(values) else 0
+        scaled = (values - values.min()) / spread if spread else np.zeros_like(values)
+        columns.append((scaled * weight)[:, None])
+    landscape = np.array(
+        [[bool(row[field]) for field in LANDSCAPE_FIELDS] for row in rows],
+        dtype=np.float32,
+    ).reshape(len(rows), len(LANDSCAPE_FIELDS))
+    columns.append(landscape * LANDSCAPE_WEIGHT)
+
+    matrix = np.hstack(columns)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def nearest_neighbours(matrix, positions, k=NEIGHBOURS):
+    """
+    Top-k neighbours of some rows of the matrix.
+
+    Returns:
+        tuple: (neighbours, scores), arrays of shape (len(positions), k')
+        sorted by decreasing similarity, with k' = min(k, rows - 1).
+    """
+    k = min(k, len(matrix) - 1)
+    if k <= 0:
+        empty = np.zeros((len(positions), 0))
+        return empty.astype(np.int64), empty
+    similarities = matrix[positions] @ matrix.T
+    # a rose is not its own neighbour
+    similarities[np.arange(len(positions)), positions] = -np.inf
+    candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(similarities, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return (
+        np.take_along_axis(candidates, order, axis=1),
+        np.take_along_axis(candidate_scores, order, axis=1),
+    )
+
+
+def _store(ids, matrix, positions):
+    neighbours, scores = nearest_neighbours(matrix, positions)
+    rows = [
+        SimilarRose(
+            kind=SimilarRose.ATTRIBUTES,
+            rose_id=int(ids[position]),
+            similar_id=int(ids[neighbour]),
+            rank=rank,
+            score=float(score),
+        )
+        for position, rose_neighbours, rose_scores in zip(positions, neighbours, scores)
+        for rank, (neighbour, score) in enumerate(zip(rose_neighbours, rose_scores))
+    ]
+    SimilarRose.objects.bulk_create(rows, batch_size=1000)
+
+
+def rebuild_similar_roses():
+    """Recompute the neighbours of every published rose"""
+    ids, rows = rose_attributes()
+    cache.set(FEATURES_CACHE_KEY, dict(zip(ids.tolist(), rows)), FEATURES_TIMEOUT)
+    matrix = feature_matrix(rows)
+    attribute_neighbours = SimilarRose.objects.filter(kind=SimilarRose.ATTRIBUTES)
+    with transaction.atomic():
+        attribute_neighbours.delete()
+        for start in range(0, len(ids), BLOCK_SIZE):
+            _store(ids, matrix, np.arange(start, min(start + BLOCK_SIZE, len(ids))))
+    return len(ids)
+
+
+def listed_by(rose_id):
+    """Ids of the roses listing a rose as a neighbour"""
+    return set(
+        SimilarRose.objects.filter(
+            kind=SimilarRose.ATTRIBUTES, similar_id=rose_id
+        ).values_list("rose_id", flat=True)
+    )
+
+
+def refresh_roses(rose_ids, listed=()):
+    """
+    Update the neighbours after some roses were saved or deleted.
+
+    Only rows the changes can affect are recomputed: the roses themselves,
+    roses that listed them as a neighbour, and roses they are now closer to
+    than their current last neighbour.
+
+    Args:
+        rose_ids (set): Ids of the changed roses.
+        listed (set): Ids of roses that listed a deleted rose, whose rows
+            went with it.
+    """
+    changed = set(rose_ids)
+    ids, rows = catalogue_attributes(changed)
+    matrix = feature_matrix(rows)
+    positions = {rose_id: position for position, rose_id in enumerate(ids.tolist())}
+    neighbours = SimilarRose.objects.filter(kind=SimilarRose.ATTRIBUTES)
+
+    affected = set(listed)
+    affected.update(
+        neighbours.filter(similar_id__in=changed).values_list("rose_id", flat=True)
+    )
+    present = [positions[rose_id] for rose_id in changed if rose_id in positions]
+    if present:
+        affected.update(rose_id for rose_id in changed if rose_id in positions)
+        closest = (matrix[present] @ matrix.T).max(axis=0)
+        # roses with fewer neighbours than they could have keep -inf
+        last_scores = np.full(len(ids), -np.inf)
+        for other_id, score in neighbours.filter(rank=NEIGHBOURS - 1).values_list(
+            "rose_id", "score"
+        ):
+            if other_id in positions:
+                last_scores[positions[other_id]] = score
+        affected.update(ids[closest > last_scores].tolist())
+
+    with transaction.atomic():
+        neighbours.filter(rose_id__in=affected | changed).delete()
+        affected_positions = np.array(
+            sorted(positions[rose] for rose in affected if rose in positions),
+            dtype=np.int64,
+        )
+        for start in range(0, len(affected_positions), BLOCK_SIZE):
+            _store(ids, matrix, affected_positions[start : start + BLOCK_SIZE])
+
+
+def refresh_rose(rose_id):
+    """Update the neighbours after one rose was saved or deleted"""
+    refresh_roses({rose_id})
+
+
+def schedule_refresh(rose_id, listed=()):
+    """
+    Refresh the neighbours of a rose once the current transaction commits.
+
+    Roses scheduled in one transaction are refreshed together by its first
+    on_commit callback, the callbacks of later calls find nothing to do.
+    Every call registers one, so ids left by a rolled back transaction are
+    refreshed with the next commit.
+    """
+    if not hasattr(_scheduled, "rose_ids"):
+        _scheduled.rose_ids = set()
+        _scheduled.listed = set()
+    _scheduled.rose_ids.add(rose_id)
+    _scheduled.listed.update(listed)
+    transaction.on_commit(refresh_scheduled)
+
+
+def refresh_scheduled():
+    rose_ids = getattr(_scheduled, "rose_ids", None)
+    if not rose_ids:
+        return
+    listed = _scheduled.listed
+    _scheduled.rose_ids, _scheduled.listed = set(), set()
+    refresh_roses(rose_ids, listed)
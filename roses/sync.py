@@ -0,0 +1,282 @@
+"""
+Delta sync of the catalogue for mobile and partner clients.
+
+Saving or deleting a rose, an alternative name or a photo moves its
+CatalogueChange row to the end of the (updated, id) order once the
+transaction commits. A client keeps the watermark of the last change it
+received and asks for the changes after it, a page at a time, so a client
+synced yesterday downloads only what changed since.
+
+Changes younger than SETTLE_SECONDS are held back: rows written by
+transactions committing out of order could otherwise land behind a
+watermark already handed out.
+
+The same rows tell the in-memory indexes of every process, see
+CatalogueWatch, that another process changed the catalogue.
+"""
+import base64
+import json
+import time
+from datetime import timedelta
+from django.db import models, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import CatalogueChange, Rose, RoseAlternativeName, RosePhoto
+
+
+# changes returned per request
+PAGE_SIZE = 500
+
+# changes younger than this are not served yet
+SETTLE_SECONDS = 5
+
+# tombstones older than this are pruned, older watermarks need a full sync
+TOMBSTONE_DAYS = 90
+
+# Rose fields changed by counters rather than edits, not synced
+VOLATILE_FIELDS = ("total_user_likes",)
+
+# seconds an in-memory index waits before looking for changes again
+CHECK_SECONDS = 5
+
+MODELS = {
+    CatalogueChange.ROSE: Rose,
+    CatalogueChange.ALTERNATIVE_NAME: RoseAlternativeName,
+    CatalogueChange.PHOTO: RosePhoto,
+}
+
+
+class InvalidWatermark(Exception):
+    pass
+
+
+def record_changes(kind, object_ids, deleted=False):
+    """Mark objects as changed once the current transaction commits"""
+    object_ids = list(object_ids)
+    if object_ids:
+        transaction.on_commit(lambda: write_changes(kind, object_ids, deleted))
+
+
+def write_changes(kind, object_ids, deleted=False):
+    now = timezone.now()
+    CatalogueChange.objects.bulk_create(
+        [
+            CatalogueChange(
+                kind=kind, object_id=object_id, updated=now, deleted=deleted
+            )
+            for object_id in object_ids
+        ],
+        update_conflicts=True,
+        unique_fields=["kind", "object_id"],
+        update_fields=["updated", "deleted"],
+    )
+
+
+def record_rose_dependants(rose_id):
+    """(Un)publishing a rose changes what is synced of its names and photos"""
+    record_changes(
+        CatalogueChange.ALTERNATIVE_NAME,
+        RoseAlternativeName.objects.filter(rose_code=rose_id).values_list(
+            "id", flat=True
+        ),
+    )
+    record_changes(
+        CatalogueChange.PHOTO,
+        RosePhoto.objects.filter(rose_data=rose_id).values_list("id", flat=True),
+    )
+
+
+def catalogue_version():
+    """Time of the latest change, read from the end of the (updated, id) index"""
+    return CatalogueChange.objects.aggregate(latest=Max("updated"))["latest"]
+
+
+class CatalogueWatch:
+    """
+    Tells an in-memory index of the catalogue when to reload.
+
+    The signal handlers only update the index of the process saving a
+    change; the other processes notice it as a newer catalogue_version(),
+    looked up at most every check_seconds. With max_age the index is also
+    reloaded that often, for changes not recorded as CatalogueChange rows,
+    e.g. likes, or committed behind a newer one.
+    """
+
+    def __init__(self, check_seconds=CHECK_SECONDS, max_age=None):
+        self.check_seconds = check_seconds
+        self.max_age = max_age
+        self._version = None
+        self._loaded = None
+        self._checked = None
+
+    def loading(self):
+        """Call right before the index reads the catalogue"""
+        self._version = catalogue_version()
+        self._loaded = self._checked = time.monotonic()
+
+    def outdated(self):
+        if self._loaded is None:
+            return True
+        now = time.monotonic()
+        if self.max_age is not None and now - self._loaded >= self.max_age:
+            return True
+        if now - self._checked < self.check_seconds:
+            return False
+        self._checked = now
+        return catalogue_version() != self._version
+
+
+def backfill_changes():
+    """Record every existing object, e.g. before the first sync"""
+    total = 0
+    for kind, model in MODELS.items():
+        object_ids = list(model.objects.values_list("id", flat=True))
+        for start in range(0, len(object_ids), PAGE_SIZE):
+            write_changes(kind, object_ids[start : start + PAGE_SIZE])
+        total += len(object_ids)
+    return total
+
+
+def prune_tombstones(days=TOMBSTONE_DAYS):
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, counts = CatalogueChange.objects.filter(
+        deleted=True, updated__lt=cutoff
+    ).delete()
+    return deleted
+
+
+def encode_watermark(change):
+    data = json.dumps([change.updated.isoformat(), change.id])
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_watermark(watermark):
+    try:
+        padding = "=" * (-len(watermark) % 4)
+        updated, change_id = json.loads(base64.urlsafe_b64decode(watermark + padding))
+        updated = parse_datetime(updated)
+        if updated is None or not isinstance(change_id, int):
+            raise ValueError(watermark)
+    except (ValueError, TypeError) as error:
+        raise InvalidWatermark(watermark) from error
+    return updated, change_id
+
+
+def object_data(obj, exclude=()):
+    """Concrete fields of an object, translations included, as JSON values"""
+    data = {}
+    for field in obj._meta.concrete_fields:
+        if field.name in exclude:
+            continue
+        value = getattr(obj, field.attname)
+        if isinstance(field, models.FileField):
+            value = value.url if value else None
+        data[field.attname] = value
+    parler_meta = getattr(obj, "_parler_meta", None)
+    if parler_meta is not None:
+        fields = list(parler_meta.get_all_fields())
+        data["translations"] = {
+            translation.language_code: {
+                name: getattr(translation, name) for name in fields
+            }
+            for translation in obj.translations.all()
+        }
+    return data
+
+
+def load_objects(kind, object_ids):
+    """Published objects of one kind by id, one query per relation"""
+    if kind == CatalogueChange.ROSE:
+        objects = Rose.objects.filter(publish=True).prefetch_related(
+            "translations", "tags"
+        )
+    elif kind == CatalogueChange.ALTERNATIVE_NAME:
+        objects = RoseAlternativeName.objects.filter(
+            rose_code__publish=True
+        ).prefetch_related("translations")
+    else:
+        objects = RosePhoto.objects.filter(rose_data__publish=True)
+    return objects.in_bulk(object_ids)
+
+
+def serialize(kind, obj):
+    if kind == CatalogueChange.ROSE:
+        data = object_data(obj, VOLATILE_FIELDS)
+        data["tags"] = sorted(tag.name for tag in obj.tags.all())
+        return data
+    return object_data(obj)
+
+
+def changes_since(watermark=None, limit=PAGE_SIZE):
+    """
+    A page of changes after a watermark.
+
+    Args:
+        watermark (str): Watermark of the last received change, None for a
+            full sync.
+        limit (int): Changes per page.
+
+    Returns:
+        dict: "changes" in (updated, id) order, each with kind, id, updated,
+        deleted and the object "data" unless deleted; "watermark" to send
+        next time; "has_more" if another page is ready; "reset" if the
+        watermark was too old or invalid and the client must drop its data
+        and sync from scratch.
+    """
+    settled = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+    changes = CatalogueChange.objects.filter(updated__lte=settled)
+    reset = False
+    if watermark:
+        try:
+            updated, change_id = decode_watermark(watermark)
+        except InvalidWatermark:
+            updated, reset = None, True
+        if updated is not None:
+            if updated < timezone.now() - timedelta(days=TOMBSTONE_DAYS):
+                # tombstones of that time may be pruned already
+                reset = True
+            else:
+                changes = changes.filter(
+                    Q(updated__gt=updated) | Q(updated=updated, id__gt=change_id)
+                )
+    if reset:
+        watermark = None
+    if not watermark:
+        # a fresh client has nothing to delete
+        changes = changes.filter(deleted=False)
+
+    page = list(changes.order_by("updated", "id")[: limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    live = {}
+    for kind in MODELS:
+        object_ids = [
+            change.object_id
+            for change in page
+            if change.kind == kind and not change.deleted
+        ]
+        if object_ids:
+            live[kind] = load_objects(kind, object_ids)
+
+    results = []
+    for change in page:
+        obj = live.get(change.kind, {}).get(change.object_id)
+        # unpublished objects are gone as far as clients are concerned
+        deleted = change.deleted or obj is None
+        results.append(
+            {
+                "kind": change.kind,
+                "id": change.object_id,
+                "updated": change.updated,
+                "deleted": deleted,
+                "data": None if deleted else serialize(change.kind, obj),
+            }
+        )
+    return {
+        "changes": results,
+        "watermark": encode_watermark(page[-1]) if page else watermark,
+        "has_more": has_more,
+        "reset": reset,
+    }
@@ -0,0 +1,112 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+from easy_thumbnails.files import get_thumbnailer
+from roses.images import ENCODINGS, MIME_TYPES, image_srcset, manifest_of, square_srcset
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def srcset(image, image_format="jpeg"):
+    """
+    srcset of the responsive copies of an image.
+
+    Example:
+        <img src="{{ photo.picture.url }}" srcset="{% srcset photo.picture %}">
+    """
+    if not image:
+        return ""
+    return image_srcset(image, image_format)
+
+
+@register.simple_tag
+def picture(image, alt="", sizes="100vw", css_class=""):
+    """
+    <picture> offering the AVIF, WebP and JPEG copies of an image, so the
+    browser downloads the smallest file fitting the layout. The view reads
+    the copies with roses.images.attach_manifests(), otherwise the image
+    is shown as it is.
+
+    Example:
+        {% picture photo.picture alt=rose.name sizes="(max-width: 640px) 100vw, 33vw" %}
+    """
+    if not image:
+        return ""
+    manifest = manifest_of(getattr(image, "instance", None))
+    if not manifest:
+        # not processed yet or not attached
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy">',
+            image.url,
+            alt,
+            css_class,
+        )
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (MIME_TYPES[image_format], image_srcset(image, image_format), sizes)
+            for image_format in ENCODINGS
+            if image_format != "jpeg" and image_format in manifest["src"]
+        ),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" '
+        'alt="{}" class="{}" loading="lazy"></picture>',
+        sources,
+        image.url,
+        image_srcset(image, "jpeg"),
+        sizes,
+        manifest["w"],
+        manifest["h"],
+        alt,
+        css_class,
+    )
+
+
+@register.simple_tag
+def avatar(image, size=40, alt="", css_class=""):
+    """
+    Square crop of an image shown size pixels wide, e.g. a profile photo.
+    Images without crops yet, or whose crops the view did not read with
+    roses.images.attach_manifests(), get an easy_thumbnails crop.
+
+    Example:
+        {% avatar user.profile.photo 40 alt=user.get_full_name css_class="item-img" %}
+    """
+    if not image:
+        return ""
+    src, jpeg_srcset = square_srcset(image, size)
+    if src is None:
+        # not processed yet, not attached or not a registered model, crop
+        # it like {% thumbnail image "40x40" crop="100%" %} does
+        thumbnail = get_thumbnailer(image).get_thumbnail(
+            {"size": (size, size), "crop": "100%"}
+        )
+        return format_html(
+            '<img src="{}" width="{}" height="{}" alt="{}" class="{}" loading="lazy">',
+            thumbnail.url,
+            size,
+            size,
+            alt,
+            css_class,
+        )
+    sources = []
+    for image_format in ENCODINGS:
+        if image_format == "jpeg":
+            continue
+        url, format_srcset = square_srcset(image, size, image_format)
+        if url is not None:
+            sources.append((MIME_TYPES[image_format], format_srcset))
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" width="{}" height="{}" alt="{}" '
+        'class="{}" loading="lazy"></picture>',
+        format_html_join("", '<source type="{}" srcset="{}">', sources),
+        src,
+        jpeg_srcset,
+        size,
+        size,
+        alt,
+        css_class,
+    )
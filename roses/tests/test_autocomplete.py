@@ -0,0 +1,81 @@
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from roses import sync
+from roses.models import CatalogueChange, Rose, RoseAlternativeName
+from roses.autocomplete import NameTrie, completion_keys, rose_autocomplete
+from roses.tests.test_views import create_rose_objects
+
+
+class NameTrieTest(SimpleTestCase):
+    def setUp(self):
+        self.trie = NameTrie(limit=2)
+        self.peace = (-10, "Peace", 1, "peace")
+        self.pierre = (-30, "Pierre de Ronsard", 2, "pierre-de-ronsard")
+        self.pink = (-20, "Pink Peace", 3, "pink-peace")
+        for suggestion in (self.peace, self.pierre, self.pink):
+            for key in completion_keys(suggestion[1]):
+                self.trie.insert(key, suggestion)
+
+    def test_completion_keys_start_at_every_word(self):
+        self.assertEqual(completion_keys("Pink Peace"), ["pink peace", "peace"])
+
+    def test_prefix_is_ranked_by_likes(self):
+        self.assertEqual(self.trie.complete("P"), [self.pierre, self.pink])
+        self.assertEqual(self.trie.complete("pea"), [self.pink, self.peace])
+        self.assertEqual(self.trie.complete("ronsard"), [self.pierre])
+        self.assertEqual(self.trie.complete("rosa"), [])
+
+    def test_remove_restores_ranking(self):
+        for key in completion_keys(self.pierre[1]):
+            self.trie.remove(key, self.pierre)
+        self.assertEqual(self.trie.complete("p"), [self.pink, self.peace])
+        self.assertEqual(self.trie.complete("ronsard"), [])
+        self.assertNotIn("r", self.trie.root.children)
+
+
+class RoseAutocompleteTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.rose = create_rose_objects(1, self.user)[0]
+        self.rose.name = "Gloria Dei"
+        self.rose.save()
+        rose_autocomplete.load()
+
+    def test_lookup_does_not_query_database(self):
+        with self.assertNumQueries(0):
+            suggestions = rose_autocomplete.complete("glo", "en")
+        self.assertEqual(suggestions[0]["id"], self.rose.id)
+
+    def test_trie_follows_model_changes(self):
+        RoseAlternativeName.objects.create(rose_code=self.rose, name="Peace")
+        self.assertEqual(rose_autocomplete.complete("pea", "en")[0]["name"], "Peace")
+        self.rose.status = "draft"
+        self.rose.publish = False
+        self.rose.save()
+        self.assertEqual(rose_autocomplete.complete("glo", "en"), [])
+
+    def test_changes_of_other_processes_reload_trie(self):
+        # renamed without the signals of this process
+        Rose._parler_meta.root_model.objects.filter(master=self.rose).update(
+            name="Peace"
+        )
+        self.assertEqual(rose_autocomplete.complete("pea", "en"), [])
+        sync.write_changes(CatalogueChange.ROSE, [self.rose.id])
+        with mock.patch.object(rose_autocomplete._watch, "check_seconds", 0):
+            self.assertEqual(
+                rose_autocomplete.complete("pea", "en")[0]["id"], self.rose.id
+            )
+
+    def test_deleted_rose_is_removed(self):
+        self.rose.delete()
+        self.assertEqual(rose_autocomplete.complete("glo", "en"), [])
+
+    def test_autocomplete_view(self):
+        response = self.client.get(reverse("roses:rose-autocomplete"), {"q": "Gloria d"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["slug"], self.rose.slug)
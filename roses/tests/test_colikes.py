@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from roses.colikes import rebuild_co_liked_roses
+from roses.models import Rose, SimilarRose
+from roses.tests.test_views import create_rose_objects
+
+
+class CoLikedRosesTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.roses = create_rose_objects(4, self.user)
+        # create_rose_objects() makes Jill like every rose
+        self.user.roses_liked.clear()
+        Rose.objects.update(publish=True)
+        self.users = [
+            get_user_model().objects.create_user(username=f"user{i}", password="testpass123")
+            for i in range(3)
+        ]
+        # roses 0 and 1 are liked together by everybody, 2 only once with 0
+        for user in self.users:
+            user.roses_liked.add(self.roses[0], self.roses[1])
+        self.users[0].roses_liked.add(self.roses[2])
+
+    def also_liked(self, rose):
+        return list(
+            SimilarRose.objects.filter(rose=rose, kind=SimilarRose.CO_LIKES)
+            .order_by("rank")
+            .values_list("similar_id", flat=True)
+        )
+
+    def test_pairs_below_threshold_are_dropped(self):
+        rebuild_co_liked_roses()
+        self.assertEqual(self.also_liked(self.roses[0]), [self.roses[1].id])
+        self.assertEqual(self.also_liked(self.roses[2]), [])
+
+    def test_neighbours_ranked_by_similarity(self):
+        rebuild_co_liked_roses(min_co_likes=1)
+        self.assertEqual(self.also_liked(self.roses[0]), [self.roses[1].id, self.roses[2].id])
+        self.assertEqual(self.also_liked(self.roses[2]), [self.roses[0].id, self.roses[1].id])
+        self.assertEqual(self.also_liked(self.roses[3]), [])
+
+    def test_rebuild_keeps_attribute_neighbours(self):
+        SimilarRose.objects.create(rose=self.roses[0], similar=self.roses[3], rank=0, score=1)
+        rebuild_co_liked_roses()
+        self.assertTrue(
+            SimilarRose.objects.filter(kind=SimilarRose.ATTRIBUTES, rose=self.roses[0]).exists()
+        )
+
+    def test_liked_roses_recommendations(self):
+        rebuild_co_liked_roses()
+        self.user.roses_liked.add(self.roses[0])
+        self.client.login(username="Jill", password="testpass123")
+        response = self.client.get(reverse("roses_liked"))
+        self.assertEqual(list(response.context["recommended_roses"]), [self.roses[1]])
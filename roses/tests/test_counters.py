@@ -0,0 +1,52 @@
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from django.test import TestCase
+
+from roses.counters import ViewCounter
+from roses.models import Rose
+from roses.tests.test_views import create_rose_objects
+
+
+class ViewCounterTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.roses = create_rose_objects(3, self.user)
+        self.counter = ViewCounter(Rose, "post_views", interval=3600)
+        self.addCleanup(self.counter.stop)
+
+    def views(self):
+        return dict(Rose.objects.values_list("id", "post_views"))
+
+    def test_increments_are_buffered_until_flush(self):
+        before = self.views()
+        with self.assertNumQueries(0):
+            for rose in self.roses:
+                self.counter.increment(rose.id)
+            self.counter.increment(self.roses[0].id)
+        self.assertEqual(self.views(), before)
+        self.assertEqual(self.counter.pending(self.roses[0].id), 2)
+        # one UPDATE for the rose seen twice and one for the others, between
+        # SAVEPOINT and RELEASE inside the test transaction
+        with self.assertNumQueries(4):
+            self.assertEqual(self.counter.flush(), 3)
+        after = self.views()
+        self.assertEqual(after[self.roses[0].id], before[self.roses[0].id] + 2)
+        self.assertEqual(after[self.roses[1].id], before[self.roses[1].id] + 1)
+        self.assertEqual(self.counter.flush(), 0)
+
+    def test_single_update_needs_no_transaction(self):
+        for rose in self.roses:
+            self.counter.increment(rose.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.counter.flush(), 3)
+
+    def test_failed_flush_keeps_increments(self):
+        self.counter.increment(self.roses[0].id)
+        with mock.patch("django.db.models.QuerySet.update", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.counter.flush()
+        self.assertEqual(self.counter.pending(self.roses[0].id), 1)
+        self.assertEqual(self.counter.flush(), 1)
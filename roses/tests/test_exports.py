@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from roses.exports import export_lines, CSV
+from roses.models import RoseAlternativeName
+from roses.tests.test_views import create_rose_objects
+
+
+class CatalogueExportTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.roses = create_rose_objects(3, self.user)
+        self.roses[0].tags.add("climber", "apricot")
+        self.roses[2].tags.add("shrub")
+        self.roses[1].set_current_language("uk")
+        self.roses[1].name = "Троянда"
+        self.roses[1].save()
+        RoseAlternativeName.objects.create(rose_code=self.roses[0], name="Auscent")
+
+    def test_ndjson_rows_carry_translations_and_tags(self):
+        rows = [json.loads(line) for line in export_lines("roses", "en", chunk_size=2)]
+        self.assertEqual([row["id"] for row in rows], [rose.id for rose in self.roses])
+        self.assertEqual(rows[0]["name"], self.roses[0].name)
+        self.assertEqual(rows[0]["tags"], ["apricot", "climber"])
+        self.assertEqual(rows[1]["tags"], [])
+        self.assertEqual(rows[2]["tags"], ["shrub"])
+
+    def test_only_translated_objects_are_exported(self):
+        rows = [json.loads(line) for line in export_lines("roses", "uk")]
+        self.assertEqual(
+            [(row["id"], row["name"]) for row in rows], [(self.roses[1].id, "Троянда")]
+        )
+
+    def test_csv_export(self):
+        rows = list(csv.DictReader(export_lines("alternative-names", "en", CSV)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["name"], "Auscent")
+        self.assertEqual(rows[0]["rose_code_id"], str(self.roses[0].id))
+
+    def test_export_view_streams_for_staff_only(self):
+        url = reverse("roses:catalogue-export", kwargs={"name": "roses"})
+        url += "?format=csv"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        get_user_model().objects.filter(id=self.user.id).update(is_staff=True)
+        self.client.login(username="Jill", password="testpass123")
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(content)))), 3)
+        response = self.client.get(
+            reverse("roses:catalogue-export", kwargs={"name": "users"})
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_export_command(self):
+        out = io.StringIO()
+        call_command("export_catalogue", "articles", stdout=out)
+        self.assertEqual(out.getvalue(), "")
+        call_command("export_catalogue", "roses", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
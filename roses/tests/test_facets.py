@@ -0,0 +1,81 @@
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from roses import sync
+from roses.models import CatalogueChange, Rose
+from roses.facets import RoseFacetIndex, parse_filters
+from roses.tests.test_views import create_rose_objects
+
+
+class ParseFiltersTest(SimpleTestCase):
+    def test_ratings_and_landscape_fields(self):
+        query = QueryDict("aroma_strength=4&aroma_strength=5&health_rating=x&hedges=on&shade=0")
+        self.assertEqual(parse_filters(query), {"aroma_strength": [4, 5], "hedges": [True]})
+
+
+class RoseFacetIndexTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.roses = create_rose_objects(12, self.user)
+        self.index = RoseFacetIndex()
+        self.index.load()
+
+    def expected_ids(self, **filters):
+        roses = Rose.objects.filter(publish=True, **filters).order_by("-created")
+        return sorted(roses.values_list("id", flat=True))
+
+    def test_filters_match_database(self):
+        ids, counts = self.index.query({"aroma_strength": [3, 4], "hedges": [True]})
+        self.assertEqual(
+            sorted(ids.tolist()),
+            self.expected_ids(aroma_strength__in=[3, 4], hedges=True),
+        )
+
+    def test_facet_counts_ignore_own_filter(self):
+        ids, counts = self.index.query({"aroma_strength": [3]})
+        for value in range(1, 6):
+            self.assertEqual(
+                counts["aroma_strength"].get(value, 0),
+                len(self.expected_ids(aroma_strength=value)),
+            )
+        self.assertEqual(
+            counts["border"], len(self.expected_ids(aroma_strength=3, border=True))
+        )
+
+    def test_incremental_updates(self):
+        rose = self.roses[0]
+        rose.aroma_strength = 5
+        rose.hedges = True
+        self.index.update_rose(rose)
+        ids, counts = self.index.query({"aroma_strength": [5], "hedges": [True]})
+        self.assertIn(rose.id, ids.tolist())
+        self.index.remove_rose(rose.id)
+        ids, counts = self.index.query({})
+        self.assertNotIn(rose.id, ids.tolist())
+        self.assertEqual(len(ids), 11)
+
+    def test_changes_of_other_processes_reload_arrays(self):
+        rose = self.roses[0]
+        # saved without the signals of this process
+        Rose.objects.filter(id=rose.id).update(publish=False)
+        self.assertIn(rose.id, self.index.query({})[0].tolist())
+        sync.write_changes(CatalogueChange.ROSE, [rose.id])
+        with mock.patch.object(self.index._watch, "check_seconds", 0):
+            self.assertNotIn(rose.id, self.index.query({})[0].tolist())
+
+    def test_new_rows_grow_arrays(self):
+        self.roses += create_rose_objects(70, self.user)
+        for rose in self.roses:
+            self.index.update_rose(rose)
+        ids, counts = self.index.query({})
+        self.assertEqual(len(ids), 82)
+
+    def test_facets_view(self):
+        response = self.client.get(reverse("roses:roses-facets"), {"mildew": "2"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], len(self.expected_ids(mildew=2)))
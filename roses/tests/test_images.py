@@ -0,0 +1,181 @@
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from roses import images
+from roses.images import (
+    AVATAR_SIZES,
+    MAX_WIDTH,
+    ImageSpec,
+    available_formats,
+    pending_jobs,
+    process_image,
+    process_photo,
+)
+from roses.models import PhotoProcessing, RosePhoto
+from roses.tests.test_views import create_rose_objects
+
+
+def upload(width=1600, height=1000, name="upload.png"):
+    file = BytesIO()
+    Image.new("RGB", (width, height), color=(155, 0, 0)).save(file, "png")
+    return SimpleUploadedFile(name, file.getvalue(), content_type="image/png")
+
+
+# a registration keeping the stored file, like the one of profile photos
+KEPT = ImageSpec("picture", squares=AVATAR_SIZES, derivatives_only=True)
+
+
+class ProcessImageTest(TestCase):
+    def test_large_image_is_scaled_to_jpeg(self):
+        data = process_image(upload().read(), watermark=False)
+        img = Image.open(BytesIO(data))
+        self.assertEqual(img.format, "JPEG")
+        self.assertEqual(img.size, (MAX_WIDTH, 750))
+
+    def test_small_image_keeps_its_size(self):
+        data = process_image(upload(800, 600).read(), watermark=True)
+        self.assertEqual(Image.open(BytesIO(data)).size, (800, 600))
+
+    def test_copies_are_made_in_every_format(self):
+        formats = available_formats()
+        self.assertIn("webp", formats)
+        main, width, height, copies = process_photo(
+            upload().read(), False, (320, 640, 1600), (40,), formats
+        )
+        self.assertEqual((width, height), (MAX_WIDTH, 750))
+        sizes = {copy[:3] for copy in copies}
+        self.assertIn(("src", 320, "webp"), sizes)
+        self.assertIn(("src", 640, "jpeg"), sizes)
+        self.assertIn(("src", MAX_WIDTH, "webp"), sizes)
+        # the processed file is the full width JPEG, wider copies are skipped
+        self.assertNotIn(("src", MAX_WIDTH, "jpeg"), sizes)
+        self.assertNotIn(("src", 1600, "webp"), sizes)
+        crop = next(data for kind, size, image_format, data in copies if kind == "sq")
+        self.assertEqual(Image.open(BytesIO(crop)).size, (40, 40))
+        main, width, height, copies = process_photo(
+            upload().read(), False, (), (40,), formats, main=False
+        )
+        self.assertIsNone(main)
+        self.assertEqual({copy[0] for copy in copies}, {"sq"})
+
+
+@override_settings(IMAGE_PROCESSING_WORKERS=0)
+class PhotoProcessingTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.rose = create_rose_objects(1, self.user)[0]
+
+    def create_photo(self):
+        return RosePhoto.objects.create(
+            title="Upload",
+            alt_text="Upload",
+            rose_data=self.rose,
+            picture_author=self.user,
+            picture=upload(),
+        )
+
+    def test_upload_is_queued_until_commit(self):
+        photo = self.create_photo()
+        self.assertEqual(PhotoProcessing.status_of(photo), PhotoProcessing.PENDING)
+        self.assertEqual(
+            list(pending_jobs().values_list("object_id", flat=True)), [photo.id]
+        )
+
+    def test_started_job_is_not_lost(self):
+        photo = self.create_photo()
+        jobs = PhotoProcessing.objects.filter(object_id=photo.id)
+        jobs.update(updated=timezone.now() - timedelta(hours=1))
+        self.assertIsNotNone(images.start(jobs.get().id))
+        self.assertFalse(pending_jobs().exists())
+
+    @override_settings(IMAGE_PROCESSING_WORKERS=2)
+    def test_web_process_leaves_jobs_to_workers(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = self.create_photo()
+        self.assertEqual(PhotoProcessing.status_of(photo), PhotoProcessing.PENDING)
+        self.assertIsNone(images._executor)
+        photo.picture.delete(save=False)
+
+    @mock.patch.dict(images._specs, {RosePhoto: KEPT})
+    def test_derivatives_only_upload_is_kept(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = self.create_photo()
+        name = photo.picture.name
+        photo.refresh_from_db()
+        self.assertEqual(photo.picture.name, name)
+        job = PhotoProcessing.objects.get(object_id=photo.id)
+        self.assertEqual((job.status, job.result), (PhotoProcessing.DONE, name))
+        self.assertIn("webp", job.manifest["src"])
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.delete()
+        photo.picture.delete(save=False)
+
+    def test_processed_file_replaces_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = self.create_photo()
+        raw_name = photo.picture.name
+        photo.refresh_from_db()
+        self.assertEqual(PhotoProcessing.status_of(photo), PhotoProcessing.DONE)
+        self.assertNotEqual(photo.picture.name, raw_name)
+        self.assertTrue(photo.picture.name.endswith(".jpg"))
+        self.assertFalse(photo.picture.storage.exists(raw_name))
+        with photo.picture.open("rb") as file:
+            self.assertLessEqual(Image.open(file).width, MAX_WIDTH)
+
+        # saving other fields doesn't process the photo again
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.title = "Renamed"
+            photo.save()
+        job = PhotoProcessing.objects.get(object_id=photo.id)
+        self.assertEqual((job.status, job.attempts), (PhotoProcessing.DONE, 1))
+        photo.picture.delete(save=False)
+
+    def test_manifest_feeds_srcset_tags(self):
+        template = Template(
+            "{% load responsive_images %}"
+            '{% picture photo.picture alt="Rose" %}|{% avatar photo.picture 40 %}'
+        )
+        photo = self.create_photo()
+        # not processed yet, the upload is shown and cropped by easy_thumbnails
+        html = template.render(Context({"photo": photo}))
+        self.assertNotIn("<picture>", html)
+        avatar_html = html.split("|")[1]
+        self.assertNotIn(f'src="{photo.picture.url}"', avatar_html)
+        self.assertIn('width="40" height="40"', avatar_html)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = self.create_photo()
+        photo = RosePhoto.objects.get(id=photo.id)
+        job = PhotoProcessing.objects.get(object_id=photo.id)
+        self.assertEqual((job.manifest["w"], job.manifest["h"]), (MAX_WIDTH, 750))
+        self.assertEqual(
+            [size for size, name in job.manifest["sq"]["jpeg"]], list(AVATAR_SIZES)
+        )
+        # without attach_manifests() the tags don't query for the copies
+        plain = Template("{% load responsive_images %}{% picture photo.picture %}")
+        with self.assertNumQueries(0):
+            html = plain.render(Context({"photo": photo}))
+        self.assertNotIn("<picture>", html)
+        with self.assertNumQueries(1):
+            images.attach_manifests([photo])
+        with self.assertNumQueries(0):
+            html = template.render(Context({"photo": photo}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn("_320w.webp 320w", html)
+        self.assertIn(f"{photo.picture.url} {MAX_WIDTH}w", html)
+        self.assertIn("_80sq.jpg 2x", html)
+
+        files = [name for size, name in job.manifest["src"]["webp"]]
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.delete()
+        self.assertFalse(any(photo.picture.storage.exists(name) for name in files))
+        self.assertFalse(PhotoProcessing.objects.filter(object_id=photo.id).exists())
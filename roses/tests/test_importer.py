@@ -0,0 +1,119 @@
+import io
+import json
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from roses.importer import RoseImporter, read_csv, read_json_lines
+from roses.models import Rose, RoseAlternativeName, RoseLandscapeIdea
+from roses.search import search, ROSE
+
+
+def rose_record(number, **values):
+    record = {
+        "name": f"Imported Rose {number}",
+        "colour": "Apricot",
+        "color_category": "orange",
+        "description": "Imported in bulk",
+        "breeder": "Austin",
+        "breeder_company": "David Austin Roses",
+        "aroma": "Tea",
+        "rose_series": "English",
+        "parentage": "Seedling",
+        "name_origin": "Number",
+        "awards": "None",
+        "rose_class": "shrub",
+        "rose_subclass": "english",
+        "type": "modern",
+        "flowering": "repeat",
+        "flower_size": "large",
+        "flower_type": "double",
+        "flower_form": "cupped",
+        "flower_born": "clusters",
+        "growth_type": "bushy",
+        "height": "120",
+        "width": "90",
+        "climate_zones": "5",
+        "foliage_colour": "green",
+        "foliage_size": "medium",
+        "foliage_surface": "matt",
+        "foliage_texture": "leathery",
+        "aroma_strength": "4",
+        "status": "published",
+    }
+    record.update(values)
+    return record
+
+
+def csv_file(records):
+    columns = list(dict.fromkeys(key for record in records for key in record))
+    lines = [",".join(columns)]
+    for record in records:
+        lines.append(",".join(f'"{record.get(column, "")}"' for column in columns))
+    return io.StringIO("\n".join(lines) + "\n")
+
+
+class RoseImporterTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+
+    def test_csv_rows_are_imported_with_related_objects(self):
+        records = [
+            rose_record(
+                1,
+                **{"name:uk": "Троянда", "tags": "shrub, english", "border": "True"},
+                alternative_names="Auscent; Apricot Dream",
+            ),
+            rose_record(2, tags="shrub"),
+        ]
+        result = RoseImporter(author=self.user).run(read_csv(csv_file(records)))
+        self.assertEqual(result.imported, 2)
+        self.assertEqual(result.errors, [])
+
+        rose = Rose.objects.language("uk").get(id=result.rose_ids[0])
+        self.assertEqual(rose.name, "Троянда")
+        self.assertEqual(
+            rose.safe_translation_getter("name", language_code="en"), "Imported Rose 1"
+        )
+        self.assertTrue(rose.publish)
+        self.assertEqual(rose.post_author, self.user)
+        self.assertTrue(rose.slug.startswith("imported-rose-1-"))
+        self.assertEqual(sorted(rose.tags.names()), ["english", "shrub"])
+        self.assertEqual(
+            sorted(
+                RoseAlternativeName.objects.language("en")
+                .filter(rose_code=rose)
+                .values_list("translations__name", flat=True)
+            ),
+            ["Apricot Dream", "Auscent"],
+        )
+        self.assertTrue(
+            RoseLandscapeIdea.objects.filter(rose=rose, idea="border").exists()
+        )
+        self.assertIn((ROSE, rose.id), search("imported rose", "en"))
+
+    def test_invalid_records_are_reported_and_skipped(self):
+        lines = [
+            json.dumps(rose_record(1)),
+            json.dumps(rose_record(2, aroma_strength="9")),
+            json.dumps(rose_record(3, unknown_field="x")),
+            json.dumps({"translations": {"uk": {"name": "Без назви"}}}),
+        ]
+        result = RoseImporter().run(read_json_lines(io.StringIO("\n".join(lines))))
+        self.assertEqual(result.imported, 1)
+        self.assertEqual([number for number, message in result.errors], [2, 3, 4])
+
+    def test_chunk_costs_same_queries_whatever_its_size(self):
+        def import_queries(count, offset):
+            records = [rose_record(offset + i, tags="shrub") for i in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                RoseImporter(index=False).run(records)
+            return len(queries)
+
+        # the first import creates the tag
+        import_queries(1, 0)
+        self.assertEqual(import_queries(2, 100), import_queries(20, 200))
+        self.assertEqual(Rose.objects.count(), 23)
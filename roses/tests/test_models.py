@@ -11,10 +11,12 @@ from django.template.defaultfilters import slugify
 # from account.forms import UserRegistrationForm
 from roses.models import (
     Rose,
+    RoseLandscapeIdea,
     RoseAlternativeName,
     RosePhoto,
     RoseYoutubeVideo,
     RoseComment,
+    RoseCommentPath,
 )
 
 # Rose model tests
@@ -564,3 +566,181 @@ class RoseCommentTest(TestCase):
             str(new_comment),
             f"Comment by {new_comment.comment_author} on {new_comment.rose_post}",
         )
+
+
+class RoseLandscapeIdeaTest(TestCase):
+    def setUp(self):
+        from roses.tests.test_views import create_rose_objects
+
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.rose = create_rose_objects(1, self.user)[0]
+        self.rose.hedges = True
+        self.rose.pergola = False
+        self.rose.save()
+
+    def test_memberships_follow_rose_fields(self):
+        ideas = RoseLandscapeIdea.objects.filter(rose=self.rose)
+        self.assertIn("hedges", ideas.values_list("idea", flat=True))
+        self.assertNotIn("pergola", ideas.values_list("idea", flat=True))
+        self.rose.hedges = False
+        self.rose.pergola = True
+        self.rose.save()
+        self.assertNotIn("hedges", ideas.values_list("idea", flat=True))
+        self.assertIn("pergola", ideas.values_list("idea", flat=True))
+
+    def test_unpublished_rose_has_no_memberships(self):
+        self.rose.publish = False
+        self.rose.status = "draft"
+        self.rose.save()
+        self.assertFalse(RoseLandscapeIdea.objects.filter(rose=self.rose).exists())
+
+    def test_counts_are_cached_and_invalidated(self):
+        counts = RoseLandscapeIdea.idea_counts()
+        self.assertEqual(counts["hedges"], 1)
+        with self.assertNumQueries(0):
+            RoseLandscapeIdea.idea_counts()
+        self.rose.hedges = False
+        self.rose.save()
+        self.assertNotIn("hedges", RoseLandscapeIdea.idea_counts())
+
+
+class RoseCardsTest(TestCase):
+    def setUp(self):
+        from roses.tests.test_views import create_rose_objects, picture_path
+
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.roses = create_rose_objects(12, self.user, "hybrid")
+        for rose in self.roses[:6]:
+            RosePhoto.objects.create(
+                title="Main photo",
+                alt_text="Main photo",
+                rose_data=rose,
+                picture_author=self.user,
+                picture=picture_path,
+                main_picture=True,
+            )
+
+    def test_cards_cost_fixed_number_of_queries(self):
+        # roses joined with their main picture, translations and tags
+        with self.assertNumQueries(3):
+            cards = list(Rose.objects.as_cards("en").order_by("id"))
+            for rose in cards:
+                rose.name
+                rose.get_main_picture()
+                list(rose.tags.all())
+        self.assertEqual(len(cards), 12)
+        # the first six roses got a main photo in setUp
+        self.assertEqual(
+            [rose.get_main_picture() is not None for rose in cards],
+            [True] * 6 + [False] * 6,
+        )
+
+    def test_main_photo_follows_photos(self):
+        rose = self.roses[0]
+        rose.refresh_from_db()
+        photo = rose.main_photo
+        self.assertIsNotNone(photo)
+        photo.main_picture = False
+        photo.save()
+        rose.refresh_from_db()
+        self.assertIsNone(rose.get_main_picture())
+        photo.main_picture = True
+        photo.save()
+        rose.refresh_from_db()
+        self.assertEqual(rose.get_main_picture(), photo)
+        photo.delete()
+        rose.refresh_from_db()
+        self.assertIsNone(rose.main_photo)
+
+    def test_likers_of_a_page_are_sampled_in_one_query(self):
+        users = [
+            get_user_model().objects.create_user(username=f"user{i}", password="testpass123")
+            for i in range(5)
+        ]
+        # create_rose_objects() makes Jill like every rose
+        for rose in self.roses[:3]:
+            rose.users_like.clear()
+        self.roses[0].users_like.add(*users)
+        self.roses[1].users_like.add(users[0])
+        cards = list(Rose.objects.order_by("id")[:3])
+        with self.assertNumQueries(1):
+            Rose.attach_likers(cards)
+            likers = [rose.get_followed_users_likes() for rose in cards]
+        self.assertEqual(len(likers[0]), 2)
+        self.assertEqual(len(set(likers[0])), 2)
+        self.assertTrue(set(likers[0]) <= set(users))
+        self.assertEqual(likers[1], [users[0]])
+        self.assertEqual(likers[2], [])
+
+
+class RoseCommentPathTest(TestCase):
+    def setUp(self):
+        from roses.tests.test_views import create_rose_objects
+
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.rose = create_rose_objects(1, self.user)[0]
+        self.first = self.comment()
+        self.reply = self.comment(self.first)
+        self.nested = self.comment(self.reply)
+        self.second = self.comment()
+        self.late_reply = self.comment(self.first)
+
+    def comment(self, parent=None):
+        return RoseComment.objects.create(
+            rose_post=self.rose, comment_author=self.user, body="Comment", parent=parent
+        )
+
+    def thread(self):
+        return [
+            (row.comment_id, row.depth, row.reply_count)
+            for row in RoseCommentPath.objects.filter(rose=self.rose).order_by("path")
+        ]
+
+    def test_paths_list_threads_depth_first(self):
+        self.assertEqual(
+            self.thread(),
+            [
+                (self.first.id, 0, 2),
+                (self.reply.id, 1, 1),
+                (self.nested.id, 2, 0),
+                (self.late_reply.id, 1, 0),
+                (self.second.id, 0, 0),
+            ],
+        )
+        self.assertTrue(
+            self.nested.thread_path.path.startswith(self.reply.thread_path.path)
+        )
+
+    def test_deleted_reply_updates_parent_count(self):
+        self.late_reply.delete()
+        self.assertEqual(RoseCommentPath.objects.get(comment=self.first).reply_count, 1)
+
+    def test_rebuild_restores_paths(self):
+        expected = self.thread()
+        RoseCommentPath.objects.all().delete()
+        self.assertEqual(RoseCommentPath.rebuild(), 5)
+        self.assertEqual(self.thread(), expected)
+
+    def test_threads_are_paged_by_top_level_comment(self):
+        from roses.loaders import comment_tree, load_comment_threads
+
+        with self.assertNumQueries(2):
+            page, comments = load_comment_threads(self.rose, per_page=1)
+        self.assertEqual(
+            [comment.id for comment in comments],
+            [self.first.id, self.reply.id, self.nested.id, self.late_reply.id],
+        )
+        self.assertEqual(comment_tree(comments), (self.first,))
+        self.assertEqual(
+            [reply.id for reply in self.first.replies_list],
+            [self.reply.id, self.late_reply.id],
+        )
+        page, comments = load_comment_threads(self.rose, page.next_cursor, per_page=1)
+        self.assertEqual([comment.id for comment in comments], [self.second.id])
+        self.assertFalse(page.has_next())
@@ -0,0 +1,137 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from roses.models import Rose
+from roses.pagination import (
+    CountedPaginator,
+    KeysetPaginator,
+    count_cache_key,
+    COUNT_ESTIMATE,
+    COUNT_NONE,
+)
+from roses.tests.test_views import create_rose_objects
+
+
+class KeysetPaginatorTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.roses = create_rose_objects(25, self.user)
+        # give some roses the same timestamp so ties are broken by id
+        created = timezone.now() - timedelta(days=1)
+        Rose.objects.filter(id__in=[rose.id for rose in self.roses[:6]]).update(
+            created=created
+        )
+        self.ordered = list(Rose.objects.order_by("-created", "-id"))
+        self.paginator = KeysetPaginator(Rose.objects.all(), 10, ("-created", "-id"))
+
+    def test_pages_follow_the_ordering(self):
+        page = self.paginator.page()
+        self.assertFalse(page.has_previous())
+        collected = list(page)
+        while page.has_next():
+            page = self.paginator.page(page.next_cursor)
+            collected.extend(page)
+        self.assertEqual(collected, self.ordered)
+        self.assertEqual(len(page), 5)
+
+    def test_previous_cursor_returns_previous_page(self):
+        second = self.paginator.page(self.paginator.page().next_cursor)
+        third = self.paginator.page(second.next_cursor)
+        self.assertEqual(list(self.paginator.page(third.previous_cursor)), list(second))
+        first = self.paginator.page(second.previous_cursor)
+        self.assertEqual(list(first), self.ordered[:10])
+        self.assertFalse(first.has_previous())
+
+    def test_cursor_keeps_microseconds(self):
+        rose = self.ordered[0]
+        rose.created = rose.created.replace(microsecond=123456)
+        cursor = self.paginator.encode_cursor(rose, "next")
+        self.assertEqual(
+            self.paginator.decode_cursor(cursor), ("next", [rose.created, rose.id])
+        )
+
+    def test_annotations_can_be_ordered_by(self):
+        roses = Rose.objects.filter(translations__language_code="en").annotate(
+            translated_name=F("translations__name")
+        )
+        paginator = KeysetPaginator(roses, 10, ("translated_name", "id"))
+        page = paginator.page()
+        collected = list(page)
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            collected.extend(page)
+        self.assertEqual(collected, list(roses.order_by("translated_name", "id")))
+
+    def test_invalid_cursor_delivers_first_page(self):
+        for cursor in ("not-a-cursor", "W10", "WyJuZXh0IiwgWyJ4Il1d"):
+            self.assertEqual(list(self.paginator.page(cursor)), self.ordered[:10])
+
+    def test_cursor_out_of_range_delivers_last_page(self):
+        cursor = self.paginator.encode_cursor(self.ordered[-1], "next")
+        page = self.paginator.page(cursor)
+        self.assertEqual(list(page), self.ordered[-10:])
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+
+    def test_roses_list_view_keyset_mode(self):
+        Rose.objects.update(publish=True)
+        response = self.client.get(reverse("roses:roses-list"), {"cursor": ""})
+        self.assertEqual(response.status_code, 200)
+        roses = response.context["roses"]
+        self.assertTrue(roses.keyset)
+        self.assertEqual(len(roses), 12)
+        response = self.client.get(
+            reverse("roses:roses-list"), {"cursor": roses.next_cursor}
+        )
+        self.assertEqual(list(response.context["roses"]), self.ordered[12:24])
+
+
+class CountedPaginatorTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.roses = create_rose_objects(25, self.user)
+        Rose.objects.update(publish=True)
+
+    def published(self):
+        return Rose.objects.filter(publish=True).order_by("-created", "-id")
+
+    def test_cached_count_is_reused(self):
+        key = count_cache_key("roses", "en", None)
+        self.assertEqual(CountedPaginator(self.published(), 12, count_key=key).count, 25)
+        with self.assertNumQueries(0):
+            paginator = CountedPaginator(self.published(), 12, count_key=key)
+            self.assertEqual(paginator.num_pages, 3)
+
+    def test_unpublishing_clears_cached_count(self):
+        key = count_cache_key("roses", "en", None)
+        CountedPaginator(self.published(), 12, count_key=key).count
+        rose = self.roses[0]
+        rose.status = "draft"
+        rose.publish = False
+        rose.save()
+        key = count_cache_key("roses", "en", None)
+        self.assertEqual(CountedPaginator(self.published(), 12, count_key=key).count, 24)
+
+    def test_estimate_falls_back_to_exact_count(self):
+        paginator = CountedPaginator(self.published(), 12, COUNT_ESTIMATE)
+        self.assertEqual(paginator.count, 25)
+
+    def test_uncounted_pages(self):
+        paginator = CountedPaginator(self.published(), 12, COUNT_NONE)
+        with self.assertNumQueries(1):
+            page = paginator.page(2)
+            self.assertTrue(page.has_next())
+            # as pagination.html uses them
+            self.assertEqual(page.next_page_number(), 3)
+            self.assertEqual(page.previous_page_number(), 1)
+            self.assertEqual((page.start_index(), page.end_index()), (13, 24))
+        self.assertFalse(paginator.page(3).has_next())
+        self.assertEqual(len(paginator.page(3)), 1)
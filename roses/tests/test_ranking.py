@@ -0,0 +1,63 @@
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+from django.urls import reverse
+
+from roses.models import Rose
+from roses.ranking import LocalRanking, RedisRanking
+from roses.tests.test_views import create_rose_objects
+
+
+class LocalRankingTest(TestCase):
+    def setUp(self):
+        self.ranking = LocalRanking(size=3)
+        self.ranking.clear()
+
+    def test_top_follows_increments(self):
+        for rose_id, views in ((1, 5), (2, 3), (3, 8), (4, 1)):
+            self.ranking.incr(rose_id, views)
+        self.assertEqual(self.ranking.top(3), [3, 1, 2])
+        self.ranking.incr(4, 10)
+        self.assertEqual(self.ranking.top(3), [4, 3, 1])
+        self.assertEqual(self.ranking.top(5), [4, 3, 1, 2])
+
+    def test_removed_and_decreased_roses_are_replaced(self):
+        for rose_id, views in ((1, 5), (2, 3), (3, 8), (4, 1)):
+            self.ranking.incr(rose_id, views)
+        self.ranking.remove(3)
+        self.assertEqual(self.ranking.top(3), [1, 2, 4])
+        self.ranking.incr(1, -5)
+        self.assertEqual(self.ranking.top(3), [2, 4, 1])
+
+    @mock.patch.dict("sys.modules", {"redis": None})
+    def test_redis_backend_without_redis_package(self):
+        with self.assertRaises(ImproperlyConfigured):
+            RedisRanking()
+
+    def test_scores_are_seeded_from_post_views(self):
+        user = get_user_model().objects.create_user(username="Jill", password="testpass123")
+        roses = create_rose_objects(4, user)
+        Rose.objects.update(publish=True, post_views=0)
+        Rose.objects.filter(id=roses[2].id).update(post_views=100)
+        ranking = LocalRanking(size=3)
+        self.assertEqual(ranking.top(1), [roses[2].id])
+
+
+class HomeRankingTest(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="Jill", password="testpass123")
+        self.roses = create_rose_objects(12, user)
+        Rose.objects.update(publish=True)
+        self.ranking = LocalRanking()
+        self.ranking.clear()
+        for views, rose in enumerate(self.roses):
+            self.ranking.incr(rose.id, views)
+
+    def test_home_serves_ranked_roses(self):
+        with mock.patch("roses.views.get_ranking", return_value=self.ranking):
+            response = self.client.get(reverse("home"))
+        self.assertEqual(
+            [rose.id for rose in response.context["roses"]],
+            [rose.id for rose in self.roses[::-1][:9]],
+        )
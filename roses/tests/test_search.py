@@ -0,0 +1,207 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from roses.models import Rose, RoseAlternativeName, RoseNameIndex
+from roses.search import (
+    search,
+    search_catalogue,
+    similar,
+    similar_catalogue,
+    first_letter,
+    letter_counts,
+    sort_key,
+    tokenize,
+    transliterate,
+    transliterated,
+    trigrams,
+    ROSE,
+    ALTERNATIVE_NAME,
+)
+from roses.tests.test_views import create_rose_objects
+
+
+class TokenizeTest(TestCase):
+    def test_tokenize_strips_punctuation(self):
+        self.assertEqual(tokenize('Mme "Meilland", Peace!'), ["mme", "meilland", "peace"])
+        self.assertEqual(tokenize("  "), [])
+
+    def test_trigrams_are_padded_like_pg_trgm(self):
+        self.assertEqual(trigrams("Rosa"), {"  r", " ro", "ros", "osa", "sa "})
+        self.assertEqual(trigrams("!!"), set())
+
+    def test_first_letter_buckets(self):
+        self.assertEqual(first_letter("'Éclair'"), "E")
+        self.assertEqual(first_letter("Юліана"), "Ю")
+        self.assertEqual(first_letter("Ёлка"), "Е")
+        self.assertEqual(first_letter("1000 Islands"), "#")
+
+    def test_sort_key_follows_alphabets(self):
+        names = ["Яна", "Eden Rose", "Ґрейс", "Edens", "Гортензія", "Eden", "Ірина", "Иван"]
+        self.assertEqual(
+            sorted(names, key=sort_key),
+            ["Eden", "Eden Rose", "Edens", "Гортензія", "Ґрейс", "Иван", "Ірина", "Яна"],
+        )
+        self.assertTrue(sort_key("Eden").isdigit())
+
+
+class FullTextIndexTest(TestCase):
+    def setUp(self):
+        # create test user for Rose objects creation
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.rose = create_rose_objects(1, self.user)[0]
+        self.rose.name = "Gloria Dei"
+        self.rose.description = "Legendary hybrid tea with yellow blooms"
+        self.rose.save()
+        self.alternative_name = RoseAlternativeName.objects.create(
+            rose_code=self.rose,
+            name="Madame Meilland",
+        )
+
+    def test_rose_is_found_by_name_and_description(self):
+        self.assertIn((ROSE, self.rose.id), search("gloria", "en"))
+        self.assertIn((ROSE, self.rose.id), search("legendary blooms", "en"))
+
+    def test_prefix_query_matches(self):
+        self.assertIn((ALTERNATIVE_NAME, self.alternative_name.id), search("meill", "en"))
+
+    def test_name_ranks_above_description(self):
+        other = create_rose_objects(1, self.user)[0]
+        other.name = "Yellow Submarine"
+        other.save()
+        hits = search("yellow", "en")
+        self.assertEqual(hits[0], (ROSE, other.id))
+        self.assertIn((ROSE, self.rose.id), hits)
+
+    def test_updated_translation_is_reindexed(self):
+        self.rose.name = "Peace"
+        self.rose.save()
+        self.assertNotIn((ROSE, self.rose.id), search("gloria", "en"))
+        self.assertIn((ROSE, self.rose.id), search("peace", "en"))
+
+    def test_deleted_objects_are_removed(self):
+        self.alternative_name.delete()
+        self.assertEqual(search("meilland", "en"), [])
+        rose_id = self.rose.id
+        self.rose.delete()
+        self.assertNotIn((ROSE, rose_id), search("gloria", "en"))
+
+    def test_search_catalogue_returns_published_objects(self):
+        results = search_catalogue("gloria meilland", "en")
+        self.assertEqual(results, [])
+        results = search_catalogue("meilland", "en")
+        self.assertEqual(results, [self.alternative_name])
+        Rose.objects.filter(id=self.rose.id).update(publish=False)
+        self.assertEqual(search_catalogue("meilland", "en"), [])
+
+
+class TrigramSimilarityTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.rose = create_rose_objects(1, self.user)[0]
+        self.rose.name = "Pierre de Ronsard"
+        self.rose.save()
+        self.alternative_name = RoseAlternativeName.objects.create(
+            rose_code=self.rose,
+            name="Meilland",
+        )
+
+    def test_misspelled_name_is_found(self):
+        self.assertEqual(search("meiland", "en"), [])
+        self.assertEqual(similar("Meiland", "en")[0], (ALTERNATIVE_NAME, self.alternative_name.id))
+        self.assertIn((ROSE, self.rose.id), similar("Pier de Ronsar", "en"))
+
+    def test_unrelated_name_is_not_found(self):
+        self.assertEqual(similar("Gloria", "en"), [])
+
+    def test_misspelled_query_in_search_results_view(self):
+        response = self.client.get(reverse("roses:roses-search-results") + "?q=Meiland")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["fuzzy"])
+        self.assertEqual(list(response.context["roses"]), similar_catalogue("Meiland", "en"))
+
+    def test_blank_query_redirects_to_roses_list(self):
+        for query in ("", "   "):
+            response = self.client.get(reverse("roses:roses-search-results"), {"q": query})
+            self.assertRedirects(response, reverse("roses:roses-list"))
+
+
+class TransliterationTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.rose = create_rose_objects(1, self.user)[0]
+        self.rose.name = "Gloria Dei"
+        self.rose.save()
+        self.alternative_name = RoseAlternativeName.objects.create(
+            rose_code=self.rose,
+            name="Мейланд",
+        )
+
+    def test_transliterate_matches_both_scripts(self):
+        self.assertEqual(transliterate("Мейланд"), "meiland")
+        self.assertEqual(transliterate("Meilland"), "meiland")
+        self.assertEqual(transliterate("Глорія Дей"), transliterate("Gloria Dei"))
+        self.assertEqual(transliterate("Пʼєр"), "pier")
+
+    def test_keys_are_stored_for_every_word(self):
+        keys = RoseNameIndex.objects.filter(rose=self.rose, alternative_name=None)
+        self.assertIn("gloria dei", keys.values_list("search_key", flat=True))
+        self.assertIn("dei", keys.values_list("search_key", flat=True))
+
+    def test_cyrillic_query_finds_latin_name(self):
+        self.assertIn((ROSE, self.rose.id), transliterated("Глорія"))
+        self.assertIn((ROSE, self.rose.id), transliterated("Дей"))
+
+    def test_latin_query_finds_cyrillic_name(self):
+        self.assertEqual(
+            transliterated("Meill"), [(ALTERNATIVE_NAME, self.alternative_name.id)]
+        )
+        self.assertIn(self.alternative_name, search_catalogue("Meilland", "en"))
+
+    def test_keys_follow_renamed_rose(self):
+        self.rose.name = "Pierre de Ronsard"
+        self.rose.save()
+        self.assertEqual(transliterated("Глорія"), [])
+        self.assertIn((ROSE, self.rose.id), transliterated("Пʼєр"))
+
+
+class LetterIndexTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.rose = create_rose_objects(1, self.user)[0]
+        self.rose.name = "Gloria Dei"
+        self.rose.save()
+        self.alternative_name = RoseAlternativeName.objects.create(
+            rose_code=self.rose,
+            name="Garden Party",
+        )
+
+    def test_only_whole_names_are_bucketed(self):
+        rows = RoseNameIndex.objects.filter(rose=self.rose).exclude(first_letter="")
+        self.assertEqual(
+            sorted(rows.values_list("name", "first_letter")),
+            [("Garden Party", "G"), ("Gloria Dei", "G")],
+        )
+
+    def test_letter_counts_are_cached(self):
+        counts = letter_counts("en")
+        self.assertEqual(counts["G"], 2)
+        with self.assertNumQueries(0):
+            letter_counts("en")
+        self.alternative_name.delete()
+        self.assertEqual(letter_counts("en")["G"], 1)
+
+    def test_alphabet_view_lists_letter_in_order(self):
+        response = self.client.get(reverse("roses:roses-alphabet", kwargs={"letter": "g"}))
+        self.assertEqual(response.status_code, 200)
+        names = [row.name for row in response.context["names"]]
+        self.assertEqual(names, ["Garden Party", "Gloria Dei"])
+        self.assertIn(("G", 2), response.context["letters"])
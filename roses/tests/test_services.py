@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from roses.models import Rose
+from roses.services import like_rose, unlike_rose
+from roses.tests.test_views import create_rose_objects
+
+
+class RoseLikeTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.rose = create_rose_objects(1, self.user)[0]
+        # create_rose_objects() makes Jill like the rose
+        unlike_rose(self.user, self.rose)
+
+    def likes(self):
+        return Rose.objects.values_list("total_user_likes", "updated").get(id=self.rose.id)
+
+    def test_like_is_idempotent_and_keeps_updated(self):
+        _, updated = self.likes()
+        self.assertTrue(like_rose(self.user, self.rose))
+        self.assertFalse(like_rose(self.user, self.rose))
+        self.assertEqual(self.likes(), (1, updated))
+        self.assertIn(self.user, self.rose.users_like.all())
+
+    def test_unlike_is_idempotent(self):
+        like_rose(self.user, self.rose)
+        self.assertTrue(unlike_rose(self.user, self.rose))
+        self.assertFalse(unlike_rose(self.user, self.rose))
+        self.assertEqual(self.likes()[0], 0)
+
+    def test_m2m_changes_recount_likes(self):
+        other = get_user_model().objects.create_user(username="Sam", password="testpass123")
+        self.rose.users_like.add(self.user, other)
+        self.assertEqual(self.likes()[0], 2)
+        other.roses_liked.clear()
+        self.assertEqual(self.likes()[0], 1)
+
+    def test_like_view(self):
+        url = reverse("roses:rose-like")
+        self.assertEqual(self.client.post(url, {"id": self.rose.id, "action": "like"}).status_code, 302)
+        self.client.login(username="Jill", password="testpass123")
+        response = self.client.post(url, {"id": self.rose.id, "action": "like"})
+        self.assertJSONEqual(response.content, {"status": "ok", "likes": 1})
+        response = self.client.post(url, {"id": self.rose.id, "action": "unlike"})
+        self.assertJSONEqual(response.content, {"status": "ok", "likes": 0})
+        response = self.client.post(url, {"id": 0, "action": "like"})
+        self.assertJSONEqual(response.content, {"status": "error"})
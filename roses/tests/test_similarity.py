@@ -0,0 +1,122 @@
+import numpy as np
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from roses.models import Rose, SimilarRose, LANDSCAPE_FIELDS
+from roses.similarity import (
+    feature_matrix,
+    nearest_neighbours,
+    rebuild_similar_roses,
+    refresh_rose,
+    refresh_roses,
+    rose_attributes,
+    CATEGORY_FIELDS,
+    RATING_FIELDS,
+)
+from roses.tests.test_views import create_rose_objects
+
+
+# every attribute read by roses.similarity
+FIELDS = [*CATEGORY_FIELDS, *RATING_FIELDS, *LANDSCAPE_FIELDS]
+
+
+class NearestNeighboursTest(TestCase):
+    def test_neighbours_are_sorted_and_exclude_self(self):
+        matrix = np.array([[1, 0], [0.9, 0.1], [0, 1], [0.1, 0.9]], dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        neighbours, scores = nearest_neighbours(matrix, np.arange(4), k=2)
+        self.assertEqual(neighbours[:, 0].tolist(), [1, 0, 3, 2])
+        self.assertTrue((scores[:, 0] >= scores[:, 1]).all())
+
+    def test_feature_rows_are_normalized(self):
+        rows = [
+            {"rose_class": "Shrub", "aroma_strength": 5, "hedges": True},
+            {"rose_class": "shrub ", "aroma_strength": 1, "hedges": False},
+            {},
+        ]
+        matrix = feature_matrix([{**dict.fromkeys(FIELDS), **row} for row in rows])
+        self.assertTrue(np.allclose(np.linalg.norm(matrix[:2], axis=1), 1))
+        self.assertGreater(matrix[0] @ matrix[1], 0)
+
+
+class SimilarRoseTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        self.roses = create_rose_objects(4, self.user)
+        classes = ["Climber", "Climber", "Hybrid Tea", "Hybrid Tea"]
+        for rose, rose_class in zip(self.roses, classes):
+            # the roses differ only by class
+            for field in FIELDS:
+                setattr(rose, field, 1 if field in RATING_FIELDS else "")
+            for field in LANDSCAPE_FIELDS:
+                setattr(rose, field, False)
+            rose.rose_class = rose_class
+            rose.rose_subclass = rose_class
+            rose.publish = True
+            rose.save()
+
+    def neighbours(self, rose):
+        return list(
+            SimilarRose.objects.filter(rose=rose)
+            .order_by("rank")
+            .values_list("similar_id", flat=True)
+        )
+
+    def test_rebuild_stores_closest_roses_first(self):
+        self.assertEqual(rebuild_similar_roses(), 4)
+        self.assertEqual(self.neighbours(self.roses[0])[0], self.roses[1].id)
+        self.assertEqual(self.neighbours(self.roses[2])[0], self.roses[3].id)
+
+    def test_refresh_updates_affected_roses(self):
+        rebuild_similar_roses()
+        rose = self.roses[1]
+        rose.rose_class = "Hybrid Tea"
+        rose.rose_subclass = "Hybrid Tea"
+        rose.save()
+        # the other roses come from the cache filled by the rebuild
+        with mock.patch(
+            "roses.similarity.rose_attributes", wraps=rose_attributes
+        ) as load:
+            refresh_rose(rose.id)
+        load.assert_called_once_with({rose.id})
+        self.assertIn(self.neighbours(rose)[0], [self.roses[2].id, self.roses[3].id])
+        self.assertIn(self.neighbours(self.roses[2])[1], [self.roses[3].id, rose.id])
+        self.assertEqual(len(self.neighbours(self.roses[0])), 3)
+
+    def test_rose_saved_elsewhere_is_reloaded(self):
+        rebuild_similar_roses()
+        # e.g. saved by another worker, whose cache this one does not share
+        Rose.objects.filter(id=self.roses[1].id).update(
+            rose_class="Hybrid Tea", updated=timezone.now()
+        )
+        with mock.patch(
+            "roses.similarity.rose_attributes", wraps=rose_attributes
+        ) as load:
+            refresh_rose(self.roses[0].id)
+        load.assert_called_once_with({self.roses[0].id, self.roses[1].id})
+
+    def test_deleted_rose_is_replaced(self):
+        rebuild_similar_roses()
+        rose_id = self.roses[1].id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.roses[1].delete()
+        self.assertEqual(len(self.neighbours(self.roses[0])), 2)
+        self.assertFalse(SimilarRose.objects.filter(similar_id=rose_id).exists())
+
+    def test_roses_saved_together_are_refreshed_once(self):
+        rebuild_similar_roses()
+        with mock.patch(
+            "roses.similarity.refresh_roses", wraps=refresh_roses
+        ) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                for rose in self.roses[:2]:
+                    rose.rose_class = "Hybrid Tea"
+                    rose.save()
+        refresh.assert_called_once()
+        saved = {rose.id for rose in self.roses[:2]}
+        self.assertTrue(saved <= refresh.call_args.args[0])
+        self.assertEqual(self.neighbours(self.roses[0])[0], self.roses[1].id)
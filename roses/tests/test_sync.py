@@ -0,0 +1,94 @@
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from roses.models import CatalogueChange, Rose, RoseAlternativeName
+from roses.sync import changes_since, encode_watermark
+from roses.tests.test_views import create_rose_objects
+
+
+@mock.patch("roses.sync.SETTLE_SECONDS", 0)
+class CatalogueSyncTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="Jill", email="jill@example.com", password="testpass123"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.roses = create_rose_objects(3, self.user)
+            self.roses[0].tags.add("climber")
+            self.alternative_name = RoseAlternativeName.objects.create(
+                rose_code=self.roses[0], name="Auscent"
+            )
+
+    def sync_all(self, watermark=None, limit=2):
+        changes = []
+        while True:
+            page = changes_since(watermark, limit)
+            changes += page["changes"]
+            watermark = page["watermark"]
+            if not page["has_more"]:
+                return changes, watermark
+
+    def test_full_sync_pages_every_object_once(self):
+        changes, watermark = self.sync_all()
+        self.assertEqual(
+            sorted((change["kind"], change["id"]) for change in changes),
+            sorted(
+                [(CatalogueChange.ROSE, rose.id) for rose in self.roses]
+                + [(CatalogueChange.ALTERNATIVE_NAME, self.alternative_name.id)]
+            ),
+        )
+        rose = next(change for change in changes if change["id"] == self.roses[0].id)
+        self.assertEqual(rose["data"]["tags"], ["climber"])
+        self.assertEqual(
+            rose["data"]["translations"]["en"]["name"], self.roses[0].name
+        )
+        self.assertEqual(changes_since(watermark)["changes"], [])
+
+    def test_delta_holds_only_changes_and_tombstones(self):
+        changes, watermark = self.sync_all()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.roses[1].name = "Renamed"
+            self.roses[1].save()
+            rose_id = self.roses[2].id
+            self.roses[2].delete()
+        page = changes_since(watermark)
+        self.assertEqual(
+            [(change["id"], change["deleted"]) for change in page["changes"]],
+            [(self.roses[1].id, False), (rose_id, True)],
+        )
+        self.assertEqual(
+            page["changes"][0]["data"]["translations"]["en"]["name"], "Renamed"
+        )
+        self.assertIsNone(page["changes"][1]["data"])
+
+    def test_unpublished_rose_is_synced_as_deleted(self):
+        changes, watermark = self.sync_all()
+        with self.captureOnCommitCallbacks(execute=True):
+            # Rose.save() publishes roses whose status is "published"
+            Rose.objects.get(id=self.roses[0].id).save(update_fields=["publish"])
+            Rose.objects.filter(id=self.roses[0].id).update(publish=False)
+        page = changes_since(watermark)
+        self.assertEqual(
+            sorted((change["kind"], change["deleted"]) for change in page["changes"]),
+            [(CatalogueChange.ALTERNATIVE_NAME, True), (CatalogueChange.ROSE, True)],
+        )
+
+    def test_invalid_or_expired_watermark_resets(self):
+        self.assertTrue(changes_since("not-a-watermark")["reset"])
+        change = CatalogueChange.objects.first()
+        change.updated = change.updated.replace(year=2000)
+        self.assertTrue(changes_since(encode_watermark(change))["reset"])
+        self.assertFalse(changes_since()["reset"])
+
+    def test_sync_view(self):
+        response = self.client.get(reverse("roses:catalogue-sync") + "?limit=1")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data["changes"]), 1)
+        self.assertTrue(data["has_more"])
+        response = self.client.get(
+            reverse("roses:catalogue-sync"), {"watermark": data["watermark"]}
+        )
+        self.assertEqual(len(response.json()["changes"]), 3)
@@ -0,0 +1,66 @@
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+from django.urls import reverse
+
+from roses.models import Rose
+from roses.trending import LocalTrending, RedisTrending
+from roses.tests.test_views import create_rose_objects
+
+
+HOUR = 3600
+
+
+class LocalTrendingTest(TestCase):
+    def setUp(self):
+        self.now = 1000 * HOUR
+        self.trending = LocalTrending(half_life=1, window=6, clock=lambda: self.now)
+
+    def test_recent_activity_beats_older_activity(self):
+        for _ in range(5):
+            self.trending.record_view(1)
+        self.now += 2 * HOUR
+        # five views two half-lives ago weigh less than a like now, but more
+        # than a view now
+        self.trending.record_like(2)
+        self.trending.record_view(3)
+        self.assertEqual(self.trending.top(3), [2, 1, 3])
+        self.now += HOUR
+        self.trending.record_view(3)
+        self.assertEqual(self.trending.top(3), [2, 3, 1])
+
+    def test_buckets_outside_window_are_dropped(self):
+        self.trending.record_like(1)
+        self.now += 6 * HOUR
+        self.trending.record_view(2)
+        self.assertEqual(self.trending.top(3), [2])
+
+    @mock.patch.dict("sys.modules", {"redis": None})
+    def test_redis_backend_without_redis_package(self):
+        with self.assertRaises(ImproperlyConfigured):
+            RedisTrending()
+
+    def test_removed_rose_is_not_trending(self):
+        self.trending.record_like(1)
+        self.trending.record_view(2)
+        self.trending.remove(1)
+        self.assertEqual(self.trending.top(3), [2])
+        self.now += HOUR
+        self.assertEqual(self.trending.top(3), [2])
+
+
+class TrendingViewTest(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="Jill", password="testpass123")
+        self.roses = create_rose_objects(3, user)
+        Rose.objects.update(publish=True)
+        self.trending = LocalTrending()
+        self.trending.record_like(self.roses[1].id)
+        self.trending.record_view(self.roses[2].id)
+
+    def test_trending_api(self):
+        with mock.patch("roses.views.get_trending", return_value=self.trending):
+            response = self.client.get(reverse("roses:roses-trending-api"))
+        ids = [rose["id"] for rose in response.json()["results"]]
+        self.assertEqual(ids, [self.roses[1].id, self.roses[2].id])
@@ -3,7 +3,9 @@ from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse, resolve
 from taggit.managers import TaggableManager
 from taggit.models import Tag
@@ -12,12 +14,16 @@ from faker import Faker
 # from account.forms import UserRegistrationForm
 from roses.models import Rose, RoseAlternativeName, RosePhoto, RoseYoutubeVideo, RoseComment
 from roses.views import roses
+from roses.loaders import load_rose_detail
 from library.tests.test_views import create_plant_data, create_issue_type_data,\
       create_article_category_data, create_article_data
 
 
 fake = Faker()
 
+# queries the rose detail page may cost, however many related objects it has
+DETAIL_QUERY_BUDGET = 15
+
 
 def create_rose_objects(num_objects, user_obj, tags_obj=None):
     """
@@ -433,8 +439,63 @@ class RoseViewTests(TestCase):
         # )
         # comment.save()
 
+    # write the view count in the test thread instead of a timer thread
+    @override_settings(VIEW_COUNTER_FLUSH_INTERVAL=0)
     def test_rose_detail_view_page(self):
-        pass
+        response = self.client.get(self.rose.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["rose"], self.rose)
+
+    def add_photos_and_comments(self, count):
+        create_rose_pic_objects(count, self.rose, self.user)
+        create_rose_video_objects(count, self.user, self.rose)
+        for _ in range(count):
+            comment = RoseComment.objects.create(
+                rose_post=self.rose, comment_author=self.user, body=fake.sentence()
+            )
+            RoseComment.objects.create(
+                rose_post=self.rose,
+                comment_author=self.user,
+                body=fake.sentence(),
+                parent=comment,
+            )
+
+    def test_rose_detail_loader_query_budget(self):
+        self.add_photos_and_comments(2)
+        with CaptureQueriesContext(connection) as queries:
+            detail = load_rose_detail(self.rose_slug, "en")
+        self.assertLessEqual(len(queries), DETAIL_QUERY_BUDGET)
+        self.assertEqual(len(detail.alternative_names), 15)
+        self.assertEqual(len(detail.comments), 2)
+        self.assertEqual(len(detail.comments[0].replies_list), 1)
+
+        # more related objects don't cost more queries
+        budget = len(queries)
+        self.add_photos_and_comments(10)
+        with CaptureQueriesContext(connection) as queries:
+            detail = load_rose_detail(self.rose_slug, "en")
+            for comment in detail.comments:
+                comment.comment_author
+                [reply.comment_author for reply in comment.replies_list]
+        self.assertEqual(len(queries), budget)
+        self.assertEqual(len(detail.comments), 12)
+
+    # write the view count in the test thread instead of a timer thread
+    @override_settings(VIEW_COUNTER_FLUSH_INTERVAL=0)
+    def test_rose_detail_page_query_budget(self):
+        # the whole request, template tags of photos and comments included
+        self.add_photos_and_comments(2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.rose.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), DETAIL_QUERY_BUDGET)
+
+        budget = len(queries)
+        self.add_photos_and_comments(10)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.rose.get_absolute_url())
+        self.assertEqual(len(queries), budget)
+        self.assertEqual(len(response.context["comments"]), 12)
 
 
 
@@ -454,9 +515,24 @@ class LandscapeIdeasViewTest(TestCase):
         self.assertContains(response, "Select  category")
 
 
-    # def test_lanscape_ideas_with_ideas_context(self):
-    #     idea = "border"
-    #     response = self.client.get(
-    #         reverse("roses:landscape-ideas", kwargs={"idea": idea})
-    #     )
-    #     self.assertEqual(response.status_code, 200)
+    def test_lanscape_ideas_with_ideas_context(self):
+        idea = "border"
+        response = self.client.get(
+            reverse("roses:landscape-ideas", kwargs={"idea": idea})
+        )
+        self.assertEqual(response.status_code, 200)
+        border_roses = Rose.objects.filter(publish=True, border=True)
+        self.assertEqual(response.context["idea_counts"].get(idea, 0), border_roses.count())
+        self.assertEqual(
+            len(response.context["roses"]), min(12, border_roses.count())
+        )
+        # roses are listed newest first
+        first = border_roses.order_by("-created", "-id").first()
+        if first:
+            self.assertEqual(response.context["roses"][0], first)
+
+    def test_landscape_ideas_unknown_idea(self):
+        response = self.client.get(
+            reverse("roses:landscape-ideas", kwargs={"idea": "swimming_pool"})
+        )
+        self.assertEqual(response.status_code, 404)
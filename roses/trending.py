@@ -0,0 +1,201 @@
+"""
+Trending roses.
+
+Views and likes are counted in hourly buckets. The trending score of a rose
+is the sum of its bucket counts with exponential time decay: an event of
+hour h weighs 2 ** ((h - now) / half_life). Buckets older than the window
+are dropped. The buckets are kept by the backend set in
+settings.ROSE_TRENDING_BACKEND:
+
+    "roses.trending.RedisTrending": Redis sorted sets shared by all workers,
+        which survive restarts; needs the redis package.
+    "roses.trending.LocalTrending": buckets held in the process, for single
+        worker setups and tests.
+"""
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .ranking import LocalRanking, TOP_SIZE, redis_client
+
+
+# hours after which an event counts half
+HALF_LIFE_HOURS = 12
+# hours of buckets kept
+WINDOW_HOURS = 72
+
+VIEW_WEIGHT = 1
+LIKE_WEIGHT = 5
+
+TRENDING_KEY = "rose_trending"
+# seconds the decayed top list of RedisTrending is reused
+TOP_SECONDS = 60
+
+
+class LocalTrending:
+    """
+    Buckets held in the process.
+
+    Scores use forward decay: an event of hour h adds
+    weight * 2 ** ((h - epoch) / half_life) to the score, where epoch is a
+    fixed landmark hour. Older events never have to be discounted again, so
+    every event is a single increment of a sorted top list. When the hour
+    changes, buckets older than the window are dropped and the scores are
+    rebuilt from the remaining buckets for a new epoch, which keeps the
+    weights small.
+    """
+
+    def __init__(
+        self,
+        size=TOP_SIZE,
+        half_life=HALF_LIFE_HOURS,
+        window=WINDOW_HOURS,
+        clock=time.time,
+    ):
+        self.half_life = half_life
+        self.window = window
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._ranking = LocalRanking(size)
+        self._ranking.clear()
+        # hour -> Counter(rose_id -> weight)
+        self._buckets = {}
+        self._hour = None
+        self._epoch = None
+
+    def _decay(self, hour):
+        return 2 ** ((hour - self._epoch) / self.half_life)
+
+    def _advance(self):
+        """Move to the current hour, rebuilding the scores when it changed"""
+        hour = int(self.clock() // 3600)
+        if hour == self._hour:
+            return hour
+        self._hour = hour
+        self._epoch = hour - self.window
+        self._buckets = {
+            bucket_hour: counts
+            for bucket_hour, counts in self._buckets.items()
+            if bucket_hour > self._epoch
+        }
+        scores = Counter()
+        for bucket_hour, counts in self._buckets.items():
+            decay = self._decay(bucket_hour)
+            for rose_id, weight in counts.items():
+                scores[rose_id] += weight * decay
+        self._ranking.reset(scores)
+        return hour
+
+    def record(self, rose_id, weight):
+        with self._lock:
+            hour = self._advance()
+            self._buckets.setdefault(hour, Counter())[rose_id] += weight
+            self._ranking.incr(rose_id, weight * self._decay(hour))
+
+    def record_view(self, rose_id):
+        self.record(rose_id, VIEW_WEIGHT)
+
+    def record_like(self, rose_id):
+        self.record(rose_id, LIKE_WEIGHT)
+
+    def remove(self, rose_id):
+        """Forget an unpublished or deleted rose"""
+        with self._lock:
+            for counts in self._buckets.values():
+                counts.pop(rose_id, None)
+            self._ranking.remove(rose_id)
+
+    def top(self, count):
+        """Ids of the trending roses, hottest first"""
+        with self._lock:
+            self._advance()
+            return self._ranking.top(count)
+
+
+class RedisTrending:
+    """
+    Buckets kept in Redis sorted sets, one per hour, shared by all workers.
+
+    Every event is one ZINCRBY on the bucket of its hour, which expires once
+    it leaves the window. The top list is the union of the buckets weighted
+    by their decay, stored for TOP_SECONDS so a page costs one ZRANGE.
+    """
+
+    def __init__(
+        self,
+        key=TRENDING_KEY,
+        half_life=HALF_LIFE_HOURS,
+        window=WINDOW_HOURS,
+        clock=time.time,
+    ):
+        self.key = key
+        self.half_life = half_life
+        self.window = window
+        self.clock = clock
+        self.redis = redis_client()
+
+    def _hour(self):
+        return int(self.clock() // 3600)
+
+    def _bucket(self, hour):
+        return f"{self.key}:{hour}"
+
+    def _top_key(self, hour):
+        return f"{self.key}:top:{hour}"
+
+    def _hours(self, hour):
+        """Hours of the buckets in the window"""
+        return range(hour - self.window + 1, hour + 1)
+
+    def record(self, rose_id, weight):
+        bucket = self._bucket(self._hour())
+        with self.redis.pipeline() as pipe:
+            pipe.zincrby(bucket, weight, rose_id)
+            pipe.expire(bucket, (self.window + 1) * 3600)
+            pipe.execute()
+
+    def record_view(self, rose_id):
+        self.record(rose_id, VIEW_WEIGHT)
+
+    def record_like(self, rose_id):
+        self.record(rose_id, LIKE_WEIGHT)
+
+    def remove(self, rose_id):
+        """Forget an unpublished or deleted rose"""
+        hour = self._hour()
+        with self.redis.pipeline() as pipe:
+            for bucket_hour in self._hours(hour):
+                pipe.zrem(self._bucket(bucket_hour), rose_id)
+            pipe.zrem(self._top_key(hour), rose_id)
+            pipe.execute()
+
+    def top(self, count):
+        """Ids of the trending roses, hottest first"""
+        hour = self._hour()
+        top_key = self._top_key(hour)
+        if not self.redis.exists(top_key):
+            weights = {
+                self._bucket(bucket_hour): 2 ** ((bucket_hour - hour) / self.half_life)
+                for bucket_hour in self._hours(hour)
+            }
+            with self.redis.pipeline() as pipe:
+                pipe.zunionstore(top_key, weights)
+                pipe.expire(top_key, TOP_SECONDS)
+                pipe.execute()
+        ranked = self.redis.zrange(top_key, 0, count - 1, desc=True)
+        return [int(rose_id) for rose_id in ranked]
+
+
+_trending = None
+
+
+def get_trending():
+    """The trending backend set in settings.ROSE_TRENDING_BACKEND"""
+    global _trending
+    if _trending is None:
+        backend = getattr(
+            settings, "ROSE_TRENDING_BACKEND", "roses.trending.LocalTrending"
+        )
+        _trending = import_string(backend)()
+    return _trending
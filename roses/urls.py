@@ -0,0 +1,28 @@
+from django.urls import path
+from . import views
+
+app_name = "roses"
+
+urlpatterns = [
+    path("roses/latest/", views.roses_list, name="roses-list"),
+    path("roses/tag/<slug:tag_slug>/", views.roses_list, name="roses-list-by-tag"),
+    path(
+        "roses/search/results/",
+        views.roses_search_results,
+        name="roses-search-results",
+    ),
+    path("roses/alphabet/", views.roses_alphabet, name="roses-alphabet"),
+    path("roses/alphabet/<str:letter>/", views.roses_alphabet, name="roses-alphabet"),
+    path("roses/autocomplete/", views.rose_autocomplete, name="rose-autocomplete"),
+    path("roses/facets/", views.roses_facets, name="roses-facets"),
+    path("roses/like/", views.rose_like, name="rose-like"),
+    path("roses/trending/", views.trending_roses, name="roses-trending"),
+    path("roses/trending/api/", views.trending_roses_api, name="roses-trending-api"),
+    path("roses/export/<str:name>/", views.catalogue_export, name="catalogue-export"),
+    path("roses/sync/", views.catalogue_sync, name="catalogue-sync"),
+    path("rose/<slug:slug>/", views.rose_detail, name="rose-detail"),
+    path("landscape-ideas/", views.landscape_ideas, name="landscape-ideas"),
+    path(
+        "landscape-ideas/<str:idea>/", views.landscape_ideas, name="landscape-ideas"
+    ),
+]
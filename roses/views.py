@@ -1,20 +1,32 @@
-import redis
 from itertools import chain
 from django.conf import settings
-from django.http import HttpResponseRedirect, JsonResponse
+from django.http import (
+    HttpResponseRedirect,
+    JsonResponse,
+    Http404,
+    StreamingHttpResponse,
+)
 from django.urls import reverse
 from django.views.decorators.http import require_POST
 from django.db.models import Count, Q, F
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.core.mail import send_mail
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.utils.translation import gettext_lazy as _
 from rest_framework import viewsets
 from actions.utils import create_action
-from .models import Rose, RoseComment, RosePhoto
+from .models import (
+    Rose,
+    RoseComment,
+    RosePhoto,
+    RoseLandscapeIdea,
+    RoseNameIndex,
+    LANDSCAPE_FIELDS,
+)
 from library.models import Article
 from .serializers import UserSerializer, RoseSerializer, RoseAlternativeNameSerializer
 from .forms import (
@@ -28,34 +40,112 @@ from .forms import (
 from taggit.models import Tag
 from .filters import RoseFilters, RoseDescriptionFilters
 from .utils import resize_photo
+from .exports import EXPORTS, FORMATS, NDJSON, export_lines
+from .sync import changes_since, PAGE_SIZE as SYNC_PAGE_SIZE
+from .search import (
+    search_catalogue,
+    similar_catalogue,
+    letter_counts,
+    LATIN_ALPHABET,
+    UKRAINIAN_ALPHABET,
+    OTHER_LETTER,
+)
+from .autocomplete import rose_autocomplete as autocomplete_index
+from .facets import rose_facets, parse_filters
+from .services import like_rose, unlike_rose
+from .counters import rose_views
+from .ranking import get_ranking
+from .trending import get_trending
+from .loaders import load_rose_detail
+from .pagination import KnownCountPaginator, count_cache_key, paginate
 
 
-# # connect to redispup
-# r = redis.Redis(host=settings.REDIS_HOST,
-#                 port=settings.REDIS_PORT,
-#                 db=settings.REDIS_DB)
+# number of roses on the home page
+HOME_ROSES = 9
 
 
 def home(request):
-    # get rose ranking dictionary
-    rose_ranking = r.zrange('rose_ranking', 0, -1, desc=True)[:9]
-    rose_ranking_ids = [int(id) for id in rose_ranking]
-    # get 10 most viewed roses
-    # roses = Rose.objects.filter(id__in=rose_ranking_ids)
-    roses = Rose.objects.filter(publish=True).order_by("-post_views")[:9]
+    roses = Rose.objects.as_cards(request.LANGUAGE_CODE).filter(publish=True)
+    # most viewed roses from the ranking store, in ranking order
+    ranked_ids = get_ranking().top(HOME_ROSES)
+    ranked = sorted(
+        roses.filter(id__in=ranked_ids), key=lambda rose: ranked_ids.index(rose.id)
+    )
+    if len(ranked) < HOME_ROSES:
+        # the ranking is not filled yet, e.g. after a Redis restart
+        ranked = roses.order_by("-post_views")[:HOME_ROSES]
+    roses = ranked
     # get latest 3 articles
     articles = Article.objects.filter(publish=True).all()[:3]
     context = {"roses": roses, "articles": articles}
     return render(request, "roses/home.html", context)
 
 
+# number of roses on the trending page
+TRENDING_ROSES = 12
+
+
+def get_trending_roses(language, count=TRENDING_ROSES):
+    """Published trending roses as cards, hottest first"""
+    ranked_ids = get_trending().top(count)
+    roses = Rose.objects.as_cards(language).filter(publish=True, id__in=ranked_ids)
+    return sorted(roses, key=lambda rose: ranked_ids.index(rose.id))
+
+
+# roses viewed and liked most in the last hours
+def trending_roses(request):
+    context = {"roses": get_trending_roses(request.LANGUAGE_CODE)}
+    return render(request, "roses/post/trending.html", context)
+
+
+def trending_roses_api(request):
+    roses = [
+        {
+            "id": rose.id,
+            "name": rose.name,
+            "slug": rose.slug,
+            "likes": rose.total_user_likes,
+            "url": rose.get_absolute_url(),
+        }
+        for rose in get_trending_roses(request.LANGUAGE_CODE)
+    ]
+    return JsonResponse({"results": roses})
+
+
+def catalogue_sync(request):
+    """
+    Changes of the catalogue after ?watermark=, see roses.sync. Clients
+    repeat the request with the returned watermark while has_more is true.
+    """
+    try:
+        limit = min(int(request.GET.get("limit", SYNC_PAGE_SIZE)), SYNC_PAGE_SIZE)
+    except ValueError:
+        limit = SYNC_PAGE_SIZE
+    return JsonResponse(changes_since(request.GET.get("watermark"), max(limit, 1)))
+
+
+@staff_member_required
+def catalogue_export(request, name):
+    """Stream an export, e.g. ?language=uk&format=csv"""
+    language = request.GET.get("language", request.LANGUAGE_CODE)
+    file_format = request.GET.get("format", NDJSON)
+    languages = [code for code, language_name in settings.LANGUAGES]
+    if name not in EXPORTS or file_format not in FORMATS or language not in languages:
+        raise Http404
+    response = StreamingHttpResponse(
+        export_lines(name, language, file_format), content_type=FORMATS[file_format]
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="{name}-{language}.{file_format}"'
+    )
+    return response
+
+
 # list of all roses chronologically
 def roses_list(request, tag_slug=None):
     language = request.LANGUAGE_CODE
 
-    roses_object = (
-        Rose.objects.language(language).filter(publish=True).order_by("-created")
-    )
+    roses_object = Rose.objects.as_cards(language).filter(publish=True)
 
     # filter rose_objects by tags if tag provided
     tag = None
@@ -63,8 +153,84 @@ def roses_list(request, tag_slug=None):
         tag = get_object_or_404(Tag, slug=tag_slug)
         roses_object = roses_object.filter(publish=True, tags__in=[tag])
 
-    # paginate objects
-    paginator = Paginator(roses_object, 12)
+    # paginate objects, ?cursor= switches to keyset pages
+    page = request.GET.get("page")
+    count_key = count_cache_key("roses", language, tag_slug)
+    roses = paginate(request, roses_object, 12, ("-created", "-id"), count_key)
+    # "liked by" avatars of the whole page in one query
+    Rose.attach_likers(roses)
+    context = {"page": page, "roses": roses, "tag": tag}
+    return render(request, "roses/post/roses_list.html", context)
+
+
+# like or unlike a rose, called by javascript
+@login_required
+@require_POST
+def rose_like(request):
+    rose_id = request.POST.get("id")
+    action = request.POST.get("action")
+    if rose_id and action in ("like", "unlike"):
+        try:
+            rose = Rose.objects.get(id=rose_id)
+        except (Rose.DoesNotExist, ValueError):
+            return JsonResponse({"status": "error"})
+        if action == "like":
+            if like_rose(request.user, rose):
+                create_action(request.user, _("likes"), rose)
+        else:
+            unlike_rose(request.user, rose)
+        likes = Rose.objects.values_list("total_user_likes", flat=True).get(id=rose.id)
+        return JsonResponse({"status": "ok", "likes": likes})
+    return JsonResponse({"status": "error"})
+
+
+# rose description page
+def rose_detail(request, slug):
+    try:
+        detail = load_rose_detail(
+            slug, request.LANGUAGE_CODE, request.GET.get("comments")
+        )
+    except Rose.DoesNotExist:
+        raise Http404
+    rose = detail.rose
+    # buffered and written to Rose.post_views in batches
+    rose_views.increment(rose.id)
+    if rose.publish:
+        get_ranking().incr(rose.id)
+        get_trending().record_view(rose.id)
+
+    context = {
+        "rose": rose,
+        "detail": detail,
+        "comments": detail.comments,
+        "comments_page": detail.comments_page,
+        "comment_form": RoseCommentForm(),
+        "pictures": detail.pictures,
+        "videos": detail.videos,
+        "tags": detail.tags,
+        "alternative_names": detail.alternative_names,
+        # precomputed by roses.similarity and roses.colikes
+        "similar_roses": detail.similar_roses,
+        "also_liked_roses": detail.also_liked_roses,
+    }
+    return render(request, "roses/post/rose_detail.html", context)
+
+
+# search roses and alternative names through the full-text index
+def roses_search_results(request):
+    query = request.GET.get("q", "")
+    if not query.strip():
+        return redirect("roses:roses-list")
+    language = request.LANGUAGE_CODE
+
+    # ranked Rose and RoseAlternativeName objects
+    results = search_catalogue(query, language)
+    # nothing matched literally, the name might be misspelled
+    fuzzy = not results
+    if fuzzy:
+        results = similar_catalogue(query, language)
+
+    paginator = Paginator(results, 20)
     page = request.GET.get("page")
     try:
         roses = paginator.page(page)
@@ -74,5 +240,94 @@ def roses_list(request, tag_slug=None):
     except EmptyPage:
         # if page is out of reange deliver the last page
         roses = paginator.page(paginator.num_pages)
-    context = {"page": page, "roses": roses, "tag": tag}
-    return render(request, "roses/post/roses_list.html", context)
+    context = {"page": page, "roses": roses, "query": query, "fuzzy": fuzzy}
+    return render(request, "roses/search/roses_search_results.html", context)
+
+
+# typeahead suggestions, answered from the in-memory trie
+def rose_autocomplete(request):
+    prefix = request.GET.get("q", "")
+    suggestions = autocomplete_index.complete(prefix, request.LANGUAGE_CODE)
+    return JsonResponse({"results": suggestions})
+
+
+# number of matching roses and live facet counts for the catalogue filters
+def roses_facets(request):
+    ids, counts = rose_facets.query(parse_filters(request.GET))
+    return JsonResponse({"count": len(ids), "facets": counts})
+
+
+# roses suitable for a landscape idea, e.g. hedges or containers
+def landscape_ideas(request, idea=None):
+    language = request.LANGUAGE_CODE
+    # number of roses per idea for the category selector
+    idea_counts = RoseLandscapeIdea.idea_counts()
+
+    page = request.GET.get("page")
+    roses = None
+    if idea:
+        if idea not in LANDSCAPE_FIELDS:
+            raise Http404
+        rose_ids = (
+            RoseLandscapeIdea.objects.filter(idea=idea)
+            .order_by("-created", "-rose_id")
+            .values_list("rose_id", flat=True)
+        )
+        # the page counts itself, on the (idea, created) index, so its page
+        # numbers stay exact while the selector counts may lag
+        paginator = Paginator(rose_ids, 12)
+        try:
+            roses = paginator.page(page)
+        except PageNotAnInteger:
+            # If page is not an integer deliver only the first page
+            roses = paginator.page(1)
+        except EmptyPage:
+            # if page is out of reange deliver the last page
+            roses = paginator.page(paginator.num_pages)
+        # load only the roses of the current page
+        found = Rose.objects.language(language).in_bulk(list(roses.object_list))
+        roses.object_list = [found[id] for id in roses.object_list if id in found]
+
+    context = {
+        "idea": idea,
+        "ideas": LANDSCAPE_FIELDS,
+        "idea_counts": idea_counts,
+        "roses": roses,
+        "page": page,
+    }
+    return render(request, "roses/pages/landscape_ideas.html", context)
+
+
+# rose and alternative names listed by their first letter
+def roses_alphabet(request, letter=None):
+    language = request.LANGUAGE_CODE
+    alphabet = LATIN_ALPHABET
+    if language == "uk":
+        # Ukrainian names first, variety names are often left in Latin
+        alphabet = UKRAINIAN_ALPHABET + LATIN_ALPHABET
+    counts = letter_counts(language)
+    letters = [(char, counts.get(char, 0)) for char in alphabet + OTHER_LETTER]
+
+    page = request.GET.get("page")
+    names = None
+    if letter:
+        letter = letter.upper()
+        names_object = (
+            RoseNameIndex.objects.filter(
+                language_code=language, first_letter=letter, rose__publish=True
+            )
+            .select_related("rose")
+            .order_by("sort_key", "id")
+        )
+        paginator = KnownCountPaginator(names_object, 30, counts.get(letter, 0))
+        try:
+            names = paginator.page(page)
+        except PageNotAnInteger:
+            # If page is not an integer deliver only the first page
+            names = paginator.page(1)
+        except EmptyPage:
+            # if page is out of reange deliver the last page
+            names = paginator.page(paginator.num_pages)
+
+    context = {"letter": letter, "letters": letters, "names": names, "page": page}
+    return render(request, "roses/search/roses_alphabet.html", context)
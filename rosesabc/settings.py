@@ -245,6 +245,23 @@ PARLER_DEFAULT_LANGUAGE_CODE = "en"
 # REDIS_PORT = 6379
 # REDIS_DB = 0
 
+# cache shared by all workers, keeps cached totals and counts consistent
+# CACHES = {
+#     "default": {
+#         "BACKEND": "django.core.cache.backends.redis.RedisCache",
+#         "LOCATION": "redis://localhost:6379/1",
+#     }
+# }
+
+# store of the home page ranking, "roses.ranking.RedisRanking" uses the
+# Redis settings above
+ROSE_RANKING_BACKEND = "roses.ranking.LocalRanking"
+
+# store of the trending buckets, "roses.trending.RedisTrending" shares
+# them between workers and keeps them over restarts; the Redis backends
+# need the redis package from requirements.txt
+ROSE_TRENDING_BACKEND = "roses.trending.LocalTrending"
+
 
 # REST configuration
 REST_FRAMEWORK = {
@@ -256,3 +273,23 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 25,
     "ORDERING_PARAM": "ordering",
 }
+
+
+# source of the totals of paginated lists: "cached", "estimate" (planner
+# estimate on PostgreSQL) or "none"
+PAGINATION_COUNT_SOURCE = "cached"
+
+# seconds cached list totals are kept. Publishing clears them only in the
+# cache of the worker handling it, so with the default per-process cache
+# other workers may show an outdated total for this long; configure a
+# shared cache, e.g. CACHES above, to clear them everywhere at once
+PAGINATION_COUNT_TIMEOUT = 60
+
+# seconds rose page views are buffered before they are written to the
+# database, 0 writes them straight away
+VIEW_COUNTER_FLUSH_INTERVAL = 10
+
+# worker processes of the process_photos command resizing uploaded photos,
+# run it once beside the web server; 0 processes them in the saving
+# process once its transaction commits
+IMAGE_PROCESSING_WORKERS = 2